@@ -54,6 +54,56 @@ DEFAULT_CFG = {
     "locked_user_password_hash": 'locked',
     "gql_query_enable_viewing_masked_data_perms": ["900101"],
     "csrf_protect_login": True,
+    # local (per process) tier of the JWT signing keys cache, the shared tier is the Django cache
+    "jwt_signing_key_cache_size": 1024,
+    "jwt_signing_key_cache_ttl": 60,
+    "jwt_signing_key_shared_cache_ttl": 3600,
+    # verified tokens are cached until they expire, but never longer than this ttl (in seconds)
+    "jwt_verified_token_cache_size": 4096,
+    "jwt_verified_token_cache_ttl": 300,
+    # last_login is written in batches every N seconds (0 to write it synchronously)
+    "last_login_flush_interval": 10,
+    "last_login_max_pending": 1000,
+    "security_context_cache_ttl": 600,
+    # connection totalCount: planner estimate used above this number of rows ("estimate" strategy),
+    # exact counts cached for this number of seconds ("cached" strategy)
+    "gql_count_estimate_threshold": 100000,
+    "gql_count_cache_ttl": 30,
+    # users query served by the core_UserSearchIndex table, run the rebuildusersearchindex command before enabling it
+    "user_search_index_enabled": False,
+    # free text searches: auto (pg_trgm on PostgreSQL if installed, like otherwise), trigram, fulltext or like
+    "text_search_backend": "auto",
+    # cost of a GraphQL operation (rows x fields, see core.gql.query_cost) above which it is rejected ("reject" mode)
+    # or only logged ("log" mode), plain lists are counted as gql_query_cost_list_size rows
+    "gql_query_cost_budget": 50000,
+    "gql_query_cost_list_size": 10,
+    "gql_query_cost_mode": "reject",
+    # parsed and validated GraphQL documents kept per process, persisted queries ttl in seconds and maximum length of
+    # the documents persisted (registered by the authenticated users only)
+    "gql_document_cache_size": 1000,
+    "gql_persisted_query_ttl": 86400,
+    "gql_persisted_query_max_length": 100000,
+    # GraphQL fields profiling (core.gql.profiling): share of the requests profiled, request header forcing it on (1)
+    # or off (0) for the superusers, fields slower than the threshold (in ms, 0 to disable) are logged, number of
+    # operations kept
+    "gql_profiling_sample_rate": 0.0,
+    "gql_profiling_header": "X-OpenIMIS-Profile",
+    "gql_profiling_log_threshold_ms": 0,
+    "gql_profiling_max_operations": 200,
+    # number of mutations executed per transaction by OpenIMISMutation.mutate_batch
+    "mutation_batch_chunk_size": 100,
+    # processed mutations status kept in the cache for the mutation_status endpoint, which asks the clients to retry
+    # after retry_after seconds while the mutation isn't processed
+    "mutation_status_cache_ttl": 600,
+    "mutation_status_retry_after": 2,
+    # celery queues of the async mutations: {"module.ClassName" or "module": queue}, and of the batches of mutations
+    # (OpenIMISMutation.mutate_batch), so that long bulk mutations don't delay the interactive ones. None: default queue
+    "mutation_queues": {},
+    "mutation_batch_queue": None,
+    # threads running the non-blocking service signal receivers, per receiver timing (logged above the threshold)
+    "service_signal_workers": 4,
+    "service_signal_timing": False,
+    "service_signal_slow_threshold_ms": 100,
 }
 
 
@@ -102,6 +152,37 @@ class CoreConfig(AppConfig):
 
     csrf_protect_login = None
 
+    jwt_signing_key_cache_size = 1024
+    jwt_signing_key_cache_ttl = 60
+    jwt_signing_key_shared_cache_ttl = 3600
+    jwt_verified_token_cache_size = 4096
+    jwt_verified_token_cache_ttl = 300
+    last_login_flush_interval = 10
+    last_login_max_pending = 1000
+    security_context_cache_ttl = 600
+    gql_count_estimate_threshold = 100000
+    gql_count_cache_ttl = 30
+    user_search_index_enabled = False
+    text_search_backend = "auto"
+    gql_query_cost_budget = 50000
+    gql_query_cost_list_size = 10
+    gql_query_cost_mode = "reject"
+    gql_document_cache_size = 1000
+    gql_persisted_query_ttl = 86400
+    gql_persisted_query_max_length = 100000
+    gql_profiling_sample_rate = 0.0
+    gql_profiling_header = "X-OpenIMIS-Profile"
+    gql_profiling_log_threshold_ms = 0
+    gql_profiling_max_operations = 200
+    mutation_batch_chunk_size = 100
+    mutation_status_cache_ttl = 600
+    mutation_status_retry_after = 2
+    mutation_queues = {}
+    mutation_batch_queue = None
+    service_signal_workers = 4
+    service_signal_timing = False
+    service_signal_slow_threshold_ms = 100
+
     def _import_module(self, cfg, k):
         logger.info('import %s.%s' %
                     (cfg["%s_module" % k], cfg["%s_package" % k]))
@@ -127,6 +208,7 @@ class CoreConfig(AppConfig):
         # Quick fix, this config has to be rebuilt
         CoreConfig.username_code_length = int(cfg["username_code_length"])
         CoreConfig.username_changeable = cfg["username_changeable"]
+        CoreConfig.user_search_index_enabled = bool(cfg["user_search_index_enabled"])
 
     def _configure_majority(self, cfg):
         this.age_of_majority = int(cfg["age_of_majority"])
@@ -185,6 +267,37 @@ class CoreConfig(AppConfig):
     def _configure_additional_settings(self, cfg):
         CoreConfig.is_valid_health_facility_contract_required = cfg["is_valid_health_facility_contract_required"]
         CoreConfig.secondary_calendar = cfg["secondary_calendar"]
+        CoreConfig.text_search_backend = cfg["text_search_backend"]
+        CoreConfig.gql_query_cost_budget = int(cfg["gql_query_cost_budget"])
+        CoreConfig.gql_query_cost_list_size = int(cfg["gql_query_cost_list_size"])
+        CoreConfig.gql_query_cost_mode = cfg["gql_query_cost_mode"]
+        CoreConfig.gql_profiling_sample_rate = float(cfg["gql_profiling_sample_rate"])
+        CoreConfig.gql_profiling_header = cfg["gql_profiling_header"]
+        CoreConfig.gql_profiling_log_threshold_ms = int(cfg["gql_profiling_log_threshold_ms"])
+        CoreConfig.gql_profiling_max_operations = int(cfg["gql_profiling_max_operations"])
+        CoreConfig.mutation_batch_chunk_size = int(cfg["mutation_batch_chunk_size"])
+        CoreConfig.mutation_status_cache_ttl = int(cfg["mutation_status_cache_ttl"])
+        CoreConfig.mutation_status_retry_after = int(cfg["mutation_status_retry_after"])
+        CoreConfig.mutation_queues = cfg["mutation_queues"] or {}
+        CoreConfig.mutation_batch_queue = cfg["mutation_batch_queue"]
+        CoreConfig.service_signal_workers = int(cfg["service_signal_workers"])
+        CoreConfig.service_signal_timing = bool(cfg["service_signal_timing"])
+        CoreConfig.service_signal_slow_threshold_ms = int(cfg["service_signal_slow_threshold_ms"])
+
+    def _configure_caching(self, cfg):
+        CoreConfig.jwt_signing_key_cache_size = int(cfg["jwt_signing_key_cache_size"])
+        CoreConfig.jwt_signing_key_cache_ttl = int(cfg["jwt_signing_key_cache_ttl"])
+        CoreConfig.jwt_signing_key_shared_cache_ttl = int(cfg["jwt_signing_key_shared_cache_ttl"])
+        CoreConfig.jwt_verified_token_cache_size = int(cfg["jwt_verified_token_cache_size"])
+        CoreConfig.jwt_verified_token_cache_ttl = int(cfg["jwt_verified_token_cache_ttl"])
+        CoreConfig.last_login_flush_interval = int(cfg["last_login_flush_interval"])
+        CoreConfig.last_login_max_pending = int(cfg["last_login_max_pending"])
+        CoreConfig.security_context_cache_ttl = int(cfg["security_context_cache_ttl"])
+        CoreConfig.gql_count_estimate_threshold = int(cfg["gql_count_estimate_threshold"])
+        CoreConfig.gql_count_cache_ttl = int(cfg["gql_count_cache_ttl"])
+        CoreConfig.gql_document_cache_size = int(cfg["gql_document_cache_size"])
+        CoreConfig.gql_persisted_query_ttl = int(cfg["gql_persisted_query_ttl"])
+        CoreConfig.gql_persisted_query_max_length = int(cfg["gql_persisted_query_max_length"])
 
     def ready(self):
         from .models import ModuleConfiguration
@@ -197,6 +310,10 @@ class CoreConfig(AppConfig):
         self._configure_currency(cfg)
         self._configure_permissions(cfg)
         self._configure_additional_settings(cfg)
+        self._configure_caching(cfg)
+
+        # Cache invalidation receivers (officers, claim admins, interactive users)
+        from core import recievers  # noqa: F401
 
         CoreConfig.password_reset_template = cfg["password_reset_template"]
         CoreConfig.locked_user_password_hash = cfg["locked_user_password_hash"]
@@ -0,0 +1,33 @@
+"""
+Channels consumers, to be routed by the assembly ASGI application, e.g.:
+    websocket_urlpatterns = [path("ws/mutation_status/", MutationStatusConsumer.as_asgi())]
+"""
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+
+from core.mutation_status import user_group_name
+
+
+class MutationStatusConsumer(JsonWebsocketConsumer):
+    """
+    Sends to the authenticated user the status of their mutations when they are processed:
+    {"id": "<MutationLog id>", "client_mutation_id": "...", "status": 1|2, "error": "..."}
+    """
+
+    def connect(self):
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            self.close()
+            return
+        self.group_name = user_group_name(user.id)
+        async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
+        self.accept()
+
+    def disconnect(self, code):
+        if getattr(self, "group_name", None):
+            async_to_sync(self.channel_layer.group_discard)(self.group_name, self.channel_name)
+
+    def mutation_status(self, event):
+        # handler of the mutation_status.MESSAGE_TYPE messages
+        self.send_json(event["mutation"])
+
@@ -1,4 +1,4 @@
-from django.db.models import Lookup, JSONField
+from django.db.models import Lookup, JSONField, CharField, TextField
 from django.db.models.lookups import Contains
 from itertools import chain
 
@@ -55,6 +55,42 @@ class JsonContainsKey(Contains):
         return connection.operators['contains'] % rhs
 
 
+class TrigramContains(Lookup):
+    """
+    Case insensitive substring search written as a plain ILIKE on the column (icontains wraps the column in UPPER()),
+    so that PostgreSQL can use the pg_trgm GIN indexes. Used by core.text_search.
+    """
+    lookup_name = 'trgm_icontains'
+    pattern = '%%%s%%'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        return '%s ILIKE %%s' % lhs, [*lhs_params, self.pattern % connection.ops.prep_for_like_query(self.rhs)]
+
+
+class TrigramStartsWith(TrigramContains):
+    lookup_name = 'trgm_istartswith'
+    pattern = '%s%%'
+
+
+class FullTextContains(Lookup):
+    """
+    SQL Server full-text search (the column must be part of a full-text index): every word of the search must
+    be the beginning of a word of the column. Used by core.text_search.
+    """
+    lookup_name = 'ft_contains'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        terms = ' AND '.join('"%s*"' % word.replace('"', '') for word in str(self.rhs).split())
+        return 'CONTAINS(%s, %%s)' % lhs, [*lhs_params, terms or '""']
+
+
+for _text_field in (CharField, TextField):
+    _text_field.register_lookup(TrigramContains)
+    _text_field.register_lookup(TrigramStartsWith)
+    _text_field.register_lookup(FullTextContains)
+
 if settings.MSSQL:
     JSONField.register_lookup(JsonContains)
     JSONField.register_lookup(JsonContainsKey)
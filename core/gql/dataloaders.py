@@ -0,0 +1,112 @@
+"""
+Request-scoped DataLoaders for the per-row resolvers: the keys requested while resolving a page are collected and
+loaded with one query per field instead of one query per row.
+Loaders are kept on the request (info.context), their cache therefore never outlives the request.
+When the request is profiled (core.gql.profiling), the batches are reported under the path of the field that created
+the loader.
+"""
+from collections import defaultdict
+
+from django.apps import apps
+from django.db.models import F
+from graphql.type.definition import get_named_type
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from core import filter_validity
+from core.gql.profiling import field_path, profile_block
+
+
+def get_loader(info, loader_class, *args):
+    """
+    The instance of loader_class (built with info and args) attached to the current request
+    """
+    loaders = getattr(info.context, "dataloaders", None)
+    if loaders is None:
+        loaders = {}
+        setattr(info.context, "dataloaders", loaders)
+    key = (loader_class, args)
+    if key not in loaders:
+        loaders[key] = loader_class(info, *args)
+    return loaders[key]
+
+
+class RequestDataLoader(DataLoader):
+    def __init__(self, info, *args, **kwargs):
+        self.info = info
+        self.profile_path = "%s [%s]" % (field_path(info), type(self).__name__)
+        super().__init__(*args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        with profile_block(self.info.context, self.profile_path):
+            return Promise.resolve(self.load_batch(keys))
+
+    def load_batch(self, keys):
+        raise NotImplementedError()
+
+
+class HealthFacilityLoader(RequestDataLoader):
+    """
+    Health facilities by id. With restricted=True, only the ones visible to the user (HealthFacility.get_queryset)
+    """
+    def __init__(self, info, restricted=False):
+        self.restricted = restricted
+        super().__init__(info)
+
+    def load_batch(self, keys):
+        hf_model = apps.get_model("location", "HealthFacility")
+        queryset = hf_model.get_queryset(None, self.info) if self.restricted else hf_model.objects
+        health_facilities = queryset.in_bulk(keys)
+        return [health_facilities.get(key) for key in keys]
+
+
+class RolesByInteractiveUserLoader(RequestDataLoader):
+    """
+    Active roles by InteractiveUser id
+    """
+    def load_batch(self, keys):
+        from core.models import Role
+        roles = defaultdict(list)
+        queryset = Role.objects \
+            .filter(validity_to__isnull=True) \
+            .filter(user_roles__user_id__in=keys, user_roles__validity_to__isnull=True) \
+            .annotate(loader_user_id=F("user_roles__user_id"))
+        for role in queryset:
+            roles[role.loader_user_id].append(role)
+        return [roles[key] for key in keys]
+
+
+class UserDistrictsByInteractiveUserLoader(RequestDataLoader):
+    """
+    Valid UserDistrict by InteractiveUser id, filtered by the get_queryset of the GraphQL type of the field
+    """
+    def load_batch(self, keys):
+        from core.models import InteractiveUser
+        relation = InteractiveUser._meta.get_field("userdistrict")
+        user_field = relation.field
+        queryset = relation.related_model.objects \
+            .filter(*filter_validity(), **{"%s__in" % user_field.name: keys}) \
+            .select_related("location")
+        object_type = getattr(get_named_type(self.info.return_type), "graphene_type", None)
+        if object_type is not None and hasattr(object_type, "get_queryset"):
+            queryset = object_type.get_queryset(queryset, self.info)
+        districts = defaultdict(list)
+        for district in queryset:
+            districts[getattr(district, user_field.attname)].append(district)
+        return [districts[key] for key in keys]
+
+
+class PendingMutationByUserLoader(RequestDataLoader):
+    """
+    First pending (received, not processed yet) MutationLog by core User id
+    """
+    def load_batch(self, keys):
+        from core.models import MutationLog, UserMutation
+        mutations = {}
+        user_mutations = UserMutation.objects \
+            .filter(core_user_id__in=keys, mutation__status=MutationLog.RECEIVED) \
+            .select_related("mutation") \
+            .order_by("pk")
+        for user_mutation in user_mutations:
+            mutations.setdefault(user_mutation.core_user_id, user_mutation.mutation)
+        return [mutations.get(key) for key in keys]
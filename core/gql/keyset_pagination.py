@@ -0,0 +1,204 @@
+"""
+Keyset (seek) pagination for relay connections.
+
+Offset cursors make the database skip all the rows of the previous pages, so deep pages get slower and rows inserted
+or deleted in between shift the pages. Keyset cursors encode the values of the ordering columns of the last row seen
+(plus the primary key as tiebreaker) and the next page is selected with a WHERE on those values, which can use the
+indexes and costs the same whatever the page depth.
+NULL values are always sorted last so that the predicates stay well defined.
+The connections supporting it (keyset=True) keep the offset cursors by default, the clients opt in with the
+keysetPagination argument and the keyset cursors returned then select the next pages.
+The values that JSON can't represent (datetimes, dates, times, decimals, UUIDs, durations) are encoded without loss,
+as {"$type": ..., "value": ...}: a cursor truncated to the millisecond would skip or repeat rows on page boundaries.
+"""
+import base64
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+from django.db.models import F, Q
+from graphene.relay import PageInfo
+
+CURSOR_PREFIX = "keyset:"
+_VALUE_ALIAS = "keyset_value_%d"
+_TYPE_KEY = "$type"
+
+# (type tag, class, encoder, decoder), datetime before date as it's a subclass of it
+_TYPED_VALUES = (
+    ("datetime", datetime.datetime, datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    ("date", datetime.date, datetime.date.isoformat, datetime.date.fromisoformat),
+    ("time", datetime.time, datetime.time.isoformat, datetime.time.fromisoformat),
+    ("decimal", Decimal, str, Decimal),
+    ("uuid", uuid.UUID, str, uuid.UUID),
+    ("duration", datetime.timedelta,
+     lambda value: value // datetime.timedelta(microseconds=1),
+     lambda value: datetime.timedelta(microseconds=value)),
+)
+_DECODERS = {tag: decoder for tag, _, _, decoder in _TYPED_VALUES}
+
+
+def _encode_value(value):
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    for tag, value_class, encoder, _ in _TYPED_VALUES:
+        if isinstance(value, value_class):
+            return {_TYPE_KEY: tag, "value": encoder(value)}
+    raise TypeError("Unsupported keyset cursor value: %r" % (value,))
+
+
+def _decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    decoder = _DECODERS.get(value.get(_TYPE_KEY))
+    if decoder is None or "value" not in value:
+        raise ValueError("Invalid cursor value: %r" % (value,))
+    return decoder(value["value"])
+
+
+def encode_cursor(values):
+    return base64.b64encode(
+        (CURSOR_PREFIX + json.dumps([_encode_value(value) for value in values])).encode("utf-8")
+    ).decode("ascii")
+
+
+def is_keyset_cursor(cursor):
+    try:
+        return base64.b64decode(cursor).decode("utf-8").startswith(CURSOR_PREFIX)
+    except (TypeError, ValueError):
+        return False
+
+
+def decode_cursor(cursor):
+    """
+    Returns the values encoded in a keyset cursor, or None if cursor isn't a keyset cursor (an offset cursor)
+    """
+    try:
+        decoded = base64.b64decode(cursor).decode("utf-8")
+    except (TypeError, ValueError):
+        return None
+    if not decoded.startswith(CURSOR_PREFIX):
+        return None
+    values = json.loads(decoded[len(CURSOR_PREFIX):])
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor: %s" % cursor)
+    return [_decode_value(value) for value in values]
+
+
+def get_keyset_ordering(queryset):
+    """
+    The ordering of the queryset as a list of (field, descending), ending with the primary key.
+    None if it can't be used for keyset pagination (random or expression ordering)
+    """
+    if queryset.query.order_by:
+        order_by = queryset.query.order_by
+    elif queryset.query.default_ordering:
+        order_by = queryset.query.get_meta().ordering
+    else:
+        order_by = []
+    ordering = []
+    for order in order_by:
+        if not isinstance(order, str) or order == "?" or "." in order:
+            return None
+        descending = order.startswith("-")
+        ordering.append((order.lstrip("-+"), descending))
+    pk_names = {"pk", queryset.model._meta.pk.name, queryset.model._meta.pk.attname}
+    if not any(field in pk_names for field, _ in ordering):
+        ordering.append(("pk", False))
+    return ordering
+
+
+def _after_value(field, value, descending, forward):
+    # (field) comes after (value) in the iteration direction, NULLs being last in forward direction
+    if forward:
+        if value is None:
+            return None
+        return Q(**{"%s__%s" % (field, "lt" if descending else "gt"): value}) | Q(**{"%s__isnull" % field: True})
+    if value is None:
+        return Q(**{"%s__isnull" % field: False})
+    return Q(**{"%s__%s" % (field, "gt" if descending else "lt"): value})
+
+
+def _equal_value(field, value):
+    if value is None:
+        return Q(**{"%s__isnull" % field: True})
+    return Q(**{field: value})
+
+
+def keyset_filter(ordering, values, forward=True):
+    """
+    Expanded form of (cols) > (values), supporting mixed directions and NULLs:
+    c1 > v1 OR (c1 = v1 AND c2 > v2) OR ...
+    """
+    if len(values) != len(ordering):
+        raise ValueError("Invalid cursor for this ordering")
+    condition = Q(pk__in=[])
+    equals = Q()
+    for (field, descending), value in zip(ordering, values):
+        after = _after_value(field, value, descending, forward)
+        if after is not None:
+            condition |= equals & after
+        equals &= _equal_value(field, value)
+    return condition
+
+
+def keyset_connection(connection_type, args, queryset, max_limit=None):
+    """
+    Builds the connection of a page selected by keyset cursors (after/before), or returns None if the queryset
+    ordering or the cursors don't allow keyset pagination (the caller should then fall back to offset pagination).
+    """
+    ordering = get_keyset_ordering(queryset)
+    if ordering is None:
+        return None
+    after = decode_cursor(args["after"]) if args.get("after") else None
+    before = decode_cursor(args["before"]) if args.get("before") else None
+    if (args.get("after") and after is None) or (args.get("before") and before is None):
+        return None
+
+    queryset = queryset.annotate(**{_VALUE_ALIAS % i: F(field) for i, (field, _) in enumerate(ordering)})
+    queryset = queryset.order_by(*[
+        F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        for field, descending in ordering
+    ])
+    if after is not None:
+        queryset = queryset.filter(keyset_filter(ordering, after, forward=True))
+    if before is not None:
+        queryset = queryset.filter(keyset_filter(ordering, before, forward=False))
+
+    first = args.get("first")
+    last = args.get("last")
+    if first is None and last is None:
+        first = max_limit
+    if first is not None:
+        nodes = list(queryset[:first + 1])
+        has_next_page = len(nodes) > first
+        nodes = nodes[:first]
+        has_previous_page = after is not None
+        if last is not None and len(nodes) > last:
+            nodes = nodes[-last:]
+            has_previous_page = True
+    elif last is not None:
+        nodes = list(queryset.reverse()[:last + 1])
+        has_previous_page = len(nodes) > last
+        nodes = list(reversed(nodes[:last]))
+        has_next_page = before is not None
+    else:
+        nodes = list(queryset)
+        has_previous_page, has_next_page = after is not None, False
+
+    edges = [
+        connection_type.Edge(
+            node=node,
+            cursor=encode_cursor([getattr(node, _VALUE_ALIAS % i) for i in range(len(ordering))])
+        )
+        for node in nodes
+    ]
+    return connection_type(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page,
+        )
+    )
@@ -0,0 +1,88 @@
+"""
+Coercion plans of the mutation inputs (see OpenIMISMutation.coerce_mutation_data).
+
+The converter of each key of an Input class is compiled the first time the key is seen and kept in the plan of the
+class, so that coercing the data (possibly thousands of list items in bulk mutations) only does dict lookups instead
+of inspecting the Input class for every key of every item.
+A converter is called with the value and the coerce function to use for the nested inputs.
+"""
+from graphene import Field, List, NonNull
+from graphene.types.enum import EnumMeta
+from graphene.utils.subclass_with_meta import SubclassWithMeta_Meta
+
+
+class CoercionPlan(dict):
+    """
+    {key: converter} of an Input class, None for the keys that aren't attributes of the class
+    """
+
+    def __init__(self, input_class):
+        super().__init__()
+        self.input_class = input_class
+
+    def __missing__(self, key):
+        converter = self[key] = _compile_converter(self.input_class, key)
+        return converter
+
+
+_plans = {}
+
+
+def get_coercion_plan(input_class):
+    plan = _plans.get(input_class)
+    if plan is None:
+        plan = _plans[input_class] = CoercionPlan(input_class)
+    return plan
+
+
+def _compile_converter(input_class, key):
+    if not isinstance(key, str) or not hasattr(input_class, key):
+        return None
+    field = getattr(input_class, key)
+    if field.__class__ == List:
+        return _list_converter(field)
+    if field.__class__ == Field:
+        if isinstance(field.type, EnumMeta):
+            return _enum_converter(field.type)
+        if isinstance(field.type, NonNull) and isinstance(field.type._of_type, EnumMeta):
+            return _enum_converter(field.type._of_type)
+        nested_class = field._type
+        return lambda value, coerce: coerce(value, input_class=nested_class)
+    return _scalar_converter(field)
+
+
+def _scalar_converter(field):
+    def convert(value, coerce):
+        return field.parse_value(value) if isinstance(value, str) else value
+    return convert
+
+
+def _enum_converter(enum_type):
+    # enum names are converted to their values
+    values = {name: str(member.value) for name, member in enum_type._meta.enum.__members__.items()}
+
+    def convert(value, coerce):
+        return values.get(value, value)
+    return convert
+
+
+def _list_converter(field):
+    inner_type = field.of_type
+    is_enum = isinstance(inner_type, EnumMeta)
+    is_nested = not is_enum and inner_type.__class__ == SubclassWithMeta_Meta
+    scalar_converter = _scalar_converter(field)
+
+    def convert_item(item, coerce):
+        if is_enum:
+            return item
+        if isinstance(item, str):
+            return inner_type.parse_value(item)
+        if is_nested:
+            return coerce(item, input_class=inner_type)
+        return item
+
+    def convert(value, coerce):
+        if not isinstance(value, list):
+            return scalar_converter(value, coerce)
+        return [convert_item(item, coerce) for item in value]
+    return convert
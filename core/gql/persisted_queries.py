@@ -0,0 +1,198 @@
+"""
+Persisted queries and cache of the parsed and validated GraphQL documents.
+
+Parsing and validating a document against the merged openIMIS schema costs more than executing most queries, while
+the frontend only ever sends a few hundred different documents. PersistedQueryBackend keeps the validated documents
+in a bounded LRU (keyed by the sha256 of the document), so each of them is only parsed and validated once per process.
+
+OpenIMISGraphQLView also accepts the Apollo "automatic persisted queries" protocol: the client sends
+extensions={"persistedQuery": {"version": 1, "sha256Hash": "..."}} without the query. If the hash isn't registered,
+a PersistedQueryNotFound error is returned and the client sends the query again along with its hash, which registers
+it (in the Django cache, for gql_persisted_query_ttl seconds) for the next requests. Only the queries of the
+authenticated users, up to gql_persisted_query_max_length characters, are registered: the others are executed as usual.
+To enable, use core.gql.persisted_queries.OpenIMISGraphQLView instead of GraphQLView in the urls of the assembly.
+"""
+import hashlib
+import json
+from functools import partial
+
+from django.core.cache import cache
+from graphene_django.views import GraphQLView
+from graphql_jwt.utils import get_credentials
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.error import GraphQLError
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import validate
+
+from core.apps import CoreConfig
+from core.jwt_authentication import get_user_by_verified_token
+from core.utils import LRUCache
+
+PERSISTED_QUERY_VERSION = 1
+
+
+class PersistedQueryError(GraphQLError):
+    def __init__(self, message, code):
+        super().__init__(message, extensions={"code": code})
+
+
+def get_document_hash(document_string):
+    return hashlib.sha256(document_string.encode("utf-8")).hexdigest()
+
+
+def _persisted_query_cache_name(document_hash):
+    return f"gql_persisted_query_{document_hash}"
+
+
+_local_persisted_queries = None
+
+
+def _get_local_persisted_queries():
+    global _local_persisted_queries
+    if _local_persisted_queries is None:
+        _local_persisted_queries = LRUCache(maxsize=CoreConfig.gql_document_cache_size)
+    return _local_persisted_queries
+
+
+def register_persisted_query(document_string):
+    """
+    Registers a document, returns its hash
+    """
+    document_hash = get_document_hash(document_string)
+    cache.set(_persisted_query_cache_name(document_hash), document_string,
+              timeout=CoreConfig.gql_persisted_query_ttl)
+    _get_local_persisted_queries().set(document_hash, document_string)
+    return document_hash
+
+
+def get_persisted_query(document_hash):
+    """
+    The registered document with this hash, None if unknown
+    """
+    local_queries = _get_local_persisted_queries()
+    document_string = local_queries.get(document_hash)
+    if document_string is None:
+        document_string = cache.get(_persisted_query_cache_name(document_hash))
+        if document_string is not None:
+            local_queries.set(document_hash, document_string)
+    return document_string
+
+
+def _execute_invalid(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+class PersistedQueryBackend(GraphQLCoreBackend):
+    """
+    GraphQLCoreBackend keeping the parsed and validated documents in a bounded LRU.
+    Validation is done once, when the document enters the cache, and skipped by the executions.
+    """
+
+    def __init__(self, executor=None, cache_size=None):
+        super().__init__(executor=executor)
+        self.documents = LRUCache(maxsize=cache_size or CoreConfig.gql_document_cache_size)
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+        key = (id(schema), get_document_hash(document_string))
+        document = self.documents.get(key)
+        if document is None or document.schema is not schema:
+            document = self._build_document(schema, document_string)
+            self.documents.set(key, document)
+        return document
+
+    def _build_document(self, schema, document_string):
+        # syntax errors are raised (and not cached), as with GraphQLCoreBackend
+        document_ast = parse(document_string)
+        validation_errors = validate(schema, document_ast)
+        if validation_errors:
+            execute_document = partial(_execute_invalid, validation_errors)
+        else:
+            execute_document = partial(execute, schema, document_ast, **self.execute_params)
+        return GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=execute_document,
+        )
+
+
+_backend = None
+
+
+def get_persisted_query_backend():
+    global _backend
+    if _backend is None:
+        _backend = PersistedQueryBackend()
+    return _backend
+
+
+class OpenIMISGraphQLView(GraphQLView):
+    """
+    GraphQLView using the PersistedQueryBackend and accepting the automatic persisted queries
+    """
+
+    def get_backend(self, request):
+        # an explicitly configured backend is kept, the default one (a plain GraphQLCoreBackend) is replaced
+        if type(self.backend) is GraphQLCoreBackend:
+            return get_persisted_query_backend()
+        return self.backend
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        try:
+            query = self.resolve_persisted_query(request, data, query)
+        except PersistedQueryError as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+    @staticmethod
+    def get_persisted_query_extension(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise PersistedQueryError("Extensions are invalid JSON.", "BAD_REQUEST")
+        if not isinstance(extensions, dict):
+            return None
+        return extensions.get("persistedQuery")
+
+    @staticmethod
+    def can_register_persisted_query(request, query):
+        if len(query) > CoreConfig.gql_persisted_query_max_length:
+            return False
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return True
+        # the JWT is only checked by the GraphQL middleware, after the query is resolved
+        token = get_credentials(request)
+        if not token:
+            return False
+        try:
+            return get_user_by_verified_token(token) is not None
+        except Exception:
+            return False
+
+    @classmethod
+    def resolve_persisted_query(cls, request, data, query):
+        persisted_query = cls.get_persisted_query_extension(request, data)
+        if not persisted_query:
+            return query
+        if persisted_query.get("version") != PERSISTED_QUERY_VERSION:
+            raise PersistedQueryError("Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED")
+        document_hash = persisted_query.get("sha256Hash")
+        if not document_hash:
+            raise PersistedQueryError("Missing persisted query hash", "BAD_REQUEST")
+        if query:
+            if get_document_hash(query) != document_hash:
+                raise PersistedQueryError("Provided sha does not match query", "BAD_REQUEST")
+            if get_persisted_query(document_hash) is None and cls.can_register_persisted_query(request, query):
+                register_persisted_query(query)
+            return query
+        query = get_persisted_query(document_hash)
+        if query is None:
+            raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+        return query
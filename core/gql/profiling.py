@@ -0,0 +1,267 @@
+"""
+Per-field profiling of the GraphQL operations: wall time, number of SQL queries and SQL time of each resolved field,
+aggregated per operation and field (ParentType.field, whatever the alias, so that N+1 patterns show up as a high
+number of calls on the same field) in histograms kept by each process. At most gql_profiling_max_operations
+operations are kept, the least recently profiled ones are dropped beyond.
+
+Requests are sampled with gql_profiling_sample_rate, the gql_profiling_header request header forces profiling on
+("1") or off ("0") for a request of a superuser. The aggregates are exported by the graphql_profile view (JSON, or
+Prometheus text format with ?format=prometheus), fields slower than gql_profiling_log_threshold_ms are also logged.
+Fields resolved with a Promise (DataLoaders) are timed until the Promise is resolved, the queries of the DataLoader
+batches are reported under the field that created the loader, followed by the loader name.
+To enable, add to the Django settings: GRAPHENE["MIDDLEWARE"] += ["core.gql.profiling.ProfilingMiddleware"]
+"""
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from promise import Promise, is_thenable
+
+from core.apps import CoreConfig
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets, in milliseconds
+BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+# operation names are chosen by the clients
+MAX_OPERATION_NAME_LENGTH = 100
+
+_CONTEXT_ATTRIBUTE = "gql_profiling"
+_NOT_PROFILED = object()
+
+
+class _QueryCounter:
+    """
+    Database execute wrapper counting the queries run while a resolver is called
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class FieldStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.duration = 0.0
+        self.sql_count = 0
+        self.sql_duration = 0.0
+        self.histogram = [0] * len(BUCKETS)
+
+    def add(self, duration, sql_count, sql_duration, error=False):
+        self.calls += 1
+        self.errors += 1 if error else 0
+        self.duration += duration
+        self.sql_count += sql_count
+        self.sql_duration += sql_duration
+        milliseconds = duration * 1000
+        for i, bound in enumerate(BUCKETS):
+            if milliseconds <= bound:
+                self.histogram[i] += 1
+                break
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "duration_ms": round(self.duration * 1000, 3),
+            "sql_count": self.sql_count,
+            "sql_duration_ms": round(self.sql_duration * 1000, 3),
+            "histogram_ms": {str(bound): count for bound, count in zip(BUCKETS, self.histogram)},
+        }
+
+
+class GraphQLProfiler:
+    """
+    Aggregates of the profiled operations: {operation name: {"requests": n, "fields": {field: FieldStats}}}, the
+    least recently profiled operations dropped beyond gql_profiling_max_operations
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = OrderedDict()
+
+    def add_request(self, operation):
+        with self._lock:
+            self._get_operation(operation)["requests"] += 1
+
+    def add_field(self, operation, path, duration, sql_count, sql_duration, error=False):
+        with self._lock:
+            fields = self._get_operation(operation)["fields"]
+            stats = fields.get(path)
+            if stats is None:
+                stats = fields[path] = FieldStats()
+            stats.add(duration, sql_count, sql_duration, error)
+
+    def _get_operation(self, operation):
+        aggregate = self._operations.get(operation)
+        if aggregate is None:
+            aggregate = self._operations[operation] = {"requests": 0, "fields": {}}
+            while len(self._operations) > max(CoreConfig.gql_profiling_max_operations, 1):
+                self._operations.popitem(last=False)
+        else:
+            self._operations.move_to_end(operation)
+        return aggregate
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: {
+                    "requests": aggregate["requests"],
+                    "fields": {path: stats.to_dict() for path, stats in aggregate["fields"].items()},
+                }
+                for operation, aggregate in self._operations.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE openimis_graphql_requests_total counter",
+            "# TYPE openimis_graphql_field_duration_ms histogram",
+            "# TYPE openimis_graphql_field_sql_queries_total counter",
+            "# TYPE openimis_graphql_field_sql_duration_ms_total counter",
+        ]
+        for operation, aggregate in snapshot.items():
+            op_label = _label(operation)
+            lines.append('openimis_graphql_requests_total{operation="%s"} %s' % (op_label, aggregate["requests"]))
+            for path, stats in aggregate["fields"].items():
+                labels = 'operation="%s",field="%s"' % (op_label, _label(path))
+                cumulative = 0
+                for bound, count in stats["histogram_ms"].items():
+                    cumulative += count
+                    le = "+Inf" if bound == "inf" else bound
+                    lines.append('openimis_graphql_field_duration_ms_bucket{%s,le="%s"} %s'
+                                 % (labels, le, cumulative))
+                lines.append("openimis_graphql_field_duration_ms_sum{%s} %s" % (labels, stats["duration_ms"]))
+                lines.append("openimis_graphql_field_duration_ms_count{%s} %s" % (labels, stats["calls"]))
+                lines.append("openimis_graphql_field_sql_queries_total{%s} %s" % (labels, stats["sql_count"]))
+                lines.append("openimis_graphql_field_sql_duration_ms_total{%s} %s" % (labels, stats["sql_duration_ms"]))
+        return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+profiler = GraphQLProfiler()
+
+
+def _is_profiled(request):
+    header = CoreConfig.gql_profiling_header
+    user = getattr(request, "user", None)
+    # only the superusers, who can read the aggregates, may force the profiling
+    if header and user is not None and user.is_authenticated and user.is_superuser:
+        forced = request.META.get("HTTP_" + header.upper().replace("-", "_")) if hasattr(request, "META") else None
+        if forced in ("0", "1"):
+            return forced == "1"
+    return CoreConfig.gql_profiling_sample_rate > 0 and random.random() < CoreConfig.gql_profiling_sample_rate
+
+
+def _operation_name(info):
+    if info.operation.name:
+        name = info.operation.name.value
+    else:
+        # anonymous operations are named after their root fields
+        name = "%s %s" % (info.operation.operation, ",".join(
+            selection.name.value for selection in info.operation.selection_set.selections
+            if getattr(selection, "name", None)))
+    return name[:MAX_OPERATION_NAME_LENGTH]
+
+
+def field_path(info):
+    """
+    The field resolved, as ParentType.field: the schema bounds the number of distinct values, unlike the aliases
+    """
+    return "%s.%s" % (info.parent_type.name, info.field_name)
+
+
+@contextmanager
+def _count_queries(counter):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield
+
+
+def _record(operation, path, start, counter, error):
+    duration = time.perf_counter() - start
+    profiler.add_field(operation, path, duration, counter.count, counter.duration, error)
+    threshold = CoreConfig.gql_profiling_log_threshold_ms
+    if threshold and duration * 1000 > threshold:
+        logger.warning("Slow GraphQL field %s in %s: %.1fms, %s SQL queries (%.1fms)",
+                       path, operation, duration * 1000, counter.count, counter.duration * 1000)
+
+
+@contextmanager
+def profile_block(context, path):
+    """
+    Profiles, under path, a block run outside of the resolvers (e.g. a DataLoader batch) if the request is profiled
+    """
+    operation = getattr(context, _CONTEXT_ATTRIBUTE, None)
+    if operation is None or operation is _NOT_PROFILED:
+        yield
+        return
+    counter = _QueryCounter()
+    start = time.perf_counter()
+    error = False
+    try:
+        with _count_queries(counter):
+            yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        _record(operation, path, start, counter, error)
+
+
+class ProfilingMiddleware:
+    def resolve(self, next, root, info, **args):
+        operation = getattr(info.context, _CONTEXT_ATTRIBUTE, None)
+        if operation is None:
+            operation = _operation_name(info) if _is_profiled(info.context) else _NOT_PROFILED
+            setattr(info.context, _CONTEXT_ATTRIBUTE, operation)
+            if operation is not _NOT_PROFILED:
+                profiler.add_request(operation)
+        if operation is _NOT_PROFILED:
+            return next(root, info, **args)
+
+        path = field_path(info)
+        counter = _QueryCounter()
+        start = time.perf_counter()
+        try:
+            with _count_queries(counter):
+                result = next(root, info, **args)
+        except Exception:
+            _record(operation, path, start, counter, True)
+            raise
+        if not is_thenable(result):
+            _record(operation, path, start, counter, False)
+            return result
+
+        # timed until resolved, the queries of the DataLoader batch are counted by profile_block
+        def resolved(value):
+            _record(operation, path, start, counter, False)
+            return value
+
+        def rejected(exc):
+            _record(operation, path, start, counter, True)
+            raise exc
+
+        return Promise.resolve(result).then(resolved, rejected)
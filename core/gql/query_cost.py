@@ -0,0 +1,130 @@
+"""
+Cost analysis of the GraphQL operations, done once per operation before its first field is resolved.
+
+The cost of a field is its weight plus, for the fields returning objects, the cost of its selection multiplied by
+the number of rows it may return: first/last (or RELAY_CONNECTION_MAX_LIMIT) for connections, and
+gql_query_cost_list_size for plain lists. Scalars weigh 0 and object fields 1, unless the graphene type declares
+other weights (per row of that type), with the snake_case field names:
+```
+class UserGQLType(DjangoObjectType):
+    cost_weights = {"health_facility": 2}
+```
+Operations above gql_query_cost_budget are rejected (or only logged if gql_query_cost_mode is "log").
+To enable, add to the Django settings: GRAPHENE["MIDDLEWARE"] += ["core.gql.query_cost.QueryCostMiddleware"]
+"""
+import logging
+
+from graphene.relay import Connection
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.settings import graphene_settings
+from graphql.error import GraphQLError
+from graphql.language import ast as gql_ast
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type, is_composite_type
+
+from core.apps import CoreConfig
+
+logger = logging.getLogger(__name__)
+
+_CONTEXT_ATTRIBUTE = "query_costs"
+
+
+class QueryCostExceeded(GraphQLError):
+    pass
+
+
+class QueryCostMiddleware:
+    def resolve(self, next, root, info, **args):
+        if root is None:
+            self.check(info)
+        return next(root, info, **args)
+
+    @staticmethod
+    def check(info):
+        costs = getattr(info.context, _CONTEXT_ATTRIBUTE, None)
+        if costs is None:
+            costs = {}
+            setattr(info.context, _CONTEXT_ATTRIBUTE, costs)
+        key = id(info.operation)
+        if key not in costs:
+            costs[key] = estimate_query_cost(info)
+            if costs[key] > CoreConfig.gql_query_cost_budget:
+                operation_name = info.operation.name.value if info.operation.name else None
+                logger.warning("GraphQL operation %s cost %s exceeds the budget of %s",
+                               operation_name, costs[key], CoreConfig.gql_query_cost_budget)
+        if costs[key] > CoreConfig.gql_query_cost_budget and CoreConfig.gql_query_cost_mode != "log":
+            raise QueryCostExceeded(
+                "Query too expensive: cost %s exceeds the budget of %s, request less rows or fields"
+                % (costs[key], CoreConfig.gql_query_cost_budget))
+
+
+def estimate_query_cost(info):
+    return _selection_set_cost(info, info.operation.selection_set, info.parent_type, set())
+
+
+def _selection_set_cost(info, selection_set, parent_type, visited_fragments, in_connection=False):
+    cost = 0
+    for selection in selection_set.selections if selection_set else []:
+        if isinstance(selection, gql_ast.Field):
+            cost += _field_cost(info, selection, parent_type, visited_fragments, in_connection)
+        elif isinstance(selection, gql_ast.FragmentSpread):
+            name = selection.name.value
+            fragment = info.fragments.get(name)
+            if fragment is None or name in visited_fragments:
+                continue
+            cost += _selection_set_cost(info, fragment.selection_set,
+                                        info.schema.get_type(fragment.type_condition.name.value) or parent_type,
+                                        visited_fragments | {name}, in_connection)
+        elif isinstance(selection, gql_ast.InlineFragment):
+            fragment_type = info.schema.get_type(selection.type_condition.name.value) \
+                if selection.type_condition else parent_type
+            cost += _selection_set_cost(info, selection.selection_set, fragment_type or parent_type,
+                                        visited_fragments, in_connection)
+    return cost
+
+
+def _field_cost(info, field_ast, parent_type, visited_fragments, in_connection):
+    name = field_ast.name.value
+    fields = getattr(parent_type, "fields", None) or {}
+    field = fields.get(name)
+    if field is None:
+        # introspection (__typename...) or unknown field, left to the validation
+        return 0
+    field_type = field.type.of_type if isinstance(field.type, GraphQLNonNull) else field.type
+    named_type = get_named_type(field_type)
+    if not is_composite_type(named_type):
+        return _weight(parent_type, name, 0)
+
+    graphene_type = getattr(named_type, "graphene_type", None)
+    is_connection = isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+    if is_connection:
+        rows = _argument(info, field_ast, "first") or _argument(info, field_ast, "last") \
+            or graphene_settings.RELAY_CONNECTION_MAX_LIMIT or CoreConfig.gql_query_cost_list_size
+    elif isinstance(field_type, GraphQLList) and not in_connection:
+        rows = CoreConfig.gql_query_cost_list_size
+    else:
+        rows = 1
+    children = _selection_set_cost(info, field_ast.selection_set, named_type, visited_fragments,
+                                   in_connection=is_connection)
+    return _weight(parent_type, name, 1) + rows * children
+
+
+def _weight(parent_type, field_name, default):
+    weights = getattr(getattr(parent_type, "graphene_type", None), "cost_weights", None)
+    if not weights:
+        return default
+    return weights.get(to_snake_case(field_name), weights.get(field_name, default))
+
+
+def _argument(info, field_ast, name):
+    for argument in field_ast.arguments or []:
+        if argument.name.value != name:
+            continue
+        value = argument.value
+        if isinstance(value, gql_ast.Variable):
+            value = (info.variable_values or {}).get(value.name.value)
+        elif isinstance(value, gql_ast.IntValue):
+            value = int(value.value)
+        else:
+            value = None
+        return value if isinstance(value, int) and value > 0 else None
+    return None
@@ -3,11 +3,13 @@ import location.gql_queries
 from core import ExtendedConnection, filter_validity
 from core.models import Officer, Role, RoleRight, UserRole, User, InteractiveUser, UserMutation, Language
 from graphene_django import DjangoObjectType
-from location.models import HealthFacility
 from core.apps import CoreConfig
 from django.utils.translation import gettext as _
 from django.core.exceptions import PermissionDenied
+from graphql.type.definition import GraphQLList, get_nullable_type
 
+from .gql.dataloaders import get_loader, HealthFacilityLoader, RolesByInteractiveUserLoader, \
+    UserDistrictsByInteractiveUserLoader, PendingMutationByUserLoader
 from .utils import prefix_filterset
 
 
@@ -97,6 +99,8 @@ class InteractiveUserGQLType(DjangoObjectType):
         description="Health Facility is not a foreign key in the database, this field resolves it manually, use only "
                     "if necessary.")
     roles = graphene.List(RoleGQLType, description="Same as userRoles but a straight list, without the M-N relation")
+    # see core.gql.query_cost, the related fields are loaded in batches but still cost more than a column
+    cost_weights = {"health_facility": 2, "roles": 2, "userdistrict_set": 2}
 
     class Meta:
         model = InteractiveUser
@@ -119,27 +123,22 @@ class InteractiveUserGQLType(DjangoObjectType):
         if not info.context.user.has_perms(CoreConfig.gql_query_users_perms):
             raise PermissionDenied(_("unauthorized"))
         if self.health_facility_id:
-            return HealthFacility.get_queryset(None, info).filter(pk=self.health_facility_id).first()
+            return get_loader(info, HealthFacilityLoader, True).load(self.health_facility_id)
         else:
             return None
 
     def resolve_roles(self, info, **kwargs):
         if not info.context.user.is_authenticated:
             raise PermissionDenied(_("unauthorized"))
-        if self.user_roles:
-            return Role.objects \
-                .filter(validity_to__isnull=True) \
-                .filter(user_roles__user_id=self.id, user_roles__validity_to__isnull=True)
-        else:
-            return None
+        return get_loader(info, RolesByInteractiveUserLoader).load(self.id)
 
     def resolve_userdistrict_set(self, info, **kwargs):
         if not info.context.user.is_authenticated:
             raise PermissionDenied(_("unauthorized"))
-        if self.userdistrict_set:
-            return self.userdistrict_set.filter(*filter_validity())
-        else:
-            return None
+        if isinstance(get_nullable_type(info.return_type), GraphQLList):
+            return get_loader(info, UserDistrictsByInteractiveUserLoader).load(self.id)
+        # connection fields need a queryset to filter and paginate
+        return self.userdistrict_set.filter(*filter_validity())
 
     @classmethod
     def get_queryset(cls, queryset, info):
@@ -159,6 +158,8 @@ class UserGQLType(DjangoObjectType):
     last_name = graphene.String()
     email = graphene.String()
     phone = graphene.String()
+    # see core.gql.query_cost, rights are computed per user from the roles
+    cost_weights = {"health_facility": 2, "client_mutation_id": 2, "rights": 5}
 
     class Meta:
         model = User
@@ -178,8 +179,16 @@ class UserGQLType(DjangoObjectType):
     def resolve_client_mutation_id(self, info):
         if not info.context.user.has_perms(CoreConfig.gql_query_users_perms):
             raise PermissionDenied(_("unauthorized"))
-        user_mutation = self.mutations.select_related('mutation').filter(mutation__status=0).first()
-        return user_mutation.mutation.client_mutation_id if user_mutation else None
+        return get_loader(info, PendingMutationByUserLoader).load(self.id).then(
+            lambda mutation: mutation.client_mutation_id if mutation else None
+        )
+
+    def resolve_health_facility(self, info):
+        # same facility as User.get_health_facility (claim administrator first), batched by the loader
+        health_facility_id = self.get_health_facility_id()
+        if health_facility_id:
+            return get_loader(info, HealthFacilityLoader).load(health_facility_id)
+        return None
 
 
 class PermissionOpenImisGQLType(graphene.ObjectType):
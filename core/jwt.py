@@ -4,21 +4,31 @@ import jwt
 from graphql_jwt.settings import jwt_settings
 from graphql_jwt.signals import token_issued
 from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from django.dispatch import receiver
 import logging
 import uuid
 from datetime import datetime
 
+from core.apps import CoreConfig
+from core.utils import LRUCache
+
 logger = logging.getLogger(__file__)
 
+# Cached for the existing users without a personal key (technical users...), so that they don't hit the database
+# either. Nothing is cached for the unknown usernames, which come from not yet verified tokens.
+_NO_USER_KEY = ""
+_local_signing_keys = None
+
 
 @receiver(token_issued)
 def on_token_issued(sender, request, user, **kwargs):
-    # Store the date on which the user got the auth token
+    # Store the date on which the user got the auth token, the write itself is batched by the recorder
+    from core.last_login import last_login_recorder
     user.last_login = timezone.now()
-    user.save()
-    pass
+    last_login_recorder.record(user, user.last_login)
 
 
 def jwt_encode_user_key(payload, context=None):
@@ -37,32 +47,34 @@ def jwt_encode_user_key(payload, context=None):
 
 
 def jwt_decode_user_key(token, context=None):
-    # First decode the token without validating it, so we can extract the username
+    # Only read the username here, the signature and the claims are verified once, with the user key
     not_validated = jwt.decode(
         token,
-        get_jwt_key(encode=False, context=context),
         options={
-            'verify_exp': jwt_settings.JWT_VERIFY_EXPIRATION,
-            'verify_aud': jwt_settings.JWT_AUDIENCE is not None,
             'verify_signature': False,
+            'verify_exp': False,
+            'verify_nbf': False,
+            'verify_iat': False,
+            'verify_aud': False,
+            'verify_iss': False,
         },
-        leeway=jwt_settings.JWT_LEEWAY,
-        audience=jwt_settings.JWT_AUDIENCE,
-        issuer=jwt_settings.JWT_ISSUER,
         algorithms=[jwt_settings.JWT_ALGORITHM],
     )
-    if not_validated and not_validated.get("username"):
-        user_class = apps.get_model("core", "User")
-        db_user = user_class.objects \
-            .filter(username=not_validated.get("username")) \
-            .only("i_user__private_key") \
-            .first()
-        if db_user and db_user.private_key:
-            key = db_user.private_key
-        else:
-            key = get_jwt_key(encode=False)
-    else:
-        key = get_jwt_key(encode=False)
+    username = not_validated.get("username") if not_validated else None
+    user_key = get_user_signing_key(username) if username else None
+    try:
+        return _verify_token(token, user_key or get_jwt_key(encode=False))
+    except jwt.InvalidSignatureError:
+        if not username:
+            raise
+        # The key might have been rotated and not yet invalidated (concurrent commit)
+        fresh_key = get_user_signing_key(username, fresh=True)
+        if fresh_key == user_key:
+            raise
+        return _verify_token(token, fresh_key or get_jwt_key(encode=False))
+
+
+def _verify_token(token, key):
     return jwt.decode(
         token,
         key,
@@ -78,6 +90,88 @@ def jwt_decode_user_key(token, context=None):
     )
 
 
+def _get_local_signing_keys():
+    global _local_signing_keys
+    if _local_signing_keys is None:
+        _local_signing_keys = LRUCache(
+            maxsize=CoreConfig.jwt_signing_key_cache_size,
+            ttl=CoreConfig.jwt_signing_key_cache_ttl,
+        )
+    return _local_signing_keys
+
+
+def _signing_key_cache_name(username):
+    return f"jwt_key_{username}"
+
+
+def _signing_key_generation_cache_name(username):
+    return f"jwt_key_gen_{username}"
+
+
+def _signing_key_generation_timeout():
+    # Outlives the keys it guards: once expired, a new generation discards the keys cached locally before
+    return max(CoreConfig.jwt_signing_key_shared_cache_ttl, CoreConfig.jwt_signing_key_cache_ttl)
+
+
+def _start_signing_key_generation(username):
+    # Evicted, expired or never set: start a new generation, only for an existing user
+    cache_name = _signing_key_generation_cache_name(username)
+    cache.add(cache_name, uuid.uuid4().hex, timeout=_signing_key_generation_timeout())
+    return cache.get(cache_name)
+
+
+def get_user_signing_key(username, fresh=False):
+    """
+    Retrieves the personal signing key (the InteractiveUser private key) of a user, None if the user has none.
+    The key is looked up in a bounded in-process LRU first (valid as long as the key generation of the user in the
+    shared cache is unchanged), then in the shared cache and only then in the database.
+    :param username: username of the core User
+    :param fresh: set to True to read the key from the database (e.g. when the cached key looks outdated)
+    """
+    local_keys = _get_local_signing_keys()
+    # read before the key, so that a key rotated meanwhile is not cached locally under the new generation
+    generation = cache.get(_signing_key_generation_cache_name(username))
+    cache_name = _signing_key_cache_name(username)
+    key = None
+    if not fresh:
+        entry = local_keys.get(username)
+        if generation is not None and entry is not None and entry[1] == generation:
+            return entry[0] or None
+        key = cache.get(cache_name)
+    if key is None:
+        user_class = apps.get_model("core", "User")
+        row = user_class.objects \
+            .filter(username=username) \
+            .values_list("id", "i_user__private_key") \
+            .first()
+        if row is None:
+            return None
+        key = row[1] or _NO_USER_KEY
+        cache.set(cache_name, key, timeout=CoreConfig.jwt_signing_key_shared_cache_ttl)
+    if generation is None:
+        # kept locally from the next call, once the generation is known
+        _start_signing_key_generation(username)
+    else:
+        local_keys.set(username, (key, generation))
+    return key or None
+
+
+def invalidate_user_signing_key(username):
+    """
+    To be called whenever the private key of a user changes (password change), tokens signed with the previous key
+    are then rejected. The key is dropped from the shared cache and its generation bumped (which discards the copies
+    of all the processes) once the current transaction is committed, so that the previous key can't be cached again
+    from the not yet committed state.
+    """
+    def invalidate():
+        cache.delete(_signing_key_cache_name(username))
+        cache.set(_signing_key_generation_cache_name(username), uuid.uuid4().hex,
+                  timeout=_signing_key_generation_timeout())
+        _get_local_signing_keys().delete(username)
+
+    transaction.on_commit(invalidate)
+
+
 def get_jwt_key(encode=True, context=None, payload=None):
     user_key = extract_private_key_from_context(context)
     if user_key is None and payload is not None:
@@ -93,10 +187,8 @@ def get_jwt_key(encode=True, context=None, payload=None):
 
 def extract_private_key_from_payload(payload):
     # Get user private key from payload. This covers the refresh token mutation
-    from core.models import User
-
     if "username" in payload:
-        return User.objects.get(username=payload["username"]).private_key
+        return get_user_signing_key(payload["username"])
 
 
 def extract_private_key_from_context(context):
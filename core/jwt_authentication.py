@@ -5,17 +5,163 @@ from rest_framework.exceptions import Throttled
 from rest_framework import exceptions
 from graphql_jwt.utils import get_credentials
 from graphql_jwt.exceptions import JSONWebTokenError
-from graphql_jwt.shortcuts import get_user_by_token
+from graphql_jwt.utils import get_payload, get_user_by_payload
 from core.apps import CoreConfig
+from core.ratelimit import is_request_ratelimited
+from core.utils import LRUCache
+from django.apps import apps
 from django.conf import settings
-from django_ratelimit.core import is_ratelimited
+from django.core.cache import cache
+from django.db import transaction
 
 from datetime import date
+import hashlib
 import jwt
 import logging
+import time
+import uuid
 
 logger = logging.getLogger(__file__)
 
+_local_verified_tokens = None
+
+
+def _get_local_verified_tokens():
+    global _local_verified_tokens
+    if _local_verified_tokens is None:
+        _local_verified_tokens = LRUCache(maxsize=CoreConfig.jwt_verified_token_cache_size)
+    return _local_verified_tokens
+
+
+def _verified_token_cache_name(token):
+    return "jwt_verified_" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _token_generation_cache_name(username):
+    return f"jwt_token_gen_{username}"
+
+
+def _token_generation_timeout():
+    # Outlives the verifications it guards: once expired, a new generation discards the entries cached before
+    return CoreConfig.jwt_verified_token_cache_ttl
+
+
+def _get_token_generation(username):
+    # Only called once the token is verified and its user loaded, never for a made-up username
+    cache_name = _token_generation_cache_name(username)
+    generation = cache.get(cache_name)
+    if generation is None:
+        # Evicted, expired or never set: start a new generation, which also discards any entry cached before
+        cache.add(cache_name, uuid.uuid4().hex, timeout=_token_generation_timeout())
+        generation = cache.get(cache_name)
+    return generation
+
+
+def revoke_verified_tokens(username):
+    """
+    Discards all the cached token verifications of a user (refresh tokens cleared, password changed...).
+    The tokens themselves stay valid until they expire, they are simply fully verified again on their next use.
+    """
+    cache.set(_token_generation_cache_name(username), uuid.uuid4().hex, timeout=_token_generation_timeout())
+
+
+def revoke_verified_tokens_on_commit(username):
+    """
+    Same as revoke_verified_tokens, once the current transaction is committed (user deactivated or deleted...)
+    """
+    transaction.on_commit(lambda: revoke_verified_tokens(username))
+
+
+def get_user_by_verified_token(token):
+    """
+    Same as graphql_jwt.shortcuts.get_user_by_token but the signature check is only done once per token: the
+    verified identity (user id, username and payload, never a model instance) is kept in process and in the shared
+    cache until the token expires or is revoked. The user itself is loaded, and its is_active checked, on every call.
+    """
+    cache_name = _verified_token_cache_name(token)
+    local_tokens = _get_local_verified_tokens()
+    entry = local_tokens.get(cache_name)
+    is_local = entry is not None
+    if entry is None:
+        entry = cache.get(cache_name)
+    if entry is not None and entry["generation"] != cache.get(_token_generation_cache_name(entry["username"])):
+        local_tokens.delete(cache_name)
+        entry = None
+
+    if entry is not None:
+        user = apps.get_model("core", "User").objects.filter(id=entry["user_id"]).first()
+        if user is None:
+            local_tokens.delete(cache_name)
+            cache.delete(cache_name)
+            return None
+        if not user.is_active:
+            raise JSONWebTokenError("User is disabled")
+        if not is_local:
+            _set_local_verified_token(cache_name, entry)
+        return user
+
+    payload = get_payload(token)
+    user = get_user_by_payload(payload)
+    if user is None:
+        return None
+    entry = {
+        "user_id": str(user.id),
+        "username": user.username,
+        "payload": payload,
+        "generation": _get_token_generation(user.username),
+    }
+    timeout = _verified_token_timeout(entry)
+    if timeout > 0:
+        cache.set(cache_name, entry, timeout=timeout)
+        _get_local_verified_tokens().set(cache_name, entry, ttl=timeout)
+    return user
+
+
+def _verified_token_timeout(entry):
+    timeout = CoreConfig.jwt_verified_token_cache_ttl
+    if entry["payload"].get("exp"):
+        timeout = min(timeout, int(entry["payload"]["exp"] - time.time()))
+    return timeout
+
+
+def _set_local_verified_token(cache_name, entry):
+    timeout = _verified_token_timeout(entry)
+    if timeout > 0:
+        _get_local_verified_tokens().set(cache_name, entry, ttl=timeout)
+
+
+HEALTH_FACILITY_CONTRACT_CACHE_TTL = 24 * 60 * 60
+
+
+def health_facility_contract_cache_name(health_facility_id):
+    return f"hf_contract_end_{health_facility_id}"
+
+
+def is_health_facility_contract_valid(user):
+    """
+    Checks that the health facility of the user (User.get_health_facility: claim administrator first) has a running
+    contract. The contract end date is shared by all the workers through the cache, per facility, and compared to the
+    current date on each check. Saving the facility drops its entry.
+    """
+    # the security context holds the same facility, already loaded
+    health_facility_id = user.security_context.health_facility_id if user.i_user_id \
+        else user.get_health_facility_id()
+    if not health_facility_id:
+        return False
+
+    cache_name = health_facility_contract_cache_name(health_facility_id)
+    cached = cache.get(cache_name)
+    if cached is None:
+        contract_end_date = apps.get_model("location", "HealthFacility").objects \
+            .filter(pk=health_facility_id) \
+            .values_list("contract_end_date", flat=True) \
+            .first()
+        # wrapped, as a facility without contract end date must be cached too
+        cached = (contract_end_date,)
+        cache.set(cache_name, cached, timeout=HEALTH_FACILITY_CONTRACT_CACHE_TTL)
+    contract_end_date = cached[0]
+    return contract_end_date is not None and contract_end_date > date.today()
+
 
 class JWTAuthentication(BaseAuthentication):
     """
@@ -29,15 +175,14 @@ class JWTAuthentication(BaseAuthentication):
         if token:
             # Do not pass context to avoid to try to get user from request to get his private key.
             try:
-                user = get_user_by_token(token)
+                user = get_user_by_verified_token(token)
             except (jwt.PyJWTError, JSONWebTokenError) as exc:
                 raise exceptions.AuthenticationFailed("INCORRECT_CREDENTIALS") from exc
             except Exception as exc:
                 raise exceptions.AuthenticationFailed(str(exc)) from exc
             else:
                 if CoreConfig.is_valid_health_facility_contract_required:
-                    if not (hasattr(user, 'health_facility') and hasattr(user.health_facility, 'contract_end_date') and
-                            user.health_facility.contract_end_date > date.today()):
+                    if not is_health_facility_contract_valid(user):
                         raise exceptions.AuthenticationFailed("HF_CONTRACT_INVALID")
 
             return user, None
@@ -52,13 +197,5 @@ class JWTAuthentication(BaseAuthentication):
         rate = settings.RATELIMIT_RATE
         mode = settings.MODE
 
-        if mode == 'PROD' and is_ratelimited(
-                request=request,
-                group=group,
-                fn=None,
-                key=key,
-                rate=rate,
-                method=is_ratelimited.ALL,
-                increment=True
-        ):
+        if mode == 'PROD' and is_request_ratelimited(request, group, key, rate):
             raise Throttled(detail='Rate limit exceeded')
@@ -0,0 +1,84 @@
+import atexit
+import logging
+import threading
+
+from django.db import connection
+from django.db.models import Case, When, Value
+
+from core.apps import CoreConfig
+
+logger = logging.getLogger(__name__)
+
+
+class LastLoginRecorder:
+    """
+    Coalesces the last_login updates done on token issuance. Timestamps are buffered in memory (only the most recent
+    one per user is kept) and written periodically from a background thread, with one UPDATE per model and batch.
+    Token issuance therefore never waits for tblUsers. With a flush interval of 0, the writes are done immediately.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._last_login_fields = {}
+
+    def record(self, user, when):
+        from core.models import User
+        target = user._u if isinstance(user, User) else user
+        if target is None or target.pk is None or not self._has_last_login(type(target)):
+            return
+        with self._lock:
+            self._pending.setdefault(type(target), {})[target.pk] = when
+            pending_count = sum(len(values) for values in self._pending.values())
+        if not CoreConfig.last_login_flush_interval:
+            self.flush()
+        elif pending_count >= CoreConfig.last_login_max_pending:
+            self._start_timer(0)
+        else:
+            self._start_timer(CoreConfig.last_login_flush_interval)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for model, values in pending.items():
+            items = list(values.items())
+            for start in range(0, len(items), self.BATCH_SIZE):
+                batch = items[start:start + self.BATCH_SIZE]
+                try:
+                    model.objects.filter(pk__in=[pk for pk, _ in batch]).update(last_login=Case(
+                        *[When(pk=pk, then=Value(when)) for pk, when in batch],
+                        output_field=model._meta.get_field("last_login"),
+                    ))
+                except Exception:
+                    logger.exception("Failed to record the last login of %d %s", len(batch), model.__name__)
+
+    def _has_last_login(self, model):
+        if model not in self._last_login_fields:
+            self._last_login_fields[model] = any(
+                field.name == "last_login" for field in model._meta.concrete_fields)
+        return self._last_login_fields[model]
+
+    def _start_timer(self, interval):
+        with self._lock:
+            if self._timer is not None:
+                if interval:
+                    return
+                self._timer.cancel()
+            self._timer = threading.Timer(interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # This thread has its own database connection, don't leave it open
+            connection.close()
+
+
+last_login_recorder = LastLoginRecorder()
+atexit.register(last_login_recorder.flush)
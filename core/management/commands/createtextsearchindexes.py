@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.text_search import create_text_search_indexes
+
+
+class Command(BaseCommand):
+    help = "Creates the indexes used by the configured text_search_backend on the searched columns. The" \
+           " 0032_text_search_indexes migration only creates the PostgreSQL trigram ones: to be run when enabling" \
+           " the fulltext backend on SQL Server (the running processes then need a restart)."
+
+    def handle(self, *args, **options):
+        kind = create_text_search_indexes()
+        if kind:
+            self.stdout.write(self.style.SUCCESS(f"Text search indexes created ({kind})"))
+        else:
+            self.stdout.write("No text search index used by the configured backend on this database")
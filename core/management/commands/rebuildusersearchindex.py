@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.services.userSearchServices import update_user_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the users search index (core_UserSearchIndex) from the users, officers and claim administrators." \
+           " To be run once after upgrading, before enabling user_search_index_enabled, or after bulk changes done" \
+           " without signals."
+
+    def handle(self, *args, **options):
+        count = update_user_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Users search index rebuilt for {count} users"))
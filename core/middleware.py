@@ -1,8 +1,9 @@
 from django.utils.timezone import now
-from django_ratelimit.core import is_ratelimited
 from rest_framework.exceptions import JsonResponse
 from django.conf import settings
 
+from core.ratelimit import is_request_ratelimited
+
 
 class DefaultAxesAttributesMiddleware:
     def __init__(self, get_response):
@@ -48,15 +49,7 @@ class GraphQLRateLimitMiddleware:
         rate = settings.RATELIMIT_RATE
         mode = settings.MODE
         if mode == 'PROD' and request.path == '/api/graphql':
-            rate_limited = is_ratelimited(
-                request=request,
-                group=group,
-                key=key,
-                rate=rate,
-                method=is_ratelimited.ALL,
-                increment=True
-            )
-            if rate_limited:
+            if is_request_ratelimited(request, group, key, rate):
                 return JsonResponse({'detail': 'Rate limit exceeded'}, status=429)
         response = self.get_response(request)
         return response
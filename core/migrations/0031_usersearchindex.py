@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_exportablequerymodel_file_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='core.user')),
+                ('username', models.CharField(max_length=50)),
+                ('last_names', models.CharField(blank=True, default='', max_length=400)),
+                ('other_names', models.CharField(blank=True, default='', max_length=400)),
+                ('emails', models.CharField(blank=True, default='', max_length=700)),
+                ('phones', models.CharField(blank=True, default='', max_length=200)),
+                ('is_interactive', models.BooleanField(default=False)),
+                ('is_officer', models.BooleanField(default=False)),
+                ('is_technical', models.BooleanField(default=False)),
+                ('is_claim_admin', models.BooleanField(default=False)),
+                ('health_facility_ids', models.CharField(blank=True, default='', max_length=100)),
+                ('role_ids', models.TextField(blank=True, default='')),
+                ('region_ids', models.TextField(blank=True, default='')),
+                ('district_ids', models.TextField(blank=True, default='')),
+                ('municipality_ids', models.TextField(blank=True, default='')),
+                ('village_ids', models.TextField(blank=True, default='')),
+                ('min_birth_date', models.DateField(blank=True, null=True)),
+                ('max_birth_date', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'core_UserSearchIndex',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+# columns searched by core.text_search, as of this migration: the trigram indexes used by the default (auto) backend
+# on PostgreSQL. The SQL Server full-text indexes are opt-in, created by the createtextsearchindexes command.
+TRIGRAM_COLUMNS = [
+    ("tblUsers", ["LastName", "OtherNames"]),
+    ("tblOfficer", ["Code", "LastName", "OtherNames", "EmailId"]),
+    ("tblClaimAdmin", ["LastName", "OtherNames"]),
+    ("tblRole", ["RoleName"]),
+    ("core_User", ["username"]),
+    ("core_UserSearchIndex", ["username", "last_names", "other_names"]),
+]
+
+
+def create_text_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as exc:
+            logger.warning("pg_trgm extension not available, text search indexes not created: %s", exc)
+            return
+        tables = set(connection.introspection.table_names(cursor))
+        for table, columns in TRIGRAM_COLUMNS:
+            if table not in tables:
+                continue
+            table_columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+            for column in columns:
+                if column in table_columns:
+                    cursor.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" '
+                                   f'ON "{table}" USING gin ("{column}" gin_trgm_ops)')
+
+
+def drop_text_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for table, columns in TRIGRAM_COLUMNS:
+            for column in columns:
+                cursor.execute(f'DROP INDEX IF EXISTS "{table}_{column}_trgm"')
+
+
+class Migration(migrations.Migration):
+    # a failed CREATE EXTENSION must not abort the rest of the migration
+    atomic = False
+
+    dependencies = [
+        ('core', '0031_usersearchindex'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_text_search_indexes, drop_text_search_indexes),
+    ]
@@ -0,0 +1,56 @@
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+TABLE = "core_UserSearchIndex"
+# columns matched with LIKE '%...%' by Query._search_users_in_index
+TRIGRAM_COLUMNS = ["last_names", "other_names", "emails", "phones", "health_facility_ids", "role_ids",
+                   "region_ids", "district_ids", "municipality_ids", "village_ids"]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as exc:
+            logger.warning("pg_trgm extension not available, users search index not indexed: %s", exc)
+            return
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{TABLE}_{column}_trgm" ON "{TABLE}" USING gin ("{column}" gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(f'DROP INDEX IF EXISTS "{TABLE}_{column}_trgm"')
+
+
+class Migration(migrations.Migration):
+    # a failed CREATE EXTENSION must not abort the rest of the migration
+    atomic = False
+
+    dependencies = [
+        ('core', '0032_text_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersearchindex',
+            index=models.Index(fields=['min_birth_date'], name='core_usersearch_min_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersearchindex',
+            index=models.Index(fields=['max_birth_date'], name='core_usersearch_max_dob_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -18,6 +18,7 @@ MutationLog = base_mutation.MutationLog
 UUIDVersionedModel = versioned_model.UUIDVersionedModel
 InteractiveUser = user.InteractiveUser
 TechnicalUser = user.TechnicalUser
+UserSearchIndex = user.UserSearchIndex
 Officer = user.Officer
 Group = user.Group
 RoleRight = user.RoleRight
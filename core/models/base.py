@@ -1,7 +1,10 @@
+import copy
 import json
 import os
 import logging
 import sys
+import threading
+import time
 import uuid
 
 from datetime import datetime as py_datetime
@@ -9,13 +12,15 @@ import datetime as base_datetime
 from cached_property import cached_property
 
 from dirtyfields import DirtyFieldsMixin
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q, DO_NOTHING, F, JSONField
 from pandas import DataFrame
 from simple_history.models import HistoricalRecords
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.utils import timezone
 from django.dispatch import receiver
 
 #from core.datetimes.ad_datetime import datetime as py_datetime
@@ -80,15 +85,10 @@ class ModuleConfiguration(UUIDModel):
             return default
 
         try:
-            now = py_datetime.now()  # can't use core config here...
-            qs = cls.objects.filter(
-                Q(is_disabled_until=None) | Q(is_disabled_until__lt=now),
-                layer=layer,
-                module=module
-            ).first()
-            if qs:
-                db_configuration = qs._cfg
-                return {**default, **db_configuration}
+            db_configuration = module_configuration_registry.get(module, layer)
+            if db_configuration is not None:
+                # the registry entry is shared, the callers get their own (mutable) copy, as with the default
+                return {**default, **copy.deepcopy(db_configuration)}
             else:
                 logger.info('No %s configuration, using default!' % module)
                 return default
@@ -97,6 +97,20 @@ class ModuleConfiguration(UUIDModel):
                 module, sys.exc_info()[0].__name__, sys.exc_info()[1]))
             return default
 
+    @classmethod
+    def get_registry_generation(cls):
+        """
+        Changes whenever the configurations returned by get_or_default may have changed (None if unknown)
+        """
+        if bool(os.environ.get('NO_DATABASE', False)):
+            return 0
+        try:
+            return module_configuration_registry.current_generation()
+        except Exception:
+            logger.error('Failed to load module configurations\n%s: %s' % (
+                sys.exc_info()[0].__name__, sys.exc_info()[1]))
+            return None
+
     @cached_property
     def _cfg(self):
         import collections
@@ -109,6 +123,191 @@ class ModuleConfiguration(UUIDModel):
         db_table = 'core_ModuleConfiguration'
 
 
+def _read_only(self, *args, **kwargs):
+    raise TypeError("Module configurations are read-only, copy them (copy.deepcopy) to alter them")
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict of the module configurations kept by the registry, so that the shared entries can't be altered.
+    copy() and copy.deepcopy() give mutable (plain dict) copies.
+    """
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def copy(self):
+        return dict(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class FrozenList(list):
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = clear = sort = \
+        reverse = _read_only
+
+    def copy(self):
+        return list(self)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(value, memo) for value in self]
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+class ModuleConfigurationRegistry:
+    """
+    Process-wide view of the ModuleConfiguration table: all rows are loaded in one query and parsed once, lookups are
+    dictionary reads. The active configuration of each module is recomputed (without querying) when the next
+    is_disabled_until instant is reached. Changes are detected through a version stamp in the shared cache, bumped
+    when the changes are committed and checked at most every VERSION_CHECK_INTERVAL seconds.
+    Until then, the thread that changed the rows reads the table on every lookup without keeping what it reads, so that
+    rolled back changes never end up in the registry.
+    Note: queryset .update() doesn't send signals, call bump() after such updates.
+    """
+    VERSION_CACHE_KEY = "module_configuration_version"
+    VERSION_CHECK_INTERVAL = 5
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rows = None
+        self._active = {}
+        self._next_expiry = None
+        self._version = None
+        self._version_checked_at = 0
+        self._generation = 0
+        self._uncommitted = threading.local()
+
+    def get(self, module, layer='be'):
+        if self._has_uncommitted_changes():
+            return self._compute_active(self._read_rows())[0].get((module, layer))
+        with self._lock:
+            self._refresh()
+            return self._active.get((module, layer))
+
+    def current_generation(self):
+        """
+        Changes every time the active configurations may have changed, for the caches built on top of them.
+        None while the current thread has uncommitted changes.
+        """
+        if self._has_uncommitted_changes():
+            return None
+        with self._lock:
+            self._refresh()
+            return self._generation
+
+    def bump(self):
+        with self._lock:
+            cache.set(self.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+            self._clear()
+
+    def changed(self):
+        """
+        To be called when ModuleConfiguration rows are saved or deleted, the registry is bumped once committed
+        """
+        self._uncommitted.active = True
+        transaction.on_commit(self._committed)
+
+    def _committed(self):
+        self._uncommitted.active = False
+        self.bump()
+
+    def _has_uncommitted_changes(self):
+        if not getattr(self._uncommitted, "active", False):
+            return False
+        if transaction.get_connection().in_atomic_block:
+            return True
+        # out of the transaction without the commit callback: it was rolled back
+        self._uncommitted.active = False
+        return False
+
+    def _refresh(self):
+        if self._rows is not None and time.monotonic() - self._version_checked_at >= self.VERSION_CHECK_INTERVAL:
+            if self._shared_version() != self._version:
+                self._clear()
+            self._version_checked_at = time.monotonic()
+        if self._rows is None:
+            self._load()
+        elif self._next_expiry is not None and py_datetime.now() >= self._next_expiry:
+            self._activate()
+
+    def _load(self):
+        version = self._shared_version()
+        self._rows = self._read_rows()
+        self._version = version
+        self._version_checked_at = time.monotonic()
+        self._activate()
+
+    @staticmethod
+    def _read_rows():
+        rows = {}
+        for configuration in ModuleConfiguration.objects.order_by('id'):
+            disabled_until = configuration.is_disabled_until
+            if disabled_until is not None and timezone.is_aware(disabled_until):
+                disabled_until = timezone.make_naive(disabled_until)
+            rows.setdefault((configuration.module, configuration.layer), []).append(
+                (disabled_until, freeze(configuration._cfg)))
+        return rows
+
+    @staticmethod
+    def _compute_active(rows):
+        # same rule as the former query: first row (by id) which is not disabled (anymore)
+        now = py_datetime.now()  # can't use core config here...
+        active = {}
+        next_expiry = None
+        for key, configurations in rows.items():
+            for disabled_until, cfg in configurations:
+                if disabled_until is None or disabled_until < now:
+                    active.setdefault(key, cfg)
+                elif next_expiry is None or disabled_until < next_expiry:
+                    next_expiry = disabled_until
+        return active, next_expiry
+
+    def _activate(self):
+        self._active, self._next_expiry = self._compute_active(self._rows)
+        self._generation += 1
+
+    def _clear(self):
+        self._rows = None
+        self._active = {}
+        self._next_expiry = None
+        self._generation += 1
+
+    def _shared_version(self):
+        version = cache.get(self.VERSION_CACHE_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(self.VERSION_CACHE_KEY, version, None):
+                version = cache.get(self.VERSION_CACHE_KEY, version)
+        return version
+
+
+module_configuration_registry = ModuleConfigurationRegistry()
+
+
+@receiver(post_save, sender=ModuleConfiguration)
+@receiver(post_delete, sender=ModuleConfiguration)
+def _bump_module_configuration_registry(sender, **kwargs):
+    module_configuration_registry.changed()
+
+
 class FieldControl(UUIDModel):
     module = models.ForeignKey(
         ModuleConfiguration, models.DO_NOTHING, related_name='controls')
@@ -1,10 +1,11 @@
 
 from django.core.files.base import ContentFile
-from django.db.models import DO_NOTHING
+from django.db.models import DO_NOTHING, Case, When, Value
 
 from pandas import DataFrame
 
 from . import UUIDModel, ExtendableModel
+from ..mutation_status import publish_mutation_status
 from .versioned_model import *
 
 logger = logging.getLogger(__name__)
@@ -100,6 +101,8 @@ class MutationLog(UUIDModel, ExtendableModel):
         affected_rows = MutationLog.objects.filter(id=self.id) \
             .filter(status=MutationLog.RECEIVED).update(status=MutationLog.SUCCESS)
         self.refresh_from_db()
+        if affected_rows > 0:
+            publish_mutation_status([self])
         return affected_rows > 0
 
     def mark_as_failed(self, error):
@@ -110,6 +113,43 @@ class MutationLog(UUIDModel, ExtendableModel):
         MutationLog.objects.filter(id=self.id) \
             .update(status=MutationLog.ERROR, error=error)
         self.refresh_from_db()
+        publish_mutation_status([self])
+
+    @classmethod
+    def mark_many_as_successful(cls, ids):
+        """
+        Bulk mark_as_successful, with one UPDATE
+        """
+        ids = list(ids)
+        if ids:
+            cls.objects.filter(id__in=ids, status=cls.RECEIVED).update(status=cls.SUCCESS)
+            cls._publish_status(ids)
+
+    @classmethod
+    def mark_many_as_failed(cls, errors, only_received=False):
+        """
+        Bulk mark_as_failed, with one UPDATE
+        :param errors: {MutationLog id: error}
+        :param only_received: leave the MutationLog that are not in RECEIVED status anymore untouched
+        """
+        if not errors:
+            return
+        queryset = cls.objects.filter(id__in=errors.keys())
+        if only_received:
+            queryset = queryset.filter(status=cls.RECEIVED)
+        if len(set(errors.values())) == 1:
+            error = next(iter(errors.values()))
+        else:
+            error = Case(*[When(id=mutation_log_id, then=Value(error)) for mutation_log_id, error in errors.items()],
+                         output_field=models.TextField())
+        queryset.update(status=cls.ERROR, error=error)
+        cls._publish_status(errors.keys())
+
+    @classmethod
+    def _publish_status(cls, ids):
+        publish_mutation_status(
+            cls.objects.filter(id__in=ids).exclude(status=cls.RECEIVED)
+            .values("id", "user_id", "client_mutation_id", "status", "error"))
 
 
 class ObjectMutation:
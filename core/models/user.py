@@ -9,9 +9,11 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin, Group
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.db import models
+from django.db.models import Exists, FilteredRelation, OuterRef, Q
 from django.utils.crypto import salted_hmac
 from graphql import ResolveInfo
 import core
+from core.apps import CoreConfig
 
 
 # from core.utils import validate_password
@@ -19,7 +21,7 @@ from django.contrib.auth.password_validation import validate_password
 #from core.datetimes.ad_datetime import datetime as py_datetime
 from django.conf import settings
 
-from ..utils import filter_validity
+from ..utils import filter_validity, on_commit_batch
 from .base import *
 from .versioned_model import *
 
@@ -168,6 +170,51 @@ class RoleRight(VersionedModel):
         db_table = 'tblRoleRight'
 
 
+def _role_generation_cache_name(role_id):
+    return f"role_gen_{role_id}"
+
+
+def get_role_generations(role_ids):
+    """
+    Returns the current generation of each role ({role_id: generation}). The rights cached for a user carry the
+    generations of the roles they were computed from and are only valid while those generations are unchanged.
+    Generations are random tokens rather than counters so that an evicted generation can never be mistaken for
+    an older one.
+    """
+    names = {_role_generation_cache_name(role_id): role_id for role_id in role_ids}
+    generations = cache.get_many(names.keys())
+    missing = [name for name in names if name not in generations]
+    if missing:
+        for name in missing:
+            cache.add(name, uuid.uuid4().hex, timeout=None)
+        generations.update(cache.get_many(missing))
+    return {role_id: generations.get(name) for name, role_id in names.items()}
+
+
+def are_role_generations_current(role_generations):
+    names = {_role_generation_cache_name(role_id): generation for role_id, generation in role_generations.items()}
+    current = cache.get_many(names.keys())
+    return all(current.get(name) == generation for name, generation in names.items())
+
+
+def bump_role_generations(role_ids):
+    """
+    Invalidates, in O(1) per role, the cached rights of every user having one of these roles, once the transaction is
+    committed (and not at all if it is rolled back). The roles changed in a transaction are collected, so that each
+    one is bumped once however many of its rows are saved.
+    UserSecurityContext.load reads the generations before the rights, so rights read before the commit can only be
+    cached under a generation that the commit makes stale.
+    """
+    role_ids = list(role_ids)
+    if role_ids:
+        on_commit_batch("core.role_generations", role_ids, _bump_role_generations)
+
+
+def _bump_role_generations(role_ids):
+    cache.set_many({_role_generation_cache_name(role_id): uuid.uuid4().hex for role_id in set(role_ids)},
+                   timeout=None)
+
+
 class InteractiveUser(VersionedModel):
     id = models.AutoField(db_column="UserID", primary_key=True)
     uuid = models.CharField(db_column="UserUUID", max_length=36, default=uuid.uuid4, unique=True)
@@ -250,13 +297,14 @@ class InteractiveUser(VersionedModel):
 
     @property
     def rights(self):
-        rights = cache.get('rights_' + str(self.id))
-        if rights:
-            return rights
+        cached = cache.get('rights_' + str(self.id))
+        if isinstance(cached, dict) and are_role_generations_current(cached["roles"]):
+            return cached["rights"]
+        role_ids = [r.role_id for r in UserRole.filter_queryset().filter(user_id=self.id)]
+        role_generations = get_role_generations(role_ids)
         rights = [rr.right_id for rr in RoleRight.filter_queryset().filter(
-            role_id__in=[r.role_id for r in UserRole.filter_queryset().filter(
-                user_id=self.id)]).distinct()]
-        cache.set('rights_' + str(self.id), rights, timeout=None)
+            role_id__in=role_ids).distinct()]
+        cache.set('rights_' + str(self.id), {"rights": rights, "roles": role_generations}, timeout=None)
         return rights
 
     @property
@@ -329,6 +377,19 @@ class InteractiveUser(VersionedModel):
         self.password = (
             pwd_hash.hexdigest().upper()
         )  # Legacy requires this to be uppercase
+        # The private key is also the JWT signing key of the user, it is invalidated once saved and committed
+        self._signing_key_rotated = True
+
+    def _invalidate_signing_key(self):
+        from core.jwt import invalidate_user_signing_key
+        from core.jwt_authentication import revoke_verified_tokens_on_commit
+        invalidate_user_signing_key(self.login_name)
+        revoke_verified_tokens_on_commit(self.login_name)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.__dict__.pop("_signing_key_rotated", False):
+            self._invalidate_signing_key()
 
     def check_password(self, raw_password):
         from hashlib import sha256
@@ -380,6 +441,97 @@ class UserRole(VersionedModel):
         db_table = 'tblUserRole'
 
 
+class UserSecurityContext:
+    """
+    Everything the permission checks need to know about an authenticated User: rights, IMIS administrator, officer
+    and claim administrator flags and health facility (User.get_health_facility_id). It is loaded with one User query (related users joined,
+    officer/claim admin flags as subqueries), one user roles query and one roles/rights query, cached as a single blob
+    per user and kept on the User instance (i.e. request.user) for the rest of the request.
+    """
+    IMIS_ADMIN_SYSTEM_ROLE = 64
+
+    def __init__(self, rights=None, is_imis_admin=False, is_officer=False, is_claim_admin=False,
+                 health_facility_id=None, role_generations=None):
+        self.rights = rights or []
+        self.role_generations = role_generations or {}
+        self.is_imis_admin = is_imis_admin
+        self.is_officer = is_officer
+        self.is_claim_admin = is_claim_admin
+        self.health_facility_id = health_facility_id
+        # Permissions are checked as strings (e.g. "121701"), compile them once for O(1) membership checks
+        self.rights_set = frozenset(str(right) for right in self.rights)
+
+    def as_dict(self):
+        return {
+            "rights": self.rights,
+            "is_imis_admin": self.is_imis_admin,
+            "is_officer": self.is_officer,
+            "is_claim_admin": self.is_claim_admin,
+            "health_facility_id": self.health_facility_id,
+            "role_generations": self.role_generations,
+        }
+
+    @staticmethod
+    def cache_name(username):
+        return f"security_context_{username}"
+
+    @classmethod
+    def invalidate(cls, username):
+        cache.delete(cls.cache_name(username))
+
+    @classmethod
+    def get(cls, user):
+        cache_name = cls.cache_name(user.username)
+        cached = cache.get(cache_name)
+        if cached is not None and are_role_generations_current(cached["role_generations"]):
+            return cls(**cached)
+        context = cls.load(user)
+        cache.set(cache_name, context.as_dict(), CoreConfig.security_context_cache_ttl)
+        return context
+
+    @classmethod
+    def load(cls, user):
+        queryset = User.objects.select_related("i_user", "officer", "claim_admin", "t_user").filter(id=user.id)
+        queryset = queryset.annotate(ctx_is_officer=Exists(Officer.objects.filter(
+            code=OuterRef("i_user__login_name"), has_login=True, *filter_validity())))
+        if 'claim' in sys.modules:
+            from claim.models import ClaimAdmin
+            queryset = queryset.annotate(ctx_is_claim_admin=Exists(ClaimAdmin.objects.filter(
+                code=OuterRef("i_user__login_name"), has_login=True, *filter_validity())))
+        db_user = queryset.first()
+        if db_user is None or db_user.i_user is None:
+            return cls()
+        # Share the related users we just loaded with the instance of the request
+        for related in ("i_user", "officer", "claim_admin", "t_user"):
+            setattr(user, related, getattr(db_user, related))
+
+        i_user = db_user.i_user
+        role_ids = set(UserRole.objects
+                       .filter(user_id=i_user.id, validity_to__isnull=True)
+                       .values_list("role_id", flat=True))
+        # read before the rights, so that a role edited in between invalidates what is computed here
+        role_generations = get_role_generations(role_ids)
+        rights = set()
+        is_imis_admin = False
+        roles = Role.objects \
+            .filter(id__in=role_ids) \
+            .annotate(valid_rights=FilteredRelation("rights", condition=Q(rights__validity_to__isnull=True))) \
+            .values_list("is_system", "validity_to", "valid_rights__right_id")
+        for is_system, role_validity_to, right_id in roles:
+            if right_id is not None:
+                rights.add(right_id)
+            if is_system == cls.IMIS_ADMIN_SYSTEM_ROLE and role_validity_to is None:
+                is_imis_admin = True
+        return cls(
+            rights=sorted(rights),
+            is_imis_admin=is_imis_admin and i_user.validity_to is None,
+            is_officer=db_user.ctx_is_officer,
+            is_claim_admin=getattr(db_user, "ctx_is_claim_admin", False),
+            health_facility_id=db_user.get_health_facility_id(),
+            role_generations=role_generations,
+        )
+
+
 class User(UUIDModel, PermissionsMixin, UUIDVersionedModel):
     username = models.CharField(unique=True, max_length=50)
     t_user = models.ForeignKey(TechnicalUser, on_delete=models.CASCADE, blank=True, null=True)
@@ -406,12 +558,30 @@ class User(UUIDModel, PermissionsMixin, UUIDVersionedModel):
     def _u(self):
         return self.i_user or self.officer or self.claim_admin or self.t_user
 
+    @property
+    def security_context(self):
+        context = self.__dict__.get("_security_context")
+        if context is None:
+            context = UserSecurityContext.get(self) if self.i_user_id else UserSecurityContext()
+            self.__dict__["_security_context"] = context
+        return context
+
     def has_perms(self, perm_list, obj=None, list_evaluation_or=True):
         if not perm_list:
             return True
         if self.is_imis_admin:
             return True
-        elif list_evaluation_or:
+        if obj is None and self.i_user_id:
+            granted = self.security_context.rights_set
+            if list_evaluation_or:
+                if not granted.isdisjoint(perm_list):
+                    return True
+            else:
+                # Only the permissions not granted by the rights still need the (Django) permission backends
+                perm_list = [perm for perm in perm_list if perm not in granted]
+                if not perm_list:
+                    return True
+        if list_evaluation_or:
             return any(self.has_perm(perm, obj) for perm in perm_list)
         else:
             return super().has_perms(perm_list, obj)
@@ -438,20 +608,34 @@ class User(UUIDModel, PermissionsMixin, UUIDVersionedModel):
 
     @property
     def is_staff(self):
+        if self.i_user_id:
+            return self.security_context.is_imis_admin
         return self._u.is_staff
 
     @property
     def is_superuser(self):
+        if self.i_user_id:
+            return self.security_context.is_imis_admin
         return self._u.is_superuser
 
     @property
     def is_imis_admin(self):
         # 64 is system number for IMIS Administrator
-        user = self._u
-        if isinstance(user, InteractiveUser):
-            return user.is_imis_admin
-        else:
-            return False
+        if self.i_user_id:
+            return self.security_context.is_imis_admin
+        return False
+
+    @property
+    def is_officer(self):
+        if self.i_user_id:
+            return self.security_context.is_officer
+        return getattr(self._u, "is_officer")
+
+    @property
+    def is_claim_admin(self):
+        if self.i_user_id:
+            return self.security_context.is_claim_admin
+        return getattr(self._u, "is_claim_admin")
 
     @property
     def is_active(self):
@@ -465,19 +649,26 @@ class User(UUIDModel, PermissionsMixin, UUIDVersionedModel):
         return True
 
     def has_perm(self, perm, obj=None):
-        i_user = self.i_user if obj is None else obj.i_user
-        if i_user is not None and (
-            i_user.is_superuser or 
-            any(str(right) == perm for right in i_user.rights)
-        ):
+        if obj is None:
+            granted = self.i_user_id is not None and (
+                self.security_context.is_imis_admin or
+                perm in self.security_context.rights_set
+            )
+        else:
+            i_user = obj.i_user
+            granted = i_user is not None and (
+                i_user.is_superuser or
+                any(str(right) == perm for right in i_user.rights)
+            )
+        if granted:
             return True
         else:
             return super(User, self).has_perm(perm, obj)
 
     @property
     def rights(self):
-        if self.i_user:
-            return self.i_user.rights
+        if self.i_user_id:
+            return self.security_context.rights
         return []
 
     def set_password(self, raw_password):
@@ -487,8 +678,10 @@ class User(UUIDModel, PermissionsMixin, UUIDVersionedModel):
         return None
 
     def clear_refresh_tokens(self):
+        from core.jwt_authentication import revoke_verified_tokens
         for refresh in self.refresh_tokens.filter(revoked__isnull=True):
             refresh.revoke()
+        revoke_verified_tokens(self.username)
 
     def get_session_auth_hash(self):
         key_salt = "core.User.get_session_auth_hash"
@@ -501,6 +694,16 @@ class User(UUIDModel, PermissionsMixin, UUIDVersionedModel):
             return self.i_user.health_facility
         return None
 
+    def get_health_facility_id(self):
+        """
+        Id of the health facility of get_health_facility (claim administrator first), without loading it
+        """
+        if self.claim_admin:
+            return self.claim_admin.health_facility_id
+        if self.i_user:
+            return self.i_user.health_facility_id
+        return None
+
     @property
     def health_facility(self):
         return self.get_health_facility()
@@ -673,6 +876,64 @@ class Officer(VersionedModel, ExtendableModel):
 
     
 
+class UserSearchIndex(models.Model):
+    """
+    Denormalized copy of the searchable attributes of a core User, its InteractiveUser, Officer and ClaimAdmin
+    (names, contacts, types, roles and locations), one row per User, so that the users search doesn't need any join.
+    Texts are lower case, multi-valued columns are lists of tokens like |a|b|, matched with LIKE '%|a|%' (served by
+    pg_trgm indexes on PostgreSQL, see the 0033_usersearchindex_indexes migration).
+    Maintained by core.services.userSearchServices, whether user_search_index_enabled is set or not.
+    """
+    SEPARATOR = "|"
+
+    user = models.OneToOneField(User, models.CASCADE, primary_key=True, related_name="search_index")
+    username = models.CharField(max_length=50)
+    last_names = models.CharField(max_length=400, blank=True, default="")
+    other_names = models.CharField(max_length=400, blank=True, default="")
+    emails = models.CharField(max_length=700, blank=True, default="")
+    phones = models.CharField(max_length=200, blank=True, default="")
+    is_interactive = models.BooleanField(default=False)
+    is_officer = models.BooleanField(default=False)
+    is_technical = models.BooleanField(default=False)
+    is_claim_admin = models.BooleanField(default=False)
+    health_facility_ids = models.CharField(max_length=100, blank=True, default="")
+    role_ids = models.TextField(blank=True, default="")
+    region_ids = models.TextField(blank=True, default="")
+    district_ids = models.TextField(blank=True, default="")
+    municipality_ids = models.TextField(blank=True, default="")
+    village_ids = models.TextField(blank=True, default="")
+    min_birth_date = models.DateField(blank=True, null=True)
+    max_birth_date = models.DateField(blank=True, null=True)
+
+    @classmethod
+    def normalize(cls, value):
+        return str(value).strip().lower() if value is not None else ""
+
+    @classmethod
+    def tokens(cls, values):
+        values = sorted({cls.normalize(value) for value in values if value is not None and value != ""})
+        return cls.SEPARATOR + cls.SEPARATOR.join(values) + cls.SEPARATOR if values else ""
+
+    @classmethod
+    def has_token(cls, field, value):
+        return Q(**{"%s__contains" % field: cls.SEPARATOR + cls.normalize(value) + cls.SEPARATOR})
+
+    @classmethod
+    def has_any_token(cls, field, values):
+        condition = Q(pk__in=[])
+        for value in values:
+            condition |= cls.has_token(field, value)
+        return condition
+
+    class Meta:
+        managed = True
+        db_table = 'core_UserSearchIndex'
+        indexes = [
+            models.Index(fields=["min_birth_date"], name="core_usersearch_min_dob_idx"),
+            models.Index(fields=["max_birth_date"], name="core_usersearch_max_dob_idx"),
+        ]
+
+
 def _get_default_expire_date():
     return py_datetime.now() + timedelta(days=1)
 
@@ -0,0 +1,95 @@
+"""
+Push delivery of the MutationLog status transitions, so that the clients don't have to poll mutation_logs.
+
+When a MutationLog is marked as successful or failed, its status is (once the transaction is committed):
+* stored in the Django cache, from which the mutation_status endpoint returns it without querying the database
+* sent to the "mutation_status_<user id>" group of the Channels layer, if Channels is installed and configured,
+  to which the core.consumers.MutationStatusConsumer websockets are subscribed
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core.apps import CoreConfig
+
+try:
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+except ImportError:
+    get_channel_layer = None
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TYPE = "mutation.status"
+
+
+def user_group_name(user_id):
+    return f"mutation_status_{user_id}"
+
+
+def _status_cache_name(mutation_log_id):
+    return f"mutation_status_{mutation_log_id}"
+
+
+def _status_message(mutation_log):
+    return {
+        "id": str(mutation_log["id"]),
+        "client_mutation_id": mutation_log["client_mutation_id"],
+        "status": mutation_log["status"],
+        "error": mutation_log["error"],
+    }
+
+
+def publish_mutation_status(mutation_logs):
+    """
+    Publishes the status of the given MutationLog (instances or dicts with id, user_id, client_mutation_id, status and
+    error) when the current transaction is committed
+    """
+    messages = []
+    for mutation_log in mutation_logs:
+        if not isinstance(mutation_log, dict):
+            mutation_log = {
+                "id": mutation_log.id, "user_id": mutation_log.user_id,
+                "client_mutation_id": mutation_log.client_mutation_id,
+                "status": mutation_log.status, "error": mutation_log.error,
+            }
+        messages.append((mutation_log["user_id"], _status_message(mutation_log)))
+    if messages:
+        transaction.on_commit(lambda: _send(messages))
+
+
+def _send(messages):
+    try:
+        cache.set_many({_status_cache_name(message["id"]): (user_id, message) for user_id, message in messages},
+                       timeout=CoreConfig.mutation_status_cache_ttl)
+    except Exception:
+        logger.warning("Could not cache the mutations status", exc_info=True)
+    channel_layer = get_channel_layer() if get_channel_layer else None
+    if channel_layer is None:
+        return
+    group_send = async_to_sync(channel_layer.group_send)
+    for user_id, message in messages:
+        if user_id is None:
+            continue
+        try:
+            group_send(user_group_name(user_id), {"type": MESSAGE_TYPE, "mutation": message})
+        except Exception:
+            logger.warning("Could not push the status of mutation %s", message["id"], exc_info=True)
+
+
+def get_mutation_status(mutation_log_id, user_id):
+    """
+    The status message of a MutationLog of the user, from the cache or else the database, None if not found
+    """
+    from core.models import MutationLog
+    cached = cache.get(_status_cache_name(mutation_log_id))
+    if cached is not None:
+        cached_user_id, message = cached
+        return message if cached_user_id == user_id else None
+    mutation_log = MutationLog.objects \
+        .filter(id=mutation_log_id, user_id=user_id) \
+        .values("id", "client_mutation_id", "status", "error") \
+        .first()
+    return _status_message(mutation_log) if mutation_log else None
+
@@ -0,0 +1,215 @@
+import hashlib
+import ipaddress
+import logging
+import os
+import re
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from django_ratelimit.core import is_ratelimited, user_or_ip
+
+logger = logging.getLogger(__name__)
+
+_RATE_RE = re.compile(r"^(\d+)/(\d*)([smhd])?$")
+_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+# Marker left on the request so that it is only counted once, whichever of the middleware or the
+# authentication checks it first
+_REQUEST_MARKER = "_openimis_ratelimited"
+# Shared registry of the workers of the local tier: {worker: last registration timestamp}
+_WORKERS_KEY = "rl_local_workers"
+
+
+class _WindowCounter:
+    __slots__ = ("count", "synced", "others", "expires_at")
+
+    def __init__(self, expires_at):
+        # requests of this worker, as last published to the shared cache, and of the other workers
+        self.count = 0
+        self.synced = 0
+        self.others = 0
+        self.expires_at = expires_at
+
+
+class LocalRateLimiter:
+    """
+    In-process tier in front of the shared cache. Each worker counts the requests of a window locally and, every
+    RATELIMIT_LOCAL_SYNC_INTERVAL seconds, after RATELIMIT_LOCAL_SYNC_BATCH requests on a key, or on every request
+    once a key gets close to its limit, publishes its own totals under per-worker keys and reads those of the other
+    workers: one get_many and one set_many for all its keys, outside of the lock. As each worker only writes its own
+    keys, no update is lost without needing atomic increments. The workers are listed in a shared registry that each
+    one refreshes every RATELIMIT_LOCAL_WORKERS_TIMEOUT / 2 seconds. The limit is thus enforced across workers, with a
+    slack of at most one batch per worker, while most requests don't need any cache round-trip.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._last_sync = 0
+        self._syncing = False
+        self._worker = "%s_%s_%s" % (socket.gethostname(), os.getpid(), id(self))
+        self._workers = {}
+
+    def is_limited(self, group, value, limit, period, increment=True):
+        now = time.time()
+        window = int(now // period)
+        cache_key = "rl_local_%s_%s_%s_%s" % (
+            group, hashlib.md5(str(value).encode("utf-8")).hexdigest(), period, window)
+        with self._lock:
+            counter = self._counters.get(cache_key)
+            if counter is None:
+                counter = self._counters[cache_key] = _WindowCounter((window + 1) * period)
+            if increment:
+                counter.count += 1
+            count = counter.count + counter.others
+            # a single thread syncs at a time, the others go on with their local counts
+            must_sync = not self._syncing and (
+                now - self._last_sync >= self.sync_interval
+                or counter.count - counter.synced >= self.sync_batch
+                or count >= limit * 0.8)
+            if must_sync:
+                self._syncing = True
+                self._last_sync = now
+                counters = self._snapshot(now)
+        if must_sync:
+            try:
+                self._sync(counters, now)
+            finally:
+                self._syncing = False
+            count = counter.count + counter.others
+        return count > limit
+
+    @property
+    def sync_interval(self):
+        return getattr(settings, "RATELIMIT_LOCAL_SYNC_INTERVAL", 1)
+
+    @property
+    def sync_batch(self):
+        return getattr(settings, "RATELIMIT_LOCAL_SYNC_BATCH", 10)
+
+    @property
+    def workers_timeout(self):
+        return getattr(settings, "RATELIMIT_LOCAL_WORKERS_TIMEOUT", 60 * 60)
+
+    def _snapshot(self, now):
+        # under the lock: drops the expired windows, returns the counts of the live ones
+        counters = {}
+        for cache_key, counter in list(self._counters.items()):
+            if counter.expires_at <= now:
+                del self._counters[cache_key]
+            else:
+                counters[cache_key] = (counter, counter.count)
+        return counters
+
+    def _slot_keys(self, counters, workers):
+        return ["%s_%s" % (cache_key, worker) for cache_key in counters for worker in workers if worker != self._worker]
+
+    def _sync(self, counters, now):
+        cache = caches[getattr(settings, "RATELIMIT_USE_CACHE", "default")]
+        try:
+            values = cache.get_many([_WORKERS_KEY] + self._slot_keys(counters, self._workers))
+            workers = {worker: seen for worker, seen in (values.pop(_WORKERS_KEY, None) or {}).items()
+                       if seen > now - self.workers_timeout}
+            new_workers = [worker for worker in workers if worker not in self._workers]
+            if new_workers:
+                values.update(cache.get_many(self._slot_keys(counters, new_workers)))
+            updates = {"%s_%s" % (cache_key, self._worker): count
+                       for cache_key, (counter, count) in counters.items() if count != counter.synced}
+            if updates:
+                timeout = int(max(counter.expires_at for counter, _ in counters.values()) - now) + 1
+                cache.set_many(updates, timeout)
+            if now - workers.get(self._worker, 0) >= self.workers_timeout / 2:
+                # Concurrent registrations may overwrite each other, the lost ones are retried at next sync
+                workers[self._worker] = now
+                cache.set(_WORKERS_KEY, workers, self.workers_timeout)
+        except Exception:
+            # Shared cache unavailable: keep counting locally until next sync
+            logger.warning("Could not sync rate limit counters", exc_info=True)
+            return
+        with self._lock:
+            self._workers = workers
+            for cache_key, (counter, count) in counters.items():
+                counter.synced = max(counter.synced, count)
+                counter.others = sum(values.get(slot_key, 0) for slot_key in self._slot_keys([cache_key], workers))
+
+
+local_rate_limiter = LocalRateLimiter()
+
+
+def _split_rate(rate):
+    match = _RATE_RE.match(rate) if isinstance(rate, str) else None
+    if not match:
+        return None, None
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * _UNITS[unit or "s"]
+
+
+def _client_ip(request):
+    if getattr(settings, "RATELIMIT_IP_META_KEY", None):
+        # custom resolution of the client IP, left to django_ratelimit
+        return None
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return None
+    # masked as django_ratelimit does, by default IPv6 addresses are limited per /64
+    if address.version == 4:
+        mask = getattr(settings, "RATELIMIT_IPV4_MASK", 32)
+    else:
+        mask = getattr(settings, "RATELIMIT_IPV6_MASK", 64)
+    return str(ipaddress.ip_network("%s/%s" % (address, mask), strict=False).network_address)
+
+
+_KEYS = {
+    "ip": _client_ip,
+    "user_or_ip": user_or_ip,
+}
+
+
+def _resolve_key(request, group, key):
+    """
+    Value of the key of the request, following the key semantics documented by django_ratelimit, or None to
+    delegate the keys that the local tier doesn't resolve.
+    """
+    if isinstance(key, str) and "." in key and ":" not in key:
+        key = import_string(key)
+    if callable(key):
+        return key(group, request)
+    if key in _KEYS:
+        return _KEYS[key](request)
+    if isinstance(key, str) and key.startswith("header:"):
+        header = "HTTP_" + key[len("header:"):].upper().replace("-", "_")
+        return request.META.get(header, "")
+    return None
+
+
+def is_request_ratelimited(request, group, key, rate):
+    """
+    Counts the request (exactly once, even if checked several times) and tells whether it exceeds the rate.
+    Keys and rates that the local tier doesn't understand are delegated to django_ratelimit.
+    """
+    http_request = getattr(request, "_request", request)
+    limited = getattr(http_request, _REQUEST_MARKER, None)
+    if limited is not None:
+        return limited
+
+    limit, period = _split_rate(rate)
+    value = _resolve_key(http_request, group, key) if limit is not None \
+        and getattr(settings, "RATELIMIT_LOCAL", True) else None
+    if value is None:
+        limited = is_ratelimited(
+            request=http_request,
+            group=group,
+            fn=None,
+            key=key,
+            rate=rate,
+            method=is_ratelimited.ALL,
+            increment=True
+        )
+    else:
+        limited = local_rate_limiter.is_limited(group, value, limit, period)
+    setattr(http_request, _REQUEST_MARKER, limited)
+    return limited
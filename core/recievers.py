@@ -1,15 +1,51 @@
 from django.dispatch import receiver
 import sys
-from django import apps
+from django.apps import apps
 from django.db.models.signals import post_save, post_delete
 from contextlib import suppress
-from core.models.user import Officer
+from core.models.user import Officer, InteractiveUser, UserSecurityContext, Role, RoleRight, bump_role_generations, \
+    User, UserRole
+from core.jwt_authentication import revoke_verified_tokens_on_commit
+from core.services.userSearchServices import schedule_user_search_index_update
 from django.core.cache import cache
+from django.db import transaction
 
 @receiver([post_save, post_delete], sender=Officer)
 def _post_save_eo_receiver(sender, instance, **kwargs):
     with suppress(AttributeError):
         cache.delete(f"user_eo_{instance.code}")
+        UserSecurityContext.invalidate(instance.code)
+    schedule_user_search_index_update(officer_ids=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=InteractiveUser)
+def _post_save_i_user_receiver(sender, instance, **kwargs):
+    with suppress(AttributeError):
+        UserSecurityContext.invalidate(instance.login_name)
+        # deactivated (validity_to) or deleted users must not keep using their verified tokens
+        revoke_verified_tokens_on_commit(instance.login_name)
+    schedule_user_search_index_update(i_user_ids=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def _post_save_user_receiver(sender, instance, **kwargs):
+    revoke_verified_tokens_on_commit(instance.username)
+    schedule_user_search_index_update(user_ids=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=UserRole)
+def _post_save_user_role_receiver(sender, instance, **kwargs):
+    schedule_user_search_index_update(i_user_ids=[instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=Role)
+def _post_save_role_receiver(sender, instance, **kwargs):
+    bump_role_generations([instance.id])
+
+
+@receiver([post_save, post_delete], sender=RoleRight)
+def _post_save_role_right_receiver(sender, instance, **kwargs):
+    bump_role_generations([instance.role_id])
 
 
 if 'claim' in sys.modules:
@@ -17,4 +53,24 @@ if 'claim' in sys.modules:
     @receiver([post_save, post_delete], sender=ClaimAdmin)
     def _post_save_ca_receiver(sender, instance, **kwargs):
         with suppress(AttributeError):
-            cache.delete(f"user_ca_{instance.code}")
\ No newline at end of file
+            cache.delete(f"user_ca_{instance.code}")
+            UserSecurityContext.invalidate(instance.code)
+        schedule_user_search_index_update(claim_admin_ids=[instance.id])
+
+if 'location' in sys.modules:
+    HealthFacility = apps.get_model('location', 'HealthFacility')
+    @receiver([post_save, post_delete], sender=HealthFacility)
+    def _post_save_hf_receiver(sender, instance, **kwargs):
+        from core.jwt_authentication import health_facility_contract_cache_name
+        cache_name = health_facility_contract_cache_name(instance.id)
+        transaction.on_commit(lambda: cache.delete(cache_name))
+
+    UserDistrict = apps.get_model('location', 'UserDistrict')
+    @receiver([post_save, post_delete], sender=UserDistrict)
+    def _post_save_user_district_receiver(sender, instance, **kwargs):
+        schedule_user_search_index_update(i_user_ids=[instance.user_id])
+
+    OfficerVillage = apps.get_model('location', 'OfficerVillage')
+    @receiver([post_save, post_delete], sender=OfficerVillage)
+    def _post_save_officer_village_receiver(sender, instance, **kwargs):
+        schedule_user_search_index_update(officer_ids=[instance.officer_id])
@@ -1,4 +1,5 @@
 import decimal
+import hashlib
 import json
 import logging
 import re
@@ -10,7 +11,16 @@ from django.utils.translation import gettext as _
 from copy import copy
 from datetime import datetime as py_datetime
 
+from graphene.relay import PageInfo
 from graphene_django import DjangoObjectType
+from graphene_django.utils import maybe_queryset
+from graphql.language import ast as gql_ast
+from graphql_relay.connection.arrayconnection import (
+    connection_from_list_slice,
+    cursor_to_offset,
+    get_offset_with_default,
+    offset_to_cursor,
+)
 from functools import partial
 from promise import Promise
 
@@ -30,38 +40,46 @@ from core.services import (
     set_user_password,
     user_authentication
 )
-from core.tasks import openimis_mutation_async
+from core.tasks import enqueue_mutation, enqueue_mutation_batch, register_mutation_class
 from core import filter_validity
 from core.data_masking import anonymize_gql
+from core.gql.keyset_pagination import is_keyset_cursor, keyset_connection
+from core.gql.mutation_coercion import get_coercion_plan
+from core.text_search import text_search_filter
 from django import dispatch
 from django.conf import settings
 from django.core.cache import cache
 from django.contrib.auth.models import AnonymousUser
-from django.core.exceptions import PermissionDenied, ValidationError, PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError, EmptyResultSet
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connections, transaction
 from django.db.models import Q, Count
+from django.db.models.query import QuerySet
 from django.db.models.expressions import RawSQL
 from django.http import HttpRequest
 from django.middleware.csrf import CsrfViewMiddleware
-from django.utils import translation
 from django.utils.timezone import now
 from graphene.utils.str_converters import to_snake_case, to_camel_case
 from graphene_django.filter import DjangoFilterConnectionField
 import graphql_jwt
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from axes.attempts import get_user_attempts
 from axes.handlers.database import AxesDatabaseHandler
 from axes.models import AccessAttempt
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, NamedTuple
 
 from core.apps import CoreConfig
 from core.custom_filters import CustomFilterWizardStorage
 from core.gql_queries import RoleGQLType, RoleRightGQLType, UserGQLType, InteractiveUserGQLType, LanguageGQLType, \
     CustomFilterGQLType, ModulePermissionsListGQLType, OfficerGQLType, PermissionOpenImisGQLType, \
     ModulePermissionGQLType, CustomFilterOptionGQLType
-from core.utils import flatten_dict, ExtendedConnection
+from core.utils import flatten_dict, ExtendedConnection, activate_language
 from core.models import ModuleConfiguration, FieldControl, MutationLog, Language, RoleMutation, UserMutation, User, \
-    InteractiveUser, Role, RoleRight
+    InteractiveUser, Role, RoleRight, UserSearchIndex
+from core.models.user import bump_role_generations
 from core.services.roleServices import check_role_unique_name
 from core.services.userServices import check_user_unique_email
 from core.validation.obligatoryFieldValidation import validate_payload_for_obligatory_fields
@@ -166,18 +184,112 @@ class OpenIMISJSONEncoder(DjangoJSONEncoder):
         return super().default(o)
 
 
+_json_encoder = OpenIMISJSONEncoder()
+
+
+def _normalize_json_key(key):
+    # same conversions as json.dumps
+    if isinstance(key, str):
+        return str.__str__(key)
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, (int, float)):
+        return json.dumps(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {key.__class__.__name__}")
+
+
+def normalize_json(o):
+    """
+    The plain Python value of json.loads(json.dumps(o, cls=OpenIMISJSONEncoder)), without the round trip
+    """
+    if o is None or o is True or o is False or type(o) in (str, int, float):
+        return o
+    if isinstance(o, str):
+        return str.__str__(o)
+    if isinstance(o, int):
+        return int(o)
+    if isinstance(o, float):
+        return float(o)
+    if isinstance(o, (list, tuple)):
+        return [normalize_json(item) for item in o]
+    if isinstance(o, dict):
+        return {_normalize_json_key(key): normalize_json(value) for key, value in o.items()}
+    return normalize_json(_json_encoder.default(o))
+
+
+def dump_json(normalized):
+    """
+    JSON string of a value returned by normalize_json, with orjson if it is installed
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(normalized).decode("utf-8")
+        except TypeError:
+            # e.g. integers above 64 bits
+            pass
+    return json.dumps(normalized)
+
+
+def normalize_mutation_data(data):
+    """
+    Single normalization pass of the mutation data, returns the JSON string to store in the MutationLog and the plain
+    Python payload (as it would be read back from the JSON string)
+    """
+    payload = normalize_json(data)
+    return dump_json(payload), payload
+
+
+class ModuleSignals(dict):
+    """
+    Signals by module name, each created on first access (typically when a receiver is connected to it).
+    send() and has_listeners() don't create the signal of a module that has none, which makes sending the signals of
+    the modules without receivers a dict lookup.
+    """
+
+    def __init__(self, providing_args):
+        super().__init__()
+        self.providing_args = providing_args
+
+    def __missing__(self, module):
+        signal = self[module] = dispatch.Signal(self.providing_args)
+        return signal
+
+    def has_listeners(self, module, sender=None):
+        signal = self.get(module)
+        return signal is not None and signal.has_listeners(sender)
+
+    def send(self, module, sender, **named):
+        signal = self.get(module)
+        if signal is None or not signal.receivers:
+            return []
+        return signal.send(sender, **named)
+
+
 _mutation_signal_params = ["user", "mutation_module",
                            "mutation_class", "mutation_log_id", "data"]
 signal_mutation = dispatch.Signal(_mutation_signal_params)
-signal_mutation_module_validate = {}
-signal_mutation_module_before_mutating = {}
-signal_mutation_module_after_mutating = {}
+signal_mutation_module_validate = ModuleSignals(_mutation_signal_params)
+signal_mutation_module_before_mutating = ModuleSignals(_mutation_signal_params)
+signal_mutation_module_after_mutating = ModuleSignals(_mutation_signal_params + ["error_messages"])
+
+# batch variants (OpenIMISMutation.mutate_batch), sent once per batch with the ids and data of all its mutations.
+# The validation receivers return a list with the errors of each mutation, in the same order as data_list.
+_mutation_batch_signal_params = ["user", "mutation_module", "mutation_class", "mutation_log_ids", "data_list"]
+signal_mutation_batch = dispatch.Signal(_mutation_batch_signal_params)
+signal_mutation_module_validate_batch = ModuleSignals(_mutation_batch_signal_params)
+signal_mutation_module_after_mutating_batch = ModuleSignals(_mutation_batch_signal_params + ["error_messages_list"])
+
 
-for module in sys.modules:
-    signal_mutation_module_validate[module] = dispatch.Signal(_mutation_signal_params)
-    signal_mutation_module_before_mutating[module] = dispatch.Signal(_mutation_signal_params)
-    signal_mutation_module_after_mutating[module] = \
-        dispatch.Signal(_mutation_signal_params + ["error_messages"])
+class BatchItemResult(NamedTuple):
+    """
+    Outcome of a mutation of a batch: the error messages returned by async_mutate or the exception it raised
+    """
+    error_messages: Any
+    exception: Optional[Exception]
 
 
 class OpenIMISMutation(graphene.relay.ClientIDMutation):
@@ -191,6 +303,14 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
 
     internal_id = graphene.Field(graphene.String)
 
+    @classmethod
+    def __init_subclass_with_meta__(cls, **options):
+        super().__init_subclass_with_meta__(**options)
+        # the async tasks find the mutation classes in the registry, only the classes declaring their module are
+        # registered: the subclasses inheriting it (from another module...) are found in their schema
+        if cls.__dict__.get("_mutation_module"):
+            register_mutation_class(cls._mutation_module, cls)
+
     class Input:
         client_mutation_label = graphene.String(max_length=255, required=False)
         client_mutation_details = graphene.List(graphene.String)
@@ -207,50 +327,14 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
             logger.debug(f"Expected input_data to be a dict but got {type(input_data)}")
             return input_data
 
-        # Iterate through the input data dictionary
+        plan = get_coercion_plan(input_class)
         for key, value in input_data.items():
-            if hasattr(input_class, key):
-                # Get the field type from the input class
-                field = getattr(input_class, key)
-                # If the field type is List and the value is a list
-                if field.__class__ == graphene.List and isinstance(value, list):
-                    # Check if the list items need coercion
-                    inner_type = field.of_type
-                    coerced_list = []
-                    for item in value:
-                        if isinstance(inner_type, graphene.types.enum.EnumMeta):
-                            coerced_list.append(item)  # Append the item directly for enums
-                        elif isinstance(item, str):
-                            coerced_list.append(inner_type.parse_value(item))
-                        elif inner_type.__class__ == graphene.utils.subclass_with_meta.SubclassWithMeta_Meta:
-                            coerced_list.append(cls.coerce_mutation_data(item, input_class=inner_type))
-                        else:
-                            coerced_list.append(item)
-                    coerced_data[key] = coerced_list
-                elif field.__class__ == graphene.types.field.Field and isinstance(field.type,
-                                                                                  graphene.types.enum.EnumMeta):
-                    # If the field type is Enum
-                    if hasattr(field.type, value):
-                        coerced_data[key] = str(getattr(field.type, value).value)
-                    else:
-                        coerced_data[key] = value
-                elif field.__class__ == graphene.types.field.Field and isinstance(field.type,
-                                                                                  graphene.types.structures.NonNull) \
-                        and isinstance(field.type._of_type, graphene.types.enum.EnumMeta):
-                    # If the field type is Enum
-                    if hasattr(field.type._of_type, value):
-                        coerced_data[key] = str(getattr(field.type._of_type, value).value)
-                    else:
-                        coerced_data[key] = value
-                elif field.__class__ == graphene.types.field.Field:
-                    coerced_data[key] = cls.coerce_mutation_data(value, input_class=field._type)
-                elif isinstance(value, str):
-                    coerced_data[key] = field.parse_value(value)
-                else:
-                    coerced_data[key] = value
-            else:
+            converter = plan[key]
+            if converter is None:
                 logger.debug(f"key {key} not in {cls.__name__}")
                 coerced_data[key] = value
+            else:
+                coerced_data[key] = converter(value, cls.coerce_mutation_data)
 
         return coerced_data
 
@@ -267,14 +351,13 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
 
     @classmethod
     def mutate_and_get_payload(cls, root, info, **data):
+        json_content, payload = normalize_mutation_data(data)
         mutation_log = MutationLog.objects.create(
-            json_content=json.dumps(data, cls=OpenIMISJSONEncoder),
+            json_content=json_content,
             user_id=info.context.user.id if info.context.user else None,
             client_mutation_id=data.get("client_mutation_id"),
             client_mutation_label=data.get("client_mutation_label"),
-            client_mutation_details=json.dumps(
-                data.get("client_mutation_details"), cls=OpenIMISJSONEncoder
-            )
+            client_mutation_details=dump_json(payload["client_mutation_details"])
             if data.get("client_mutation_details")
             else None,
         )
@@ -290,11 +373,7 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
                 and info.context.user
                 and not info.context.user.is_anonymous
         ):
-            lang = info.context.user.language
-            if isinstance(lang, Language):
-                translation.activate(lang.code)
-            else:
-                translation.activate(lang)
+            activate_language(info.context.user.language)
 
         try:
             logger.debug("[OpenIMISMutation %s] Sending signals", mutation_log.id)
@@ -307,7 +386,8 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
                 mutation_class=cls.__name__,
             )
             results.extend(
-                signal_mutation_module_validate[cls._mutation_module].send(
+                signal_mutation_module_validate.send(
+                    cls._mutation_module,
                     sender=cls,
                     mutation_log_id=mutation_log.id,
                     data=data,
@@ -326,21 +406,19 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
                 mutation_log.mark_as_failed(json.dumps(errors))
                 return cls(internal_id=mutation_log.id)
 
-            signal_mutation_module_before_mutating[cls._mutation_module].send(
-                sender=cls, mutation_log_id=mutation_log.id, data=data, user=info.context.user,
+            signal_mutation_module_before_mutating.send(
+                cls._mutation_module, sender=cls, mutation_log_id=mutation_log.id, data=data, user=info.context.user,
                 mutation_module=cls._mutation_module, mutation_class=cls.__name__
             )
             logger.debug("[OpenIMISMutation %s] before mutate signal sent", mutation_log.id)
             if core.async_mutations:
                 logger.debug("[OpenIMISMutation %s] Sending async mutation", mutation_log.id)
-                openimis_mutation_async.delay(
-                    mutation_log.id, cls._mutation_module, cls.__name__)
+                enqueue_mutation(mutation_log.id, cls._mutation_module, cls.__name__)
             else:
                 logger.debug("[OpenIMISMutation %s] mutating...", mutation_log.id)
                 try:
-                    # mutation_data = data.copy()
-                    mutation_data = cls.coerce_mutation_data(json.loads(
-                        json.dumps(data, cls=OpenIMISJSONEncoder)))  # data.copy()
+                    # normalized again (without the JSON round trip) as the signals may have modified data
+                    mutation_data = cls.coerce_mutation_data(normalize_json(data))
                     mutation_data.pop("mutation_extensions", None)
                     messages = cls.async_mutate(
                         info.context.user if info.context and info.context.user else None,
@@ -368,8 +446,8 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
                     # Record the failure of the mutation but don't include details for security reasons
                     mutation_log.mark_as_failed(f"The mutation threw a {type(exc)}, check logs for details")
                 logger.debug("[OpenIMISMutation %s] send post mutation signal", mutation_log.id)
-                signal_mutation_module_after_mutating[cls._mutation_module].send(
-                    sender=cls, mutation_log_id=mutation_log.id, data=data, user=info.context.user,
+                signal_mutation_module_after_mutating.send(
+                    cls._mutation_module, sender=cls, mutation_log_id=mutation_log.id, data=data, user=info.context.user,
                     mutation_module=cls._mutation_module, mutation_class=cls.__name__,
                     error_messages=error_messages
                 )
@@ -379,6 +457,164 @@ class OpenIMISMutation(graphene.relay.ClientIDMutation):
 
         return cls(internal_id=mutation_log.id)
 
+    @classmethod
+    def mutate_batch(cls, user, inputs, client_mutation_label=None):
+        """
+        Batch entry point for the integrations sending many mutations of the same class: the MutationLog of all the
+        inputs are created with one query, the batch validation signals are sent once (the per mutation signals
+        are still sent for each input if they have receivers) and the mutations are executed by chunks of
+        CoreConfig.mutation_batch_chunk_size, each chunk in a transaction.
+        :param user: the User requesting the mutations
+        :param inputs: list of the mutations data, as they would be passed to mutate_and_get_payload
+        :return: the ids of the MutationLog, in the same order as the inputs
+        """
+        normalized = [normalize_mutation_data(data) for data in inputs]
+        mutation_logs = [
+            MutationLog(
+                json_content=json_content,
+                user_id=user.id if user else None,
+                client_mutation_id=data.get("client_mutation_id"),
+                client_mutation_label=data.get("client_mutation_label") or client_mutation_label,
+                client_mutation_details=dump_json(payload["client_mutation_details"])
+                if data.get("client_mutation_details")
+                else None,
+            )
+            for data, (json_content, payload) in zip(inputs, normalized)
+        ]
+        MutationLog.objects.bulk_create(mutation_logs, batch_size=CoreConfig.mutation_batch_chunk_size)
+        mutation_log_ids = [mutation_log.id for mutation_log in mutation_logs]
+        logger.debug("OpenIMISMutation batch: saved %s mutations, type: %s", len(mutation_log_ids), cls.__name__)
+        if user and not user.is_anonymous:
+            activate_language(user.language)
+
+        try:
+            errors = cls._validate_batch(user, mutation_log_ids, inputs)
+            failed = {mutation_log_id: json.dumps(item_errors)
+                      for mutation_log_id, item_errors in zip(mutation_log_ids, errors) if item_errors}
+            if failed:
+                cls._mark_batch(set(), failed)
+            valid = [(mutation_log_id, data) for mutation_log_id, data in zip(mutation_log_ids, inputs)
+                     if mutation_log_id not in failed]
+            if signal_mutation_module_before_mutating.has_listeners(cls._mutation_module, cls):
+                for mutation_log_id, data in valid:
+                    signal_mutation_module_before_mutating.send(
+                        cls._mutation_module, sender=cls, mutation_log_id=mutation_log_id, data=data, user=user,
+                        mutation_module=cls._mutation_module, mutation_class=cls.__name__
+                    )
+            if not valid:
+                return mutation_log_ids
+            if core.async_mutations:
+                enqueue_mutation_batch(
+                    [mutation_log_id for mutation_log_id, _ in valid], cls._mutation_module, cls.__name__)
+            else:
+                cls.execute_batch(user, valid)
+        except Exception as exc:
+            logger.error("Exception while processing a batch of %s mutations", cls.__name__, exc_info=exc)
+            MutationLog.mark_many_as_failed(
+                {mutation_log_id: str(exc) for mutation_log_id in mutation_log_ids}, only_received=True)
+        return mutation_log_ids
+
+    @classmethod
+    def _validate_batch(cls, user, mutation_log_ids, data_list):
+        """
+        Errors of each mutation of the batch returned by the batch and per mutation validation signals
+        """
+        errors = [[] for _ in data_list]
+        batch_signal_params = dict(sender=cls, mutation_log_ids=mutation_log_ids, data_list=data_list, user=user,
+                                   mutation_module=cls._mutation_module, mutation_class=cls.__name__)
+        results = signal_mutation_batch.send(**batch_signal_params)
+        results.extend(signal_mutation_module_validate_batch.send(cls._mutation_module, **batch_signal_params))
+        for _receiver, batch_errors in results:
+            for item_errors, receiver_errors in zip(errors, batch_errors or []):
+                item_errors.extend(receiver_errors or [])
+
+        signals = [signal_mutation] if signal_mutation.has_listeners(cls) else []
+        if signal_mutation_module_validate.has_listeners(cls._mutation_module, cls):
+            signals.append(signal_mutation_module_validate[cls._mutation_module])
+        for signal in signals:
+            for item_errors, mutation_log_id, data in zip(errors, mutation_log_ids, data_list):
+                results = signal.send(
+                    sender=cls, mutation_log_id=mutation_log_id, data=data, user=user,
+                    mutation_module=cls._mutation_module, mutation_class=cls.__name__,
+                )
+                item_errors.extend(err for r in results for err in r[1])
+        return errors
+
+    @classmethod
+    def execute_batch(cls, user, items):
+        """
+        Executes the mutations of a batch, by chunks of CoreConfig.mutation_batch_chunk_size in a transaction (with a
+        savepoint per mutation). Their MutationLog status is updated with one query per chunk and outcome.
+        :param items: list of (MutationLog id, data)
+        """
+        chunk_size = CoreConfig.mutation_batch_chunk_size
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            successful = set()
+            failed = {}
+            error_messages_list = []
+            with transaction.atomic():
+                for mutation_log_id, data in chunk:
+                    result = cls._execute_batch_item(user, mutation_log_id, data)
+                    # as for a single mutation, the after mutating receivers get the exception as error_messages
+                    error_messages_list.append(result.exception or result.error_messages)
+                    if result.exception is not None:
+                        failed[mutation_log_id] = \
+                            f"The mutation threw a {type(result.exception)}, check logs for details"
+                    elif result.error_messages:
+                        failed[mutation_log_id] = cls._errors_json(result.error_messages)
+                    else:
+                        successful.add(mutation_log_id)
+                cls._mark_batch(successful, failed)
+            if signal_mutation_module_after_mutating.has_listeners(cls._mutation_module, cls):
+                for (mutation_log_id, data), error_messages in zip(chunk, error_messages_list):
+                    signal_mutation_module_after_mutating.send(
+                        cls._mutation_module, sender=cls, mutation_log_id=mutation_log_id, data=data, user=user,
+                        mutation_module=cls._mutation_module, mutation_class=cls.__name__,
+                        error_messages=error_messages
+                    )
+            signal_mutation_module_after_mutating_batch.send(
+                cls._mutation_module, sender=cls, mutation_log_ids=[mutation_log_id for mutation_log_id, _ in chunk],
+                data_list=[data for _, data in chunk], user=user, mutation_module=cls._mutation_module,
+                mutation_class=cls.__name__, error_messages_list=error_messages_list
+            )
+
+    @classmethod
+    def _execute_batch_item(cls, user, mutation_log_id, data):
+        """
+        Executes one mutation of a batch in a savepoint, returns a BatchItemResult
+        """
+        try:
+            with transaction.atomic():
+                mutation_data = cls.coerce_mutation_data(normalize_json(data))
+                mutation_data.pop("mutation_extensions", None)
+                messages = cls.async_mutate(user, **mutation_data)
+        except Exception as exc:
+            # the savepoint of the mutation is rolled back, the rest of the chunk goes on
+            logger.error("[OpenIMISMutation %s] async_mutate threw an exception", mutation_log_id, exc_info=exc)
+            return BatchItemResult(error_messages=None, exception=exc)
+        if mutation_data.get('autogenerate', False) and isinstance(messages, Dict):
+            messages = None
+        return BatchItemResult(error_messages=messages, exception=None)
+
+    @staticmethod
+    def _errors_json(error_messages):
+        if not isinstance(error_messages, list):
+            return json.dumps(error_messages, cls=OpenIMISJSONEncoder)
+        exceptions = [message.pop("exc") for message in error_messages
+                      if isinstance(message, dict) and "exc" in message]
+        for exc in exceptions:
+            logger.error("Mutation exception:", exc_info=exc)
+        return json.dumps(error_messages, cls=OpenIMISJSONEncoder)
+
+    @staticmethod
+    def _mark_batch(successful, failed):
+        """
+        Status of the MutationLog of a batch, one UPDATE for the successful ones and one for the failed ones
+        """
+        MutationLog.mark_many_as_successful(successful)
+        MutationLog.mark_many_as_failed(failed)
+
 
 class FieldControlGQLType(DjangoObjectType):
     class Meta:
@@ -402,7 +638,34 @@ class OrderedDjangoFilterConnectionField(DjangoFilterConnectionField):
     mutation_logs = OrderedDjangoFilterConnectionField(MutationLogGQLType,
         orderBy=graphene.List(of_type=graphene.String))
     ```
+    The total count is only computed if totalCount is selected, according to the count_strategy of the field:
+    exact (COUNT(*) on every page), estimate (planner estimate on PostgreSQL, if above gql_count_estimate_threshold)
+    or cached (exact count, cached for gql_count_cache_ttl seconds per query).
+    With keyset=True, the field gets a keysetPagination argument: when true (or when paginating from a keyset
+    cursor), the cursors encode the orderBy values of the rows instead of their offset (see
+    core.gql.keyset_pagination), except when the offset argument is given. Without it, the offset cursors and the
+    ordering (NULLs position) of the database are kept.
     """
+    COUNT_EXACT = "exact"
+    COUNT_ESTIMATE = "estimate"
+    COUNT_CACHED = "cached"
+
+    def __init__(self, *args, count_strategy=COUNT_EXACT, keyset=False, **kwargs):
+        self.count_strategy = count_strategy
+        self.keyset = keyset
+        if keyset:
+            kwargs.setdefault("keyset_pagination", graphene.Boolean(
+                description="Keyset cursors (NULLs sorted last) instead of the offset cursors"))
+        super().__init__(*args, **kwargs)
+
+    def get_resolver(self, parent_resolver):
+        resolver = super().get_resolver(parent_resolver)
+        options = {}
+        if self.count_strategy != self.COUNT_EXACT:
+            options["count_strategy"] = self.count_strategy
+        if self.keyset:
+            options["keyset"] = True
+        return partial(resolver, **options) if options else resolver
 
     @classmethod
     def _filter_order_by(cls, order_by: str) -> str:
@@ -413,10 +676,137 @@ class OrderedDjangoFilterConnectionField(DjangoFilterConnectionField):
 
     @classmethod
     @anonymize_gql()
-    def resolve_connection(cls, connection, args, iterable, max_limit=None, user=None):
-        return super(DjangoFilterConnectionField, cls).resolve_connection(
-            connection, args, iterable, max_limit
+    def resolve_connection(cls, connection, args, iterable, max_limit=None, user=None,
+                           count_strategy=COUNT_EXACT, count_needed=True, keyset=False):
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return super(DjangoFilterConnectionField, cls).resolve_connection(
+                connection, args, iterable, max_limit
+            )
+
+        if keyset and args.get("offset") is None:
+            keyset_page = keyset_connection(connection, args, iterable, max_limit)
+            if keyset_page is not None:
+                keyset_page.iterable = iterable
+                keyset_page.length = cls.count(iterable, count_strategy) if count_needed else None
+                return keyset_page
+
+        # Same as DjangoConnectionField.resolve_connection, except for the count
+        offset = args.pop("offset", None)
+        after = args.get("after")
+        if offset:
+            if after:
+                offset += cursor_to_offset(after) + 1
+            # input offset starts at 1 while the graphene offset starts at 0
+            args["after"] = offset_to_cursor(offset - 1)
+
+        if not count_needed and "last" not in args and not args.get("before") \
+                and (args.get("first") is not None or max_limit is not None):
+            # no count: fetch one more row than requested to know if there is a next page
+            if args.get("first") is None:
+                args["first"] = max_limit
+            after = get_offset_with_default(args.get("after"), -1) + 1
+            page = list(iterable[after:after + args["first"] + 1])
+            connection = connection_from_list_slice(
+                page,
+                args,
+                slice_start=after,
+                list_length=after + len(page),
+                list_slice_length=len(page),
+                connection_type=connection,
+                edge_type=connection.Edge,
+                pageinfo_type=PageInfo,
+            )
+            connection.iterable = iterable
+            connection.length = None
+            return connection
+
+        list_length = cls.count(iterable, count_strategy)
+        list_slice_length = (
+            min(max_limit, list_length) if max_limit is not None else list_length
+        )
+        after = min(get_offset_with_default(args.get("after"), -1) + 1, list_length)
+
+        if max_limit is not None and "first" not in args:
+            if "last" in args:
+                args["first"] = list_length
+                list_slice_length = list_length
+            else:
+                args["first"] = max_limit
+
+        connection = connection_from_list_slice(
+            iterable[after:],
+            args,
+            slice_start=after,
+            list_length=list_length,
+            list_slice_length=list_slice_length,
+            connection_type=connection,
+            edge_type=connection.Edge,
+            pageinfo_type=PageInfo,
         )
+        connection.iterable = iterable
+        connection.length = list_length
+        return connection
+
+    @classmethod
+    def count(cls, queryset, count_strategy=COUNT_EXACT):
+        if count_strategy == cls.COUNT_ESTIMATE:
+            estimate = cls._estimate_count(queryset)
+            if estimate is not None and estimate > CoreConfig.gql_count_estimate_threshold:
+                return estimate
+        elif count_strategy == cls.COUNT_CACHED:
+            try:
+                sql, params = queryset.query.sql_with_params()
+            except EmptyResultSet:
+                return 0
+            cache_name = "gql_count_" + hashlib.sha256(
+                ("%s|%r|%s" % (queryset.db, params, sql)).encode("utf-8")).hexdigest()
+            list_length = cache.get(cache_name)
+            if list_length is None:
+                list_length = queryset.count()
+                cache.set(cache_name, list_length, CoreConfig.gql_count_cache_ttl)
+            return list_length
+        return queryset.count()
+
+    @classmethod
+    def _estimate_count(cls, queryset):
+        db_connection = connections[queryset.db]
+        if db_connection.vendor != "postgresql":
+            return None
+        try:
+            sql, params = queryset.order_by().query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        try:
+            # in a savepoint: a failed statement would otherwise abort the transaction of the request
+            with transaction.atomic(using=queryset.db), db_connection.cursor() as cursor:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cursor.fetchone()[0]
+        except Exception:
+            logger.warning("Failed to estimate count of %s", queryset.model.__name__, exc_info=True)
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @staticmethod
+    def _is_field_selected(info, field_name):
+        selections = [
+            selection for field_ast in info.field_asts if field_ast.selection_set
+            for selection in field_ast.selection_set.selections
+        ]
+        while selections:
+            selection = selections.pop()
+            if isinstance(selection, gql_ast.Field):
+                if selection.name.value == field_name:
+                    return True
+            elif isinstance(selection, gql_ast.FragmentSpread):
+                fragment = info.fragments.get(selection.name.value)
+                if fragment:
+                    selections.extend(fragment.selection_set.selections)
+            elif isinstance(selection, gql_ast.InlineFragment):
+                selections.extend(selection.selection_set.selections)
+        return False
 
     @classmethod
     def connection_resolver(
@@ -429,12 +819,17 @@ class OrderedDjangoFilterConnectionField(DjangoFilterConnectionField):
             enforce_first_or_last,
             root,
             info,
+            count_strategy=COUNT_EXACT,
+            keyset=False,
             **args
     ):
         first = args.get("first")
         last = args.get("last")
         offset = args.get("offset")
         before = args.get("before")
+        # opt-in, the clients paginating from a keyset cursor keep them
+        keyset = keyset and bool(args.pop("keyset_pagination", False) or is_keyset_cursor(args.get("after"))
+                                 or is_keyset_cursor(before))
 
         if enforce_first_or_last:
             assert first or last, (
@@ -469,7 +864,9 @@ class OrderedDjangoFilterConnectionField(DjangoFilterConnectionField):
         iterable = queryset_resolver(connection, iterable, info, args)
         on_resolve = partial(
             cls.resolve_connection, connection, args,
-            max_limit=max_limit, user=info.context.user
+            max_limit=max_limit, user=info.context.user,
+            count_strategy=count_strategy, count_needed=cls._is_field_selected(info, "totalCount"),
+            keyset=keyset
         )
 
         if Promise.is_thenable(iterable):
@@ -556,6 +953,58 @@ class MutationLogGQLType(DjangoObjectType):
         return queryset
 
 
+_modules_permissions_catalogue = None
+
+
+def _build_modules_permissions_catalogue():
+    excluded_app = [
+        "health_check.cache", "health_check", "health_check.db",
+        "test_without_migrations", "test_without_migrations",
+        "rules", "graphene_django", "rest_framework",
+        "health_check.storage", "channels", "graphql_jwt.refresh_token.apps.RefreshTokenConfig"
+    ]
+    all_apps = [app for app in settings.INSTALLED_APPS if not app.startswith("django") and app not in excluded_app]
+    config = []
+    for app in all_apps:
+        apps = __import__(f"{app}.apps")
+        is_default_cfg = hasattr(apps.apps, 'DEFAULT_CFG')
+        is_defaulf_config = hasattr(apps.apps, 'DEFAULT_CONFIG')
+        if is_default_cfg or is_defaulf_config:
+            if is_defaulf_config:
+                config_dict = ModuleConfiguration.get_or_default(f"{app}", apps.apps.DEFAULT_CONFIG)
+            else:
+                config_dict = ModuleConfiguration.get_or_default(f"{app}", apps.apps.DEFAULT_CFG)
+            permission = []
+            config_dict = flatten_dict(config_dict)
+            for key, value in config_dict.items():
+                if key.endswith("_perms"):
+                    if isinstance(value, list):
+                        for val in value:
+                            permission.append(PermissionOpenImisGQLType(
+                                perms_name=key,
+                                perms_value=val,
+                            ))
+            config.append(ModulePermissionGQLType(
+                module_name=app,
+                permissions=tuple(permission),
+            ))
+    return ModulePermissionsListGQLType(tuple(config))
+
+
+def get_modules_permissions_catalogue():
+    """
+    The permissions declared in the configuration of every installed module. The catalogue is built once and only
+    rebuilt when a module configuration changes: it is shared between requests and must not be altered.
+    """
+    global _modules_permissions_catalogue
+    generation = ModuleConfiguration.get_registry_generation()
+    if generation is None:
+        return _build_modules_permissions_catalogue()
+    if _modules_permissions_catalogue is None or _modules_permissions_catalogue[0] != generation:
+        _modules_permissions_catalogue = (generation, _build_modules_permissions_catalogue())
+    return _modules_permissions_catalogue[1]
+
+
 UT_INTERACTIVE = "INTERACTIVE"
 UT_TECHNICAL = "TECHNICAL"
 UT_OFFICER = "OFFICER"
@@ -579,7 +1028,7 @@ class Query(graphene.ObjectType):
     eo_obligatory_fields = GenericScalar()
 
     mutation_logs = OrderedDjangoFilterConnectionField(
-        MutationLogGQLType, orderBy=graphene.List(of_type=graphene.String))
+        MutationLogGQLType, orderBy=graphene.List(of_type=graphene.String), keyset=True)
 
     role = OrderedDjangoFilterConnectionField(
         RoleGQLType,
@@ -593,7 +1042,8 @@ class Query(graphene.ObjectType):
     )
 
     role_right = OrderedDjangoFilterConnectionField(
-        RoleRightGQLType, orderBy=graphene.List(of_type=graphene.String), validity=graphene.Date(), max_limit=None
+        RoleRightGQLType, orderBy=graphene.List(of_type=graphene.String), validity=graphene.Date(), max_limit=None,
+        keyset=True
     )
 
     interactiveUsers = OrderedDjangoFilterConnectionField(
@@ -604,6 +1054,7 @@ class Query(graphene.ObjectType):
 
     users = OrderedDjangoFilterConnectionField(
         UserGQLType,
+        keyset=True,
         orderBy=graphene.List(of_type=graphene.String),
         validity=graphene.Date(),
         client_mutation_id=graphene.String(),
@@ -745,11 +1196,7 @@ class Query(graphene.ObjectType):
 
         if search is not None:
             return gql_optimizer.query(
-                Officer.objects.filter(
-                    Q(code__icontains=search)
-                    | Q(last_name__icontains=search)
-                    | Q(other_names__icontains=search)
-                ),
+                Officer.objects.filter(text_search_filter(["code", "last_name", "other_names"], search)),
                 info,
             )
 
@@ -772,10 +1219,8 @@ class Query(graphene.ObjectType):
 
         query_str = kwargs.get('str', None)
         if query_str:
-            queryset = queryset.filter(Q(code__istartswith=query_str)
-                                       | Q(last_name__istartswith=query_str)
-                                       | Q(other_names__istartswith=query_str)
-                                       | Q(email__istartswith=query_str))
+            queryset = queryset.filter(
+                text_search_filter(["code", "last_name", "other_names", "email"], query_str, prefix=True))
 
         return queryset.prefetch_related('officer_villages') \
             .annotate(nb_village=Count('officer_villages')) \
@@ -824,8 +1269,18 @@ class Query(graphene.ObjectType):
         if not info.context.user.has_perms(CoreConfig.gql_query_users_perms):
             raise PermissionError("Unauthorized")
 
+        if CoreConfig.user_search_index_enabled:
+            return Query._search_users_in_index(
+                email=email, last_name=last_name, other_names=other_names, phone=phone, role_id=role_id,
+                roles=roles, health_facility_id=health_facility_id, region_id=region_id, district_id=district_id,
+                municipality_id=municipality_id, birth_date_from=birth_date_from, birth_date_to=birth_date_to,
+                user_types=user_types, language=language, village_id=village_id, region_ids=region_ids,
+                parent_location=parent_location, parent_location_level=parent_location_level, **kwargs)
+
         user_filters = []
-        user_query = User.objects.exclude(t_user__isnull=False)
+        # the per-row fields read the user type of each row, the health facilities and roles are then batched by the
+        # dataloaders of UserGQLType and InteractiveUserGQLType
+        user_query = User.objects.exclude(t_user__isnull=False).select_related("i_user", "officer", "claim_admin")
 
         show_deleted = kwargs.get('showDeleted', False)
         if not show_deleted and not kwargs.get('id', None):
@@ -834,13 +1289,13 @@ class Query(graphene.ObjectType):
 
         text_search = kwargs.get("str")  # Poorly chosen name, avoid of shadowing "str"
         if text_search:
-            user_filters.append(Q(username__icontains=text_search) |
-                                Q(i_user__last_name__icontains=text_search) |
-                                Q(officer__last_name__icontains=text_search) |
-                                Q(claim_admin__last_name__icontains=text_search) |
-                                Q(i_user__other_names__icontains=text_search) |
-                                Q(officer__other_names__icontains=text_search) |
-                                Q(claim_admin__other_names__icontains=text_search) |
+            user_filters.append(text_search_filter(["username",
+                                                    "i_user__last_name",
+                                                    "officer__last_name",
+                                                    "claim_admin__last_name",
+                                                    "i_user__other_names",
+                                                    "officer__other_names",
+                                                    "claim_admin__other_names"], text_search) |
                                 Q(i_user__email=text_search) |
                                 Q(officer__email=text_search) |
                                 Q(claim_admin__email_id=text_search)
@@ -921,6 +1376,90 @@ class Query(graphene.ObjectType):
         # explicitly requested in the GraphQL response. However, this prevents the dynamic remapping of the User object.
         return user_query.filter(*user_filters).distinct()
 
+    @staticmethod
+    def _search_users_in_index(email=None, last_name=None, other_names=None, phone=None, role_id=None, roles=None,
+                               health_facility_id=None, region_id=None, district_id=None, municipality_id=None,
+                               birth_date_from=None, birth_date_to=None, user_types=None, language=None,
+                               village_id=None, region_ids=None, parent_location=None, parent_location_level=None,
+                               **kwargs):
+        """
+        Same filters as resolve_users, but the ones on multi-valued or OR-ed relations are done on the
+        core_UserSearchIndex table, which avoids the joins and the DISTINCT.
+        """
+        user_filters = []
+        index_filters = []
+        user_query = User.objects.exclude(t_user__isnull=False).select_related("i_user", "officer", "claim_admin")
+
+        show_deleted = kwargs.get('showDeleted', False)
+        if not show_deleted and not kwargs.get('id', None):
+            user_filters.append(Q(i_user__isnull=True) | Q(*filter_validity(prefix='i_user__')))
+
+        text_search = kwargs.get("str")  # Poorly chosen name, avoid of shadowing "str"
+        if text_search:
+            normalized_search = UserSearchIndex.normalize(text_search)
+            index_filters.append(text_search_filter(["username", "last_names", "other_names"], normalized_search) |
+                                 UserSearchIndex.has_token("emails", text_search))
+
+        client_mutation_id = kwargs.get("client_mutation_id", None)
+        if client_mutation_id:
+            user_filters.append(Q(id__in=UserMutation.objects.filter(
+                mutation__client_mutation_id=client_mutation_id).values("core_user_id")))
+
+        if email:
+            index_filters.append(UserSearchIndex.has_token("emails", email))
+        if phone:
+            index_filters.append(UserSearchIndex.has_token("phones", phone))
+        if last_name:
+            index_filters.append(Q(last_names__contains=UserSearchIndex.normalize(last_name)))
+        if other_names:
+            index_filters.append(Q(other_names__contains=UserSearchIndex.normalize(other_names)))
+        if language:
+            user_filters.append(Q(i_user__language=language))
+        if health_facility_id:
+            index_filters.append(UserSearchIndex.has_token("health_facility_ids", health_facility_id))
+        if birth_date_from:
+            index_filters.append(Q(max_birth_date__gte=birth_date_from))
+        if birth_date_to:
+            index_filters.append(Q(min_birth_date__lte=birth_date_to))
+        if role_id:
+            index_filters.append(UserSearchIndex.has_token("role_ids", role_id))
+        if roles:
+            index_filters.append(UserSearchIndex.has_any_token("role_ids", roles))
+        if parent_location and parent_location_level is not None:
+            location_fields = {0: "region_ids", 1: "district_ids", 2: "municipality_ids", 3: "village_ids"}
+            if parent_location_level in location_fields:
+                from location.models import Location
+                location_ids = Location.objects.filter(uuid=parent_location).values_list("id", flat=True)
+                index_filters.append(UserSearchIndex.has_any_token(location_fields[parent_location_level],
+                                                                   location_ids))
+            else:
+                user_filters.append(None)
+        else:
+            if region_id:
+                index_filters.append(UserSearchIndex.has_token("region_ids", region_id))
+            elif region_ids:
+                index_filters.append(UserSearchIndex.has_any_token("region_ids", region_ids))
+
+            if district_id:
+                index_filters.append(UserSearchIndex.has_token("district_ids", district_id))
+            if municipality_id:
+                index_filters.append(UserSearchIndex.has_token("municipality_ids", municipality_id))
+            if village_id:
+                index_filters.append(UserSearchIndex.has_token("village_ids", village_id))
+
+        if user_types:
+            ut_conditions = {
+                UT_INTERACTIVE: Q(is_interactive=True),
+                UT_OFFICER: Q(is_officer=True),
+                UT_TECHNICAL: Q(is_technical=True),
+                UT_CLAIM_ADMIN: Q(is_claim_admin=True),
+            }
+            index_filters.append(reduce(lambda a, b: a | b, [ut_conditions[x] for x in user_types]))
+
+        if index_filters:
+            user_filters.append(Q(id__in=UserSearchIndex.objects.filter(*index_filters).values("user_id")))
+        return user_query.filter(*user_filters)
+
     def resolve_role(self, info, **kwargs):
         if not info.context.user.has_perms(CoreConfig.gql_query_roles_perms):
             raise PermissionError("Unauthorized")
@@ -933,7 +1472,7 @@ class Query(graphene.ObjectType):
 
         text_search = kwargs.get("str")
         if text_search:
-            filters.append(Q(name__icontains=text_search))
+            filters.append(text_search_filter(["name"], text_search))
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
@@ -973,38 +1512,7 @@ class Query(graphene.ObjectType):
     def resolve_modules_permissions(self, info, **kwargs):
         if not info.context.user.has_perms(CoreConfig.gql_query_roles_perms):
             raise PermissionError("Unauthorized")
-        excluded_app = [
-            "health_check.cache", "health_check", "health_check.db",
-            "test_without_migrations", "test_without_migrations",
-            "rules", "graphene_django", "rest_framework",
-            "health_check.storage", "channels", "graphql_jwt.refresh_token.apps.RefreshTokenConfig"
-        ]
-        all_apps = [app for app in settings.INSTALLED_APPS if not app.startswith("django") and app not in excluded_app]
-        config = []
-        for app in all_apps:
-            apps = __import__(f"{app}.apps")
-            is_default_cfg = hasattr(apps.apps, 'DEFAULT_CFG')
-            is_defaulf_config = hasattr(apps.apps, 'DEFAULT_CONFIG')
-            if is_default_cfg or is_defaulf_config:
-                if is_defaulf_config:
-                    config_dict = ModuleConfiguration.get_or_default(f"{app}", apps.apps.DEFAULT_CONFIG)
-                else:
-                    config_dict = ModuleConfiguration.get_or_default(f"{app}", apps.apps.DEFAULT_CFG)
-                permission = []
-                config_dict = flatten_dict(config_dict)
-                for key, value in config_dict.items():
-                    if key.endswith("_perms"):
-                        if isinstance(value, list):
-                            for val in value:
-                                permission.append(PermissionOpenImisGQLType(
-                                    perms_name=key,
-                                    perms_value=val,
-                                ))
-                config.append(ModulePermissionGQLType(
-                    module_name=app,
-                    permissions=permission,
-                ))
-        return ModulePermissionsListGQLType(list(config))
+        return get_modules_permissions_catalogue()
 
     def resolve_custom_filters(self, info, **kwargs):
         user = info.context.user
@@ -1122,6 +1630,8 @@ def update_or_create_role(data, user):
             now = datetime.datetime.now()
             role_rights_currently_assigned = RoleRight.objects.filter(role_id=role.id)
             role_rights_currently_assigned.update(validity_to=now)
+            # update() doesn't send post_save, the cached rights of the role's users have to be invalidated here
+            bump_role_generations([role.id])
             role_rights_currently_assigned = role_rights_currently_assigned.values_list('right_id', flat=True)
             for right_id in rights_id:
                 if right_id not in role_rights_currently_assigned:
@@ -1,10 +1,28 @@
+import functools
+import logging
 import queue
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 from django import dispatch
+from django.db import connections, transaction
+from django.dispatch.dispatcher import _make_id
 from typing import Callable
 
+from core.apps import CoreConfig
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# (signal name, "before"|"after", receiver) -> [calls, total seconds, max seconds], when service_signal_timing is set
+RECEIVER_TIMINGS = {}
+_timings_lock = threading.Lock()
+
 
 class ServiceSignalBindType(Enum):
     BEFORE = 0
@@ -12,9 +30,91 @@ class ServiceSignalBindType(Enum):
     BEFORE_AND_AFTER = 2
 
 
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=CoreConfig.service_signal_workers,
+                                               thread_name_prefix="service_signal")
+    return _executor
+
+
+def _receiver_name(func):
+    return f"{getattr(func, '__module__', '?')}.{getattr(func, '__qualname__', repr(func))}"
+
+
+def _run_detached(func, sender, kwargs):
+    try:
+        func(sender=sender, **kwargs)
+    except Exception:
+        logger.exception("Non-blocking service signal receiver %s failed", _receiver_name(func))
+    finally:
+        # the pool threads outlive the receivers, their connections must not
+        connections.close_all()
+
+
+def _submit_detached(func, sender, kwargs):
+    try:
+        future = _get_executor().submit(_run_detached, func, sender, kwargs)
+    except RuntimeError:
+        # interpreter shutting down
+        logger.exception("Non-blocking service signal receiver %s could not be scheduled", _receiver_name(func))
+        return
+
+    def log_failure(done):
+        if done.cancelled():
+            logger.warning("Non-blocking service signal receiver %s was cancelled", _receiver_name(func))
+        elif done.exception() is not None:
+            logger.error("Non-blocking service signal receiver %s failed", _receiver_name(func),
+                         exc_info=done.exception())
+
+    future.add_done_callback(log_failure)
+
+
+class ServiceSignalReceiver:
+    """
+    Receiver connected to the service signals, calling func:
+    * if blocking is False, in the service signals thread pool once the current transaction is committed. Its result
+      is then not part of the signal results.
+    * timed, if CoreConfig.service_signal_timing is set (see RECEIVER_TIMINGS)
+    """
+
+    def __init__(self, func, signal_name, kind, blocking=True):
+        self.func = func
+        self.signal_name = signal_name
+        self.kind = kind
+        self.blocking = blocking
+        functools.update_wrapper(self, func)
+
+    def __call__(self, sender, **kwargs):
+        if not self.blocking:
+            transaction.on_commit(lambda: _submit_detached(self.func, sender, kwargs))
+            return None
+        if not CoreConfig.service_signal_timing:
+            return self.func(sender=sender, **kwargs)
+        start = time.perf_counter()
+        try:
+            return self.func(sender=sender, **kwargs)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def _record(self, duration):
+        name = _receiver_name(self.func)
+        with _timings_lock:
+            timing = RECEIVER_TIMINGS.setdefault((self.signal_name, self.kind, name), [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += duration
+            timing[2] = max(timing[2], duration)
+        threshold = CoreConfig.service_signal_slow_threshold_ms
+        if threshold and duration * 1000 > threshold:
+            logger.warning("Service signal %s (%s) receiver %s took %.1fms",
+                           self.signal_name, self.kind, name, duration * 1000)
+
+
 class RegisteredServiceSignal:
 
-    def __init__(self, providing_args=None):
+    def __init__(self, providing_args=None, name=None):
         """
         Due to how python manage class prototypes, there's a chance that class definition using register_service_signal
         will not be loaded until first import of given class. Therefore, it's likely that binding function responsible
@@ -22,6 +122,7 @@ class RegisteredServiceSignal:
         are queued and connected to actual signal after the registration. Whether registration took place
         is defined by providing_args. If argument is None, signal is considered not registered.
         """
+        self.name = name
         self.__signal_results = {'before': None, 'after': None}
         self.__connection_queue = {type_: queue.Queue() for type_ in ServiceSignalBindType}
         self.__signals_before = []
@@ -41,6 +142,12 @@ class RegisteredServiceSignal:
             'after': self.__signals_after
         }
 
+    def has_receivers_before(self):
+        return bool(self.__before_service_signal.receivers)
+
+    def has_receivers_after(self):
+        return bool(self.__after_service_signal.receivers)
+
     def send_signal_before(self, sender, **signal_call_args):
         result = self.before_service_signal.send(sender=sender, **signal_call_args)
         self.__signal_results['before'] = result
@@ -49,6 +156,13 @@ class RegisteredServiceSignal:
         result = self.after_service_signal.send(sender=sender, **signal_call_args)
         self.__signal_results['after'] = result
 
+    def clear_signal_results(self, *kinds):
+        """
+        Empties the results of the signals not sent ('before' and/or 'after', both by default)
+        """
+        for kind in kinds or ('before', 'after'):
+            self.__signal_results[kind] = []
+
     @property
     def signal_results(self):
         return self.__signal_results
@@ -61,11 +175,12 @@ class RegisteredServiceSignal:
     def after_service_signal(self):
         return self.__after_service_signal
 
-    def connect_signal(self, func: Callable, bind_type: ServiceSignalBindType = ServiceSignalBindType.BEFORE_AND_AFTER):
+    def connect_signal(self, func: Callable, bind_type: ServiceSignalBindType = ServiceSignalBindType.BEFORE_AND_AFTER,
+                       blocking=True):
         if self.is_signal_registered():
-            self._add_connection(func, bind_type)
+            self._add_connection(func, bind_type, blocking)
         else:
-            self.__connection_queue[bind_type].put(func)
+            self.__connection_queue[bind_type].put((func, blocking))
 
     def register_signal(self, providing_args):
         if self.is_signal_registered():
@@ -78,22 +193,28 @@ class RegisteredServiceSignal:
     def is_signal_registered(self):
         return self.__before_service_signal is not None and self.__after_service_signal is not None
 
-    def _add_connection(self, func, bind_type):
+    def _add_connection(self, func, bind_type, blocking=True):
         if bind_type == ServiceSignalBindType.BEFORE:
-            self.__before_service_signal.connect(func)
+            self._connect_receiver(self.__before_service_signal, func, "before", blocking)
             self.__signals_before.append(func)
         elif bind_type == ServiceSignalBindType.AFTER:
-            self.__after_service_signal.connect(func)
+            self._connect_receiver(self.__after_service_signal, func, "after", blocking)
             self.__signals_after.append(func)
         elif bind_type == ServiceSignalBindType.BEFORE_AND_AFTER:
-            self.__before_service_signal.connect(func)
-            self.__after_service_signal.connect(func)
+            self._connect_receiver(self.__before_service_signal, func, "before", blocking)
+            self._connect_receiver(self.__after_service_signal, func, "after", blocking)
             self.__signals_after.append(func)
             self.__signals_before.append(func)
         else:
             raise AttributeError(f"Invalid bind_type {bind_type}, should be one of {ServiceSignalBindType}.")
 
+    def _connect_receiver(self, signal, func, kind, blocking):
+        # the wrapper is only referenced by the signal, hence weak=False. The dispatch_uid of func keeps a function
+        # from being connected twice, as when it was connected directly.
+        signal.connect(ServiceSignalReceiver(func, self.name, kind, blocking), weak=False, dispatch_uid=_make_id(func))
+
     def _connect_queued(self):
         for binding_type, awaiting_queue in self.__connection_queue.items():
             while not awaiting_queue.empty():
-                self.connect_signal(awaiting_queue.get(), binding_type)
+                func, blocking = awaiting_queue.get()
+                self.connect_signal(func, binding_type, blocking)
@@ -0,0 +1,138 @@
+import logging
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Q
+
+from core.models.user import User, UserRole, UserSearchIndex
+from core.utils import on_commit_batch
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_INDEX_FIELDS = [field.name for field in UserSearchIndex._meta.concrete_fields if not field.primary_key]
+
+
+def schedule_user_search_index_update(user_ids=(), i_user_ids=(), officer_ids=(), claim_admin_ids=()):
+    """
+    Queues the refresh of the search index of the given users (core User, InteractiveUser, Officer or ClaimAdmin ids).
+    The refresh is done once, when the current transaction is committed. The index is maintained even while
+    user_search_index_enabled is off, so that it is up to date whenever it gets enabled.
+    """
+    keys = [("id", key) for key in user_ids] + [("i_user_id", key) for key in i_user_ids] \
+        + [("officer_id", key) for key in officer_ids] + [("claim_admin_id", key) for key in claim_admin_ids]
+    if keys:
+        on_commit_batch("core.user_search_index", keys, _update_pending)
+
+
+def _update_pending(keys):
+    by_field = {}
+    for field, key in keys:
+        by_field.setdefault(field, set()).add(key)
+    condition = Q(pk__in=[])
+    for field, field_keys in by_field.items():
+        condition |= Q(**{"%s__in" % field: field_keys})
+    try:
+        update_user_search_index(User.objects.filter(condition).values_list("id", flat=True))
+    except Exception:
+        logger.exception("Failed to update the users search index")
+
+
+def update_user_search_index(user_ids=None):
+    """
+    Rebuilds the search index rows of the given core Users, of all users if user_ids is None
+    """
+    if user_ids is None:
+        user_ids = User.objects.order_by("id").values_list("id", flat=True)
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        _update_batch(user_ids[start:start + BATCH_SIZE])
+    return len(user_ids)
+
+
+def _update_batch(user_ids):
+    users = list(User.objects.filter(id__in=user_ids).select_related("i_user", "officer", "claim_admin"))
+    i_user_ids = [user.i_user_id for user in users if user.i_user_id]
+    officer_ids = [user.officer_id for user in users if user.officer_id]
+
+    roles = _group(UserRole.objects
+                   .filter(user_id__in=i_user_ids, validity_to__isnull=True)
+                   .values_list("user_id", "role_id"))
+    districts = {}
+    villages = {}
+    if apps.is_installed("location"):
+        user_district_class = apps.get_model("location", "UserDistrict")
+        officer_village_class = apps.get_model("location", "OfficerVillage")
+        districts = _group(user_district_class.objects
+                           .filter(user_id__in=i_user_ids)
+                           .values_list("user_id", "location_id", "location__parent_id"))
+        villages = _group(officer_village_class.objects
+                          .filter(officer_id__in=officer_ids)
+                          .values_list("officer_id", "location_id", "location__parent_id"))
+
+    rows = [_index_row(user, roles, districts, villages) for user in users]
+    with transaction.atomic():
+        _upsert(rows)
+        UserSearchIndex.objects.filter(user_id__in=set(user_ids) - {user.id for user in users}).delete()
+
+
+def _upsert(rows):
+    # rows are updated in place rather than deleted and created again, which would race with concurrent updates
+    existing = set(UserSearchIndex.objects
+                   .filter(user_id__in=[row.user_id for row in rows])
+                   .values_list("user_id", flat=True))
+    new_rows = [row for row in rows if row.user_id not in existing]
+    UserSearchIndex.objects.bulk_update([row for row in rows if row.user_id in existing], _INDEX_FIELDS)
+    if new_rows:
+        UserSearchIndex.objects.bulk_create(new_rows, ignore_conflicts=True)
+        # the rows inserted concurrently in the meantime were skipped, they get the values computed here
+        UserSearchIndex.objects.bulk_update(new_rows, _INDEX_FIELDS)
+
+
+def _group(rows):
+    grouped = {}
+    for key, *values in rows:
+        grouped.setdefault(key, []).append(values[0] if len(values) == 1 else values)
+    return grouped
+
+
+def _index_row(user, roles, districts, villages):
+    # same attributes as the ones filtered by Query.resolve_users
+    i_user, officer, claim_admin = user.i_user, user.officer, user.claim_admin
+    people = [person for person in (i_user, officer, claim_admin) if person]
+    user_districts = districts.get(user.i_user_id, [])
+    officer_villages = villages.get(user.officer_id, [])
+    birth_dates = [d for d in (
+        officer.dob if officer else None,
+        officer.veo_dob if officer else None,
+        claim_admin.dob if claim_admin else None,
+    ) if d]
+    return UserSearchIndex(
+        user=user,
+        username=UserSearchIndex.normalize(user.username),
+        last_names="\n".join(UserSearchIndex.normalize(person.last_name) for person in people),
+        other_names="\n".join(UserSearchIndex.normalize(person.other_names) for person in people),
+        emails=UserSearchIndex.tokens([
+            i_user.email if i_user else None,
+            officer.email if officer else None,
+            claim_admin.email_id if claim_admin else None,
+        ]),
+        phones=UserSearchIndex.tokens([person.phone for person in people]),
+        is_interactive=user.i_user_id is not None,
+        is_officer=user.officer_id is not None,
+        is_technical=user.t_user_id is not None,
+        is_claim_admin=user.claim_admin_id is not None,
+        health_facility_ids=UserSearchIndex.tokens([
+            i_user.health_facility_id if i_user else None,
+            officer.location_id if officer else None,
+            claim_admin.health_facility_id if claim_admin else None,
+        ]),
+        role_ids=UserSearchIndex.tokens(roles.get(user.i_user_id, [])),
+        region_ids=UserSearchIndex.tokens(parent_id for _, parent_id in user_districts),
+        district_ids=UserSearchIndex.tokens(location_id for location_id, _ in user_districts),
+        municipality_ids=UserSearchIndex.tokens(parent_id for _, parent_id in officer_villages),
+        village_ids=UserSearchIndex.tokens(location_id for location_id, _ in officer_villages),
+        min_birth_date=min(birth_dates) if birth_dates else None,
+        max_birth_date=max(birth_dates) if birth_dates else None,
+    )
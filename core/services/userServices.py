@@ -10,7 +10,8 @@ from django.template import loader
 from django.utils.http import urlencode
 from django.core.cache import cache
 from core.apps import CoreConfig
-from core.models.user import User, InteractiveUser, Officer, UserRole, UserManager
+from core.models.user import User, InteractiveUser, Officer, UserRole, UserManager, UserSecurityContext
+from core.services.userSearchServices import schedule_user_search_index_update
 from core.validation.obligatoryFieldValidation import validate_payload_for_obligatory_fields
 from django.contrib.auth import authenticate
 from rest_framework import exceptions
@@ -80,6 +81,9 @@ def create_or_update_user_roles(i_user, role_ids, audit_user_id):
     cache.delete('rights_' + str(i_user.id))
     cache.delete('is_admin_' + str(i_user.id))
     cache.delete('cs_InteractiveUserSerializer_' + str(i_user.id))
+    UserSecurityContext.invalidate(i_user.login_name)
+    # the update() above doesn't send any signal
+    schedule_user_search_index_update(i_user_ids=[i_user.id])
 
 # TODO move to location module ?
 def create_or_update_user_districts(i_user, district_ids, audit_user_id):
@@ -98,6 +102,7 @@ def create_or_update_user_districts(i_user, district_ids, audit_user_id):
             defaults={"validity_to": None, "audit_user_id": audit_user_id},
         )
     cache.delete('q_allowed_locations_' + str(i_user.id))
+    schedule_user_search_index_update(i_user_ids=[i_user.id])
 
 
 def create_or_update_officer_villages(officer, village_ids, audit_user_id):
@@ -115,6 +120,7 @@ def create_or_update_officer_villages(officer, village_ids, audit_user_id):
             location_id=village_id,
             defaults={"validity_to": None, "audit_user_id": audit_user_id},
         )
+    schedule_user_search_index_update(officer_ids=[officer.id])
 
 
 @validate_payload_for_obligatory_fields(CoreConfig.fields_controls_eo, 'data')
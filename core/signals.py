@@ -30,7 +30,7 @@ def __register_service_signal(signal_name, providing_args):
         else:
             signal.register_signal(providing_args)
     else:
-        REGISTERED_SERVICE_SIGNALS[signal_name] = RegisteredServiceSignal(providing_args)
+        REGISTERED_SERVICE_SIGNALS[signal_name] = RegisteredServiceSignal(providing_args, name=signal_name)
 
 
 def __raise_unregistered_signal_exception(signal_name):
@@ -67,15 +67,28 @@ def register_service_signal(signal_name: str):
                 __raise_unregistered_signal_exception(signal_name)
 
             context = kwargs.pop('context', None)
+            has_receivers_before = registered_signal.has_receivers_before()
+            has_receivers_after = registered_signal.has_receivers_after()
+            if not has_receivers_before and not has_receivers_after:
+                # nothing to notify, the service is called directly
+                registered_signal.clear_signal_results()
+                return func(*args, **kwargs)
+
             cls_, func_args = args[0], args[1:]  # First element of args is self/cls. Moved to separate variable.
             signal_call_args = {'cls_': cls_, 'data': [func_args, kwargs], 'context': context}
 
-            registered_signal.send_signal_before(sender=cls_, **signal_call_args)
+            if has_receivers_before:
+                registered_signal.send_signal_before(sender=cls_, **signal_call_args)
+            else:
+                registered_signal.clear_signal_results('before')
 
             out = func(*args, **kwargs)
 
-            signal_call_args['result'] = out
-            registered_signal.send_signal_after(sender=cls_, **signal_call_args)
+            if has_receivers_after:
+                signal_call_args['result'] = out
+                registered_signal.send_signal_after(sender=cls_, **signal_call_args)
+            else:
+                registered_signal.clear_signal_results('after')
             return out
 
         return wrapper_propagate_signal
@@ -84,7 +97,8 @@ def register_service_signal(signal_name: str):
 
 
 def bind_service_signal(signal_name: str, func: Callable,
-                        bind_type: ServiceSignalBindType = ServiceSignalBindType.BEFORE_AND_AFTER):
+                        bind_type: ServiceSignalBindType = ServiceSignalBindType.BEFORE_AND_AFTER,
+                        blocking: bool = True):
     """
     By default, binding is done after modules are loaded, with same similar approach as for graphql.
     Main OpenIMIS backend is crawling through modules searching for bind_service_signals function
@@ -100,10 +114,12 @@ def bind_service_signal(signal_name: str, func: Callable,
     @param signal_name:
     @param func:
     @param bind_type:
+    @param blocking: if False, func is called in a thread pool once the transaction of the service is committed,
+    its result is then not part of the signal results (for side effects only: notifications, exports...)
     @return:
     """
     if signal_name not in REGISTERED_SERVICE_SIGNALS.keys():
         __register_service_signal(signal_name, None)
 
     signal = REGISTERED_SERVICE_SIGNALS[signal_name]
-    signal.connect_signal(func, bind_type)
+    signal.connect_signal(func, bind_type, blocking)
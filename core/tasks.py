@@ -1,13 +1,117 @@
 from __future__ import absolute_import, unicode_literals
+import importlib
 import json
 import logging
 
 from celery import shared_task
-from core.models import MutationLog, Language
-from django.utils import translation
+from celery.signals import worker_init
+from core.apps import CoreConfig
+from core.models import MutationLog
+from core.utils import activate_language, on_commit_batch
+from django.apps import apps
+from django.db import transaction
 
 logger = logging.getLogger(__name__)
 
+# (module, class name) -> OpenIMISMutation class, filled when the classes are declared
+_mutation_classes = {}
+
+
+def register_mutation_class(module, mutation_class):
+    key = (module, mutation_class.__name__)
+    registered = _mutation_classes.get(key)
+    if registered is not None and (registered.__module__, registered.__qualname__) \
+            != (mutation_class.__module__, mutation_class.__qualname__):
+        # the first one is kept, as the class found in the schema of the module would be
+        logger.error("Mutation class %s.%s already registered by %s, %s is ignored", module,
+                     mutation_class.__name__, registered.__module__, mutation_class.__module__)
+        return
+    _mutation_classes[key] = mutation_class
+
+
+def get_mutation_class(module, class_name):
+    mutation_class = _mutation_classes.get((module, class_name))
+    if mutation_class is None:
+        # __import__ needs to import the module with .schema to force .schema to load, then .schema.TheRealMutation
+        mutation_class = getattr(__import__(f"{module}.schema").schema, class_name)
+        _mutation_classes[(module, class_name)] = mutation_class
+    return mutation_class
+
+
+@worker_init.connect
+def load_mutation_classes(**kwargs):
+    """
+    Imports the schema of all the modules when the worker starts, which registers their mutation classes
+    """
+    for app_config in apps.get_app_configs():
+        try:
+            importlib.import_module(f"{app_config.name}.schema")
+        except ModuleNotFoundError as exc:
+            if exc.name != f"{app_config.name}.schema":
+                logger.warning("Could not load the mutations of %s", app_config.name, exc_info=True)
+        except Exception:
+            logger.warning("Could not load the mutations of %s", app_config.name, exc_info=True)
+
+
+def get_mutation_queue(module, class_name, batch=False):
+    """
+    Celery queue of the mutations of a class, from the mutation_queues configuration ("module.ClassName" or "module"
+    keys), mutation_batch_queue for the batches. None for the default queue
+    """
+    if batch and CoreConfig.mutation_batch_queue:
+        return CoreConfig.mutation_batch_queue
+    queues = CoreConfig.mutation_queues or {}
+    return queues.get(f"{module}.{class_name}") or queues.get(module)
+
+
+def enqueue_mutation(mutation_id, module, class_name):
+    """
+    Queues the asynchronous execution of a mutation once the current transaction is committed (so that the worker
+    finds its MutationLog). The mutations queued in the same transaction are sent to the workers together, those of a
+    rolled back transaction are never sent.
+    """
+    on_commit_batch("core.tasks.enqueue_mutation", [(str(mutation_id), module, class_name)], _send_mutations)
+
+
+def enqueue_mutation_batch(mutation_ids, module, class_name):
+    """
+    Queues the asynchronous execution of a batch of mutations (OpenIMISMutation.mutate_batch) once the current
+    transaction is committed, on the mutation_batch_queue
+    """
+    args = ([str(mutation_id) for mutation_id in mutation_ids], module, class_name)
+    queue = get_mutation_queue(module, class_name, batch=True)
+    transaction.on_commit(lambda: openimis_mutation_batch_async.apply_async(args=args, queue=queue))
+
+
+def _send_mutations(mutations):
+    by_queue = {}
+    for mutation in mutations:
+        by_queue.setdefault(get_mutation_queue(mutation[1], mutation[2]), []).append(mutation)
+    for queue, queue_mutations in by_queue.items():
+        if len(queue_mutations) == 1:
+            openimis_mutation_async.apply_async(args=queue_mutations[0], queue=queue)
+        else:
+            openimis_mutations_async.apply_async(args=(queue_mutations,), queue=queue)
+
+
+def _activate_user_language(user):
+    if user and user.language:
+        activate_language(user.language)
+
+
+def _execute_mutation(mutation, mutation_class):
+    _activate_user_language(mutation.user)
+    error_messages = mutation_class.async_mutate(mutation.user, **mutation_class.coerce_mutation_data(
+        json.loads(mutation.json_content)))
+    if not error_messages:
+        mutation.mark_as_successful()
+    else:
+        logger.debug(f"error :{error_messages}")
+        try:
+            mutation.mark_as_failed(json.dumps(error_messages))
+        except Exception:
+            mutation.mark_as_failed(error_messages)
+
 
 @shared_task
 def openimis_mutation_async(mutation_id, module, class_name):
@@ -21,26 +125,8 @@ def openimis_mutation_async(mutation_id, module, class_name):
     """
     mutation = None
     try:
-        mutation = MutationLog.objects.get(id=mutation_id)
-        # __import__ needs to import the module with .schema to force .schema to load, then .schema.TheRealMutation
-        mutation_class = getattr(__import__(f"{module}.schema").schema, class_name)
-
-        if mutation.user and mutation.user.language:
-            lang = mutation.user.language
-            if isinstance(lang, Language):
-                translation.activate(lang.code)
-            else:
-                translation.activate(lang)
-        error_messages = mutation_class.async_mutate(mutation.user, **mutation_class.coerce_mutation_data(
-            json.loads(mutation.json_content)))
-        if not error_messages:
-            mutation.mark_as_successful()
-        else:
-            logger.debug(f"error :{error_messages}")
-            try:
-                mutation.mark_as_failed(json.dumps(error_messages))
-            except Exception:
-                mutation.mark_as_failed(error_messages)
+        mutation = MutationLog.objects.select_related("user").get(id=mutation_id)
+        _execute_mutation(mutation, get_mutation_class(module, class_name))
         return "OK"
     except Exception as exc:
         if mutation:
@@ -49,6 +135,74 @@ def openimis_mutation_async(mutation_id, module, class_name):
         raise exc
 
 
+@shared_task
+def openimis_mutations_async(mutations):
+    """
+    Executes several mutations (sent in the same transaction), their MutationLog being loaded with one query.
+    A failing mutation is marked as failed and doesn't prevent the next ones from being executed, the task then fails
+    with the last exception.
+    :param mutations: list of (MutationLog id, module, class name)
+    :return: unused, returns "OK"
+    """
+    mutation_ids = [mutation_id for mutation_id, _, _ in mutations]
+    try:
+        mutation_logs = {str(mutation.id): mutation for mutation in MutationLog.objects
+                         .filter(id__in=mutation_ids)
+                         .select_related("user")}
+    except Exception as exc:
+        MutationLog.mark_many_as_failed({mutation_id: str(exc) for mutation_id in mutation_ids}, only_received=True)
+        logger.warning(f"Exception while loading the mutations {mutation_ids}", exc_info=True)
+        raise exc
+    last_exception = None
+    for mutation_id, module, class_name in mutations:
+        mutation = mutation_logs.get(mutation_id)
+        if mutation is None:
+            logger.warning(f"Mutation id {mutation_id} not found")
+            continue
+        try:
+            _execute_mutation(mutation, get_mutation_class(module, class_name))
+        except Exception as exc:
+            last_exception = exc
+            logger.warning(f"Exception while processing mutation id {mutation_id}", exc_info=True)
+            try:
+                mutation.mark_as_failed(str(exc))
+            except Exception:
+                logger.error(f"Could not mark mutation id {mutation_id} as failed", exc_info=True)
+    if last_exception is not None:
+        raise last_exception
+    return "OK"
+
+
+@shared_task
+def openimis_mutation_batch_async(mutation_ids, module, class_name):
+    """
+    Asynchronous execution of a batch of mutations (OpenIMISMutation.mutate_batch), all of the same class and user.
+    :param mutation_ids: IDs of the MutationLog of the batch
+    :param module: "claim", "insuree"...
+    :param class_name: Name of the OpenIMISMutation class whose execute_batch() will be called
+    :return: unused, returns "OK"
+    """
+    try:
+        received = {str(mutation.id): mutation for mutation in MutationLog.objects
+                    .filter(id__in=mutation_ids, status=MutationLog.RECEIVED)
+                    .select_related("user")}
+        # in the order of the batch
+        mutations = [received[mutation_id] for mutation_id in map(str, mutation_ids) if mutation_id in received]
+        if not mutations:
+            return "OK"
+        mutation_class = get_mutation_class(module, class_name)
+        user = mutations[0].user
+        _activate_user_language(user)
+        mutation_class.execute_batch(
+            user, [(mutation.id, json.loads(mutation.json_content)) for mutation in mutations])
+        return "OK"
+    except Exception as exc:
+        MutationLog.mark_many_as_failed(
+            {mutation_id: str(exc) for mutation_id in mutation_ids}, only_received=True)
+        logger.warning(f"Exception while processing the mutations batch {mutation_ids}", exc_info=True)
+        raise exc
+
+
 @shared_task(name='sample_batch')
 def openimis_test_batch():
     logger.info("sample batch")
@@ -0,0 +1,35 @@
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+
+from core.models import MutationLog
+from core.schema import OrderedDjangoFilterConnectionField
+
+
+class ConnectionCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for _ in range(3):
+            MutationLog.objects.create(json_content="{}")
+
+    def test_cached_count(self):
+        queryset = MutationLog.objects.all()
+        self.assertEquals(OrderedDjangoFilterConnectionField.count(
+            queryset, OrderedDjangoFilterConnectionField.COUNT_CACHED), 3)
+        MutationLog.objects.create(json_content="{}")
+        self.assertEquals(OrderedDjangoFilterConnectionField.count(
+            queryset, OrderedDjangoFilterConnectionField.COUNT_CACHED), 3)
+        self.assertEquals(OrderedDjangoFilterConnectionField.count(queryset), 4)
+
+    def test_estimate_falls_back_to_exact(self):
+        # below gql_count_estimate_threshold, or on other databases than PostgreSQL
+        self.assertEquals(OrderedDjangoFilterConnectionField.count(
+            MutationLog.objects.all(), OrderedDjangoFilterConnectionField.COUNT_ESTIMATE), 3)
+
+    @skipUnless(connection.vendor == "postgresql", "EXPLAIN estimates are only used on PostgreSQL")
+    def test_failed_estimate_keeps_the_transaction_usable(self):
+        queryset = MutationLog.objects.extra(where=["no_such_column = 1"])
+        self.assertIsNone(OrderedDjangoFilterConnectionField._estimate_count(queryset))
+        self.assertEquals(MutationLog.objects.count(), 3)
@@ -1,8 +1,17 @@
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.test import TestCase
+
+from core.gql_queries import UserGQLType
+from core.models import InteractiveUser, User
 from core.models.openimis_graphql_test_case import openIMISGraphQLTestCase
 from core.test_helpers import create_test_interactive_user
 from graphql_jwt.shortcuts import get_token
 from core import filter_validity
-from location.models import Location
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from location.models import HealthFacility, Location
 import json
 
 
@@ -180,4 +189,73 @@ class gqlTest(openIMISGraphQLTestCase):
             query,
             headers={"HTTP_AUTHORIZATION": f"Bearer {self.admin_token}"}
         )
-        self.assertResponseNoErrors(response)
\ No newline at end of file
+        self.assertResponseNoErrors(response)
+
+    def test_users_page_queries(self):
+        query = """
+    {
+      users(username_Icontains: "UsersPageQueries", first: 10)
+      {
+        edges { node { id username healthFacility { id } iUser { id roles { id } } } }
+      }
+    }
+    """
+        health_facility = HealthFacility.objects.filter(*filter_validity()).first()
+        custom_props = {"health_facility_id": health_facility.id} if health_facility else None
+
+        def query_users():
+            response = self.query(query, headers={"HTTP_AUTHORIZATION": f"Bearer {self.admin_token}"})
+            self.assertResponseNoErrors(response)
+            return json.loads(response.content)["data"]["users"]["edges"]
+
+        for i in range(2):
+            create_test_interactive_user(username=f"UsersPageQueries{i}", custom_props=custom_props)
+        # also warms up the caches of the authentication
+        self.assertEqual(len(query_users()), 2)
+        with CaptureQueriesContext(connection) as queries:
+            query_users()
+
+        for i in range(2, 6):
+            create_test_interactive_user(username=f"UsersPageQueries{i}", custom_props=custom_props)
+        # the health facilities and roles of the page are loaded in batches: no query per row
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(len(query_users()), 6)
+
+    def test_users_total_count(self):
+        query = """
+    {
+      users(username_Icontains: "UsersTotalCount", first: 10)
+      {
+        %s edges { node { id } }
+      }
+    }
+    """
+
+        def query_users(fields=""):
+            response = self.query(query % fields, headers={"HTTP_AUTHORIZATION": f"Bearer {self.admin_token}"})
+            self.assertResponseNoErrors(response)
+            return json.loads(response.content)["data"]["users"]
+
+        for i in range(2):
+            create_test_interactive_user(username=f"UsersTotalCount{i}")
+        # also warms up the caches of the authentication
+        query_users("totalCount")
+        with CaptureQueriesContext(connection) as queries:
+            query_users()
+        # the count is only run when totalCount is selected
+        with self.assertNumQueries(len(queries) + 1):
+            self.assertEqual(query_users("totalCount")["totalCount"], 2)
+        # users are listed right after being created, their total can't be stale
+        create_test_interactive_user(username="UsersTotalCount2")
+        self.assertEqual(query_users("totalCount")["totalCount"], 3)
+
+
+class UserHealthFacilityTestCase(TestCase):
+    @skipUnless(apps.is_installed("claim"), "claim administrators are defined by the claim module")
+    def test_claim_admin_first(self):
+        user = User(username="health_facility_order", i_user=InteractiveUser(health_facility_id=17),
+                    claim_admin=apps.get_model("claim", "ClaimAdmin")(health_facility_id=18))
+        with mock.patch("core.gql_queries.get_loader") as get_loader:
+            UserGQLType.resolve_health_facility(user, mock.Mock())
+        get_loader.return_value.load.assert_called_once_with(18)
+        self.assertEquals(user.get_health_facility_id(), 18)
@@ -0,0 +1,132 @@
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.core.cache import cache
+from django.test import TestCase
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.shortcuts import get_token
+
+from core.apps import CoreConfig
+from core.jwt import get_user_signing_key, _signing_key_cache_name, _signing_key_generation_cache_name
+from core.models.user import UserSecurityContext
+from core import jwt_authentication
+from core.jwt_authentication import get_user_by_verified_token, health_facility_contract_cache_name, \
+    is_health_facility_contract_valid, _token_generation_cache_name
+from core.test_helpers import create_test_interactive_user
+
+
+class VerifiedTokenTestCase(TestCase):
+    username = "VerifiedTokenTest"
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_test_interactive_user(username=self.username)
+        self.token = get_token(self.user)
+
+    def test_users_are_not_shared(self):
+        first = get_user_by_verified_token(self.token)
+        second = get_user_by_verified_token(self.token)
+        self.assertEquals(first.id, self.user.id)
+        self.assertEquals(second.id, self.user.id)
+        self.assertIsNot(first, second)
+        self.assertIsNot(first.i_user, second.i_user)
+
+    def test_deactivated_user_is_rejected(self):
+        get_user_by_verified_token(self.token)
+        i_user = self.user.i_user
+        i_user.validity_to = datetime.now() - timedelta(days=1)
+        i_user.save()
+        with self.assertRaises(JSONWebTokenError):
+            get_user_by_verified_token(self.token)
+
+    def test_deleted_user_is_rejected(self):
+        get_user_by_verified_token(self.token)
+        # as the delete users mutation does
+        self.user.i_user.delete_history()
+        self.user.delete_history()
+        with self.assertRaises(JSONWebTokenError):
+            get_user_by_verified_token(self.token)
+
+    def test_user_save_revokes_on_commit(self):
+        get_user_by_verified_token(self.token)
+        generation = cache.get(_token_generation_cache_name(self.username))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.i_user.save()
+        self.assertNotEquals(cache.get(_token_generation_cache_name(self.username)), generation)
+        self.assertEquals(get_user_by_verified_token(self.token).id, self.user.id)
+
+    def test_generation_expires(self):
+        with mock.patch.object(jwt_authentication.cache, "add", wraps=jwt_authentication.cache.add) as add:
+            get_user_by_verified_token(self.token)
+        add.assert_called_once_with(_token_generation_cache_name(self.username), mock.ANY,
+                                    timeout=CoreConfig.jwt_verified_token_cache_ttl)
+
+
+class SigningKeyTestCase(TestCase):
+    def test_rotated_key_is_invalidated_on_commit(self):
+        user = create_test_interactive_user(username="SigningKeyTest")
+        i_user = user.i_user
+        previous_key = get_user_signing_key(user.username)
+        self.assertEquals(previous_key, i_user.private_key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            i_user.set_password("NewS\\:\\/pe®Pąßw0rd")
+            i_user.save()
+            # still served from the cache until the transaction is committed
+            self.assertEquals(get_user_signing_key(user.username), previous_key)
+        for callback in callbacks:
+            callback()
+        self.assertEquals(get_user_signing_key(user.username), i_user.private_key)
+        self.assertNotEquals(i_user.private_key, previous_key)
+
+    def test_unknown_user_is_not_cached(self):
+        cache.clear()
+        self.assertIsNone(get_user_signing_key("SigningKeyUnknownTest"))
+        self.assertIsNone(cache.get(_signing_key_cache_name("SigningKeyUnknownTest")))
+        self.assertIsNone(cache.get(_signing_key_generation_cache_name("SigningKeyUnknownTest")))
+
+
+class HealthFacilityContractTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_test_interactive_user(username="HealthFacilityContractTest",
+                                                 custom_props={"health_facility_id": 17})
+
+    def _mock_health_facilities(self, contract_end_date):
+        health_facility_model = mock.MagicMock()
+        health_facility_model.objects.filter.return_value.values_list.return_value.first.return_value = \
+            contract_end_date
+        return mock.patch.object(jwt_authentication.apps, "get_model", return_value=health_facility_model)
+
+    def test_cached_per_facility(self):
+        with self._mock_health_facilities(date.today() + timedelta(days=1)) as get_model:
+            self.assertTrue(is_health_facility_contract_valid(self.user))
+            self.assertTrue(is_health_facility_contract_valid(self.user))
+        get_model.assert_called_once()
+        health_facility_model = get_model.return_value
+        health_facility_model.objects.filter.assert_called_once_with(pk=17)
+        self.assertEquals(cache.get(health_facility_contract_cache_name(17)), (date.today() + timedelta(days=1),))
+
+    def test_contract_ended(self):
+        # the cached end date is compared to the current date on each check
+        cache.set(health_facility_contract_cache_name(17), (date.today(),))
+        self.assertFalse(is_health_facility_contract_valid(self.user))
+        cache.set(health_facility_contract_cache_name(17), (None,))
+        self.assertFalse(is_health_facility_contract_valid(self.user))
+
+    def test_security_context_facility(self):
+        # the facility of User.get_health_facility (claim administrator first), as loaded in the security context
+        self.user.__dict__["_security_context"] = UserSecurityContext(health_facility_id=18)
+        with self._mock_health_facilities(date.today() + timedelta(days=1)) as get_model:
+            is_health_facility_contract_valid(self.user)
+        get_model.return_value.objects.filter.assert_called_once_with(pk=18)
+
+    @skipUnless(apps.is_installed("location"), "health facilities are defined by the location module")
+    def test_dropped_on_facility_save(self):
+        health_facility = apps.get_model("location", "HealthFacility").objects.first()
+        if health_facility is None:
+            self.skipTest("no health facility")
+        cache.set(health_facility_contract_cache_name(health_facility.id), (date.today(),))
+        with self.captureOnCommitCallbacks(execute=True):
+            health_facility.save()
+        self.assertIsNone(cache.get(health_facility_contract_cache_name(health_facility.id)))
@@ -0,0 +1,83 @@
+import datetime
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core.gql.keyset_pagination import decode_cursor, encode_cursor, get_keyset_ordering, is_keyset_cursor, \
+    keyset_connection
+from core.models import MutationLog
+from core.schema import MutationLogGQLType, Query
+
+
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            MutationLog.objects.create(json_content="{}", client_mutation_label="label %d" % (i % 2))
+        # NULLs are sorted last
+        MutationLog.objects.create(json_content="{}", client_mutation_label=None)
+
+    def test_cursor(self):
+        self.assertEquals(decode_cursor(encode_cursor(["a", 1, None])), ["a", 1, None])
+        values = [datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+                  datetime.date(2024, 1, 2), datetime.time(3, 4, 5, 1), Decimal("1.000001")]
+        self.assertEquals(decode_cursor(encode_cursor(values)), values)
+        # offset cursors aren't keyset cursors
+        self.assertIsNone(decode_cursor("YXJyYXljb25uZWN0aW9uOjA="))
+        self.assertFalse(is_keyset_cursor("YXJyYXljb25uZWN0aW9uOjA="))
+        self.assertFalse(is_keyset_cursor(None))
+        self.assertTrue(is_keyset_cursor(encode_cursor([1])))
+
+    def test_opt_in(self):
+        # the offset cursors stay the default, the clients ask for keyset cursors with keysetPagination
+        for field in ("users", "mutation_logs", "role_right"):
+            self.assertIn("keyset_pagination", Query._meta.fields[field].args)
+        self.assertNotIn("keyset_pagination", Query._meta.fields["role"].args)
+
+    def test_ordering(self):
+        ordering = get_keyset_ordering(MutationLog.objects.order_by("-client_mutation_label"))
+        self.assertEquals(ordering, [("client_mutation_label", True), ("pk", False)])
+        self.assertIsNone(get_keyset_ordering(MutationLog.objects.order_by("?")))
+
+    def _read_pages(self, queryset, page_size):
+        connection_type = MutationLogGQLType._meta.connection
+        seen = []
+        args = {"first": page_size}
+        while True:
+            page = keyset_connection(connection_type, dict(args), queryset)
+            seen += [edge.node.pk for edge in page.edges]
+            if not page.page_info.has_next_page:
+                return seen
+            args = {"first": page_size, "after": page.page_info.end_cursor}
+
+    def test_pages_datetime_microseconds(self):
+        # all the rows in the same millisecond: a truncated cursor would skip or repeat rows
+        base = timezone.now().replace(microsecond=500000)
+        for i, pk in enumerate(MutationLog.objects.order_by("pk").values_list("pk", flat=True)):
+            MutationLog.objects.filter(pk=pk).update(request_date_time=base + datetime.timedelta(microseconds=i * 7))
+        queryset = MutationLog.objects.order_by("-request_date_time")
+        expected = list(queryset.order_by("-request_date_time", "pk").values_list("pk", flat=True))
+        self.assertEquals(self._read_pages(queryset, 2), expected)
+
+    def test_pages(self):
+        queryset = MutationLog.objects.order_by("client_mutation_label")
+        expected = list(queryset.filter(client_mutation_label__isnull=False).order_by(
+            "client_mutation_label", "pk").values_list("pk", flat=True))
+        expected += list(queryset.filter(client_mutation_label__isnull=True).order_by(
+            "pk").values_list("pk", flat=True))
+        connection_type = MutationLogGQLType._meta.connection
+
+        seen = []
+        args = {"first": 2}
+        while True:
+            page = keyset_connection(connection_type, dict(args), queryset)
+            seen += [edge.node.pk for edge in page.edges]
+            if not page.page_info.has_next_page:
+                break
+            args = {"first": 2, "after": page.page_info.end_cursor}
+        self.assertEquals(seen, expected)
+
+        page = keyset_connection(connection_type, {"last": 2, "before": page.page_info.start_cursor}, queryset)
+        self.assertEquals([edge.node.pk for edge in page.edges], expected[2:4])
+        self.assertTrue(page.page_info.has_previous_page)
@@ -0,0 +1,38 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.apps import CoreConfig
+from core.last_login import LastLoginRecorder
+from core.test_helpers import create_test_interactive_user
+
+
+class LastLoginRecorderTestCase(TestCase):
+    def test_logins_written_in_one_update(self):
+        users = [create_test_interactive_user(username=f"LastLoginTest{i}") for i in range(3)]
+        now = timezone.now().replace(microsecond=0)
+        recorder = LastLoginRecorder()
+        with mock.patch.object(CoreConfig, "last_login_flush_interval", 3600), \
+                mock.patch.object(CoreConfig, "last_login_max_pending", 1000), \
+                mock.patch.object(recorder, "_start_timer"):
+            with CaptureQueriesContext(connection) as queries:
+                for i, user in enumerate(users):
+                    recorder.record(user, now - timedelta(minutes=i))
+                # only the most recent login of a user is kept
+                recorder.record(users[0], now + timedelta(minutes=1))
+            self.assertEquals(len(queries), 0)
+
+            with CaptureQueriesContext(connection) as queries:
+                recorder.flush()
+        self.assertEquals(len(queries), 1)
+        self.assertTrue(queries[0]["sql"].upper().startswith("UPDATE"))
+        self.assertIn("CASE", queries[0]["sql"].upper())
+
+        for user in users:
+            user.i_user.refresh_from_db()
+        self.assertEquals([user.i_user.last_login for user in users],
+                          [now + timedelta(minutes=1), now - timedelta(minutes=1), now - timedelta(minutes=2)])
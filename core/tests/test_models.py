@@ -1,5 +1,13 @@
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
-from core.models import User, TechnicalUser, InteractiveUser
+from core.models import User, TechnicalUser, InteractiveUser, ModuleConfiguration
+from core.models.user import RoleRight, UserSecurityContext, get_role_generations
+from core.services.userServices import create_or_update_user_roles
+from core.test_helpers import create_test_interactive_user
 
 
 class UserTestCase(TestCase):
@@ -35,3 +43,123 @@ class UserTestCase(TestCase):
                                   i_user=InteractiveUser(login_name='not_active_anymore',
                                                          validity_to=datetime.datetime.now() + datetimedelta(days=-1)))
         self.assertFalse(not_active_anymore.is_active)
+
+
+class UserSecurityContextTestCase(TestCase):
+
+    def _user_with_rights(self, rights, is_imis_admin=False):
+        user = User(username='with_rights', i_user_id=1)
+        user.__dict__['_security_context'] = UserSecurityContext(rights=rights, is_imis_admin=is_imis_admin)
+        return user
+
+    def test_has_perm(self):
+        user = self._user_with_rights([121701, 122001])
+        self.assertTrue(user.has_perm('121701'))
+        self.assertTrue(user.has_perms(['999999', '122001']))
+        self.assertTrue(user.has_perms(['121701', '122001'], list_evaluation_or=False))
+
+    def test_imis_admin_has_all_perms(self):
+        user = self._user_with_rights([], is_imis_admin=True)
+        self.assertTrue(user.has_perm('121701'))
+        self.assertTrue(user.has_perms(['121701', '122001'], list_evaluation_or=False))
+
+    def test_rights_are_compiled_once(self):
+        context = UserSecurityContext(rights=[121701, 121702])
+        self.assertEquals(context.rights_set, frozenset({'121701', '121702'}))
+        self.assertEquals(UserSecurityContext(**context.as_dict()).rights_set, context.rights_set)
+
+    def test_load(self):
+        user = create_test_interactive_user(username="security_context_load", roles=[1, 2],
+                                            custom_props={"health_facility_id": 17})
+        expected_rights = sorted(set(RoleRight.objects
+                                     .filter(role_id__in=[1, 2], validity_to__isnull=True)
+                                     .values_list("right_id", flat=True)))
+        context = UserSecurityContext.load(user)
+        self.assertEquals(context.rights, expected_rights)
+        self.assertEquals(context.health_facility_id, 17)
+        self.assertEquals(set(context.role_generations), {1, 2})
+
+    @skipUnless(apps.is_installed("claim"), "claim administrators are defined by the claim module")
+    def test_health_facility_of_claim_admin_first(self):
+        claim_admin_model = apps.get_model("claim", "ClaimAdmin")
+        user = User(username="health_facility_order", i_user=InteractiveUser(health_facility_id=17),
+                    claim_admin=claim_admin_model(health_facility_id=18))
+        self.assertEquals(user.get_health_facility_id(), 18)
+        user.claim_admin = None
+        self.assertEquals(user.get_health_facility_id(), 17)
+
+    def test_invalidated_by_role_change(self):
+        user = create_test_interactive_user(username="security_context_roles", roles=[1])
+        self.assertNotIn(999999, UserSecurityContext.get(user).rights)
+        with self.captureOnCommitCallbacks(execute=True):
+            RoleRight.objects.create(role_id=1, right_id=999999, audit_user_id=-1)
+        self.assertIn(999999, UserSecurityContext.get(user).rights)
+
+    def test_role_generation_bumped_once_on_commit(self):
+        generation = UserSecurityContext.load(create_test_interactive_user(
+            username="security_context_bump", roles=[1])).role_generations[1]
+        with mock.patch.object(cache, "set_many", wraps=cache.set_many) as set_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                for right_id in (999997, 999998, 999999):
+                    RoleRight.objects.create(role_id=1, right_id=right_id, audit_user_id=-1)
+                set_many.assert_not_called()
+        set_many.assert_called_once()
+        self.assertEquals(list(set_many.call_args[0][0]), ["role_gen_1"])
+        self.assertNotEquals(get_role_generations([1])[1], generation)
+
+    def test_role_generation_kept_on_rollback(self):
+        generation = get_role_generations([1])[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    RoleRight.objects.create(role_id=1, right_id=999999, audit_user_id=-1)
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.assertEquals(get_role_generations([1])[1], generation)
+
+    def test_invalidated_by_user_roles_change(self):
+        user = create_test_interactive_user(username="security_context_user_roles", roles=[1])
+        self.assertEquals(set(UserSecurityContext.get(user).role_generations), {1})
+        create_or_update_user_roles(user.i_user, [2], None)
+        self.assertEquals(set(UserSecurityContext.get(user).role_generations), {2})
+
+
+class ModuleConfigurationRegistryTestCase(TestCase):
+
+    def test_get_or_default(self):
+        default = {"a": 1, "nested": {"b": 2}}
+        self.assertEquals(ModuleConfiguration.get_or_default("registry_test", default), default)
+
+        ModuleConfiguration.objects.create(
+            module="registry_test", layer="be", version="1", config='{"nested": {"b": 3}}')
+        cfg = ModuleConfiguration.get_or_default("registry_test", default)
+        self.assertEquals(cfg, {"a": 1, "nested": {"b": 3}})
+
+        # the callers get their own copy, which they can alter without affecting the others
+        cfg["nested"]["b"] = 4
+        cfg["list"] = [1]
+        self.assertEquals(type(cfg["nested"]), dict)
+        self.assertEquals(ModuleConfiguration.get_or_default("registry_test", default), {"a": 1, "nested": {"b": 3}})
+
+    def test_rolled_back_changes_are_not_kept(self):
+        try:
+            with transaction.atomic():
+                ModuleConfiguration.objects.create(
+                    module="registry_rollback", layer="be", version="1", config='{"a": 2}')
+                self.assertEquals(ModuleConfiguration.get_or_default("registry_rollback", {"a": 1}), {"a": 2})
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEquals(ModuleConfiguration.get_or_default("registry_rollback", {"a": 1}), {"a": 1})
+
+    def test_disabled_until(self):
+        from datetime import datetime, timedelta
+        configuration = ModuleConfiguration.objects.create(
+            module="registry_disabled", layer="be", version="1", config='{"a": 2}',
+            is_disabled_until=datetime.now() + timedelta(days=1))
+        self.assertEquals(ModuleConfiguration.get_or_default("registry_disabled", {"a": 1}), {"a": 1})
+
+        configuration.is_disabled_until = datetime.now() - timedelta(days=1)
+        configuration.save()
+        self.assertEquals(ModuleConfiguration.get_or_default("registry_disabled", {"a": 1}), {"a": 2})
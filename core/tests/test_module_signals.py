@@ -0,0 +1,38 @@
+from django.test import TestCase
+
+from core.schema import ModuleSignals, signal_mutation_module_validate
+
+
+class ModuleSignalsTestCase(TestCase):
+    def test_no_receivers_no_signal(self):
+        signals = ModuleSignals(["user"])
+        self.assertEquals(signals.send("no_receivers", sender=None, user=None), [])
+        self.assertFalse(signals.has_listeners("no_receivers"))
+        self.assertNotIn("no_receivers", signals)
+
+    def test_receiver_connected_later(self):
+        signals = ModuleSignals(["user"])
+        signals.send("module", sender=None, user="before")
+        calls = []
+
+        def receiver(sender, user, **kwargs):
+            calls.append(user)
+            return "received"
+
+        signals["module"].connect(receiver)
+        self.assertTrue(signals.has_listeners("module"))
+        self.assertEquals(signals.send("module", sender=None, user="after"), [(receiver, "received")])
+        self.assertEquals(calls, ["after"])
+
+    def test_module_signal(self):
+        calls = []
+
+        def receiver(sender, **kwargs):
+            calls.append(kwargs["mutation_class"])
+
+        signal_mutation_module_validate["core_test_module_signals"].connect(receiver)
+        self.addCleanup(signal_mutation_module_validate["core_test_module_signals"].disconnect, receiver)
+        signal_mutation_module_validate.send(
+            "core_test_module_signals", sender=None, user=None, mutation_module="core_test_module_signals",
+            mutation_class="TestMutation", mutation_log_id=None, data={})
+        self.assertEquals(calls, ["TestMutation"])
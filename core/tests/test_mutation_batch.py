@@ -0,0 +1,62 @@
+from unittest import mock
+
+import graphene
+from django.test import TestCase
+
+import core
+from core.models import MutationLog
+from core.schema import OpenIMISMutation
+from core.tasks import openimis_mutation_batch_async
+
+
+class _BatchTestMutation(OpenIMISMutation):
+    _mutation_module = "core"
+    _mutation_class = "BatchTestMutation"
+    executed = []
+
+    class Input(OpenIMISMutation.Input):
+        code = graphene.String()
+
+    @classmethod
+    def async_mutate(cls, user, **data):
+        if data["code"] == "invalid":
+            return [{"message": "invalid code"}]
+        if data["code"] == "raise":
+            raise ValueError("mutation failure")
+        cls.executed.append(data["code"])
+        return None
+
+
+class MutationBatchTestCase(TestCase):
+    inputs = [{"code": "A"}, {"code": "invalid"}, {"code": "raise"}, {"code": "B"}]
+
+    def setUp(self):
+        _BatchTestMutation.executed = []
+
+    def assertStatuses(self, mutation_log_ids, expected):
+        statuses = dict(MutationLog.objects.filter(id__in=mutation_log_ids).values_list("id", "status"))
+        self.assertEquals([statuses[mutation_log_id] for mutation_log_id in mutation_log_ids], expected)
+
+    def test_sync(self):
+        with mock.patch.object(core, "async_mutations", False):
+            mutation_log_ids = _BatchTestMutation.mutate_batch(None, self.inputs)
+        self.assertEquals(_BatchTestMutation.executed, ["A", "B"])
+        self.assertStatuses(mutation_log_ids, [
+            MutationLog.SUCCESS, MutationLog.ERROR, MutationLog.ERROR, MutationLog.SUCCESS])
+
+    def test_async_sent_on_commit(self):
+        with mock.patch.object(core, "async_mutations", True), \
+                mock.patch.object(openimis_mutation_batch_async, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                mutation_log_ids = _BatchTestMutation.mutate_batch(None, self.inputs)
+                apply_async.assert_not_called()
+        apply_async.assert_called_once()
+        args = apply_async.call_args[1]["args"]
+        self.assertEquals(args, ([str(mutation_log_id) for mutation_log_id in mutation_log_ids],
+                                 "core", "_BatchTestMutation"))
+        self.assertStatuses(mutation_log_ids, [MutationLog.RECEIVED] * len(self.inputs))
+
+        openimis_mutation_batch_async(*args)
+        self.assertEquals(_BatchTestMutation.executed, ["A", "B"])
+        self.assertStatuses(mutation_log_ids, [
+            MutationLog.SUCCESS, MutationLog.ERROR, MutationLog.ERROR, MutationLog.SUCCESS])
@@ -0,0 +1,54 @@
+import graphene
+from django.test import TestCase
+
+from core.gql.mutation_coercion import get_coercion_plan
+from core.schema import OpenIMISMutation
+
+
+class _Status(graphene.Enum):
+    ACTIVE = "A"
+    SUSPENDED = "S"
+
+
+class _ItemInputType(graphene.InputObjectType):
+    code = graphene.String()
+    quantity = graphene.Int()
+    status = graphene.Field(graphene.NonNull(_Status))
+
+
+class _Input:
+    name = graphene.String()
+    status = graphene.Field(_Status)
+    main_item = graphene.Field(_ItemInputType)
+    items = graphene.List(_ItemInputType)
+    statuses = graphene.List(_Status)
+    codes = graphene.List(graphene.String)
+
+
+class MutationCoercionTestCase(TestCase):
+    def test_coerce_mutation_data(self):
+        data = {
+            "name": "test",
+            "status": "SUSPENDED",
+            "main_item": {"code": "A1", "quantity": 3, "status": "ACTIVE"},
+            "items": [{"code": "B1", "status": "SUSPENDED"}, {"code": "B2", "status": "UNKNOWN"}],
+            "statuses": ["ACTIVE"],
+            "codes": ["C1", "C2"],
+            "unknown": {"status": "ACTIVE"},
+        }
+        self.assertEquals(OpenIMISMutation.coerce_mutation_data(data, input_class=_Input), {
+            "name": "test",
+            "status": "S",
+            "main_item": {"code": "A1", "quantity": 3, "status": "A"},
+            "items": [{"code": "B1", "status": "S"}, {"code": "B2", "status": "UNKNOWN"}],
+            "statuses": ["ACTIVE"],
+            "codes": ["C1", "C2"],
+            "unknown": {"status": "ACTIVE"},
+        })
+
+    def test_plan_compiled_once(self):
+        OpenIMISMutation.coerce_mutation_data({"status": "ACTIVE", "unknown": 1}, input_class=_Input)
+        plan = get_coercion_plan(_Input)
+        self.assertIs(get_coercion_plan(_Input), plan)
+        self.assertIn("status", plan)
+        self.assertIsNone(plan["unknown"])
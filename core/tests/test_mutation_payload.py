@@ -0,0 +1,25 @@
+import decimal
+import json
+import uuid
+from datetime import date, datetime
+
+from django.test import TestCase
+
+from core.schema import OpenIMISJSONEncoder, normalize_mutation_data
+
+
+class MutationPayloadTestCase(TestCase):
+    def test_same_as_json_round_trip(self):
+        data = {
+            "code": "C1",
+            "amount": decimal.Decimal("12.50"),
+            "uuid": uuid.uuid4(),
+            "date": date(2024, 2, 29),
+            "datetime": datetime(2024, 2, 29, 10, 11, 12, 345678),
+            "items": ({"id": 1, 2: None, True: [1.5, "a"]},),
+            "client_mutation_details": ["detail"],
+        }
+        json_content, payload = normalize_mutation_data(data)
+        expected = json.loads(json.dumps(data, cls=OpenIMISJSONEncoder))
+        self.assertEquals(payload, expected)
+        self.assertEquals(json.loads(json_content), expected)
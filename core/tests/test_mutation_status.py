@@ -0,0 +1,50 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import views
+from core.apps import CoreConfig
+from core.models import MutationLog
+from core.test_helpers import create_test_interactive_user
+
+
+class MutationStatusViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_test_interactive_user(username="MutationStatusTest")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse(views.get_mutation_status)
+        self.mutation_log = MutationLog.objects.create(
+            json_content="{}", user=self.user, client_mutation_id="mutation-status-test")
+
+    def test_received_returns_right_away(self):
+        with mock.patch.object(CoreConfig, "mutation_status_retry_after", 3):
+            response = self.client.get(self.url, {"id": str(self.mutation_log.id)})
+        self.assertEquals(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEquals(response["Retry-After"], "3")
+        self.assertEquals(response.json()["status"], MutationLog.RECEIVED)
+
+    def test_processed_from_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mutation_log.mark_as_successful()
+        with mock.patch.object(MutationLog.objects, "filter") as mutation_logs_filter:
+            response = self.client.get(self.url, {"id": str(self.mutation_log.id)})
+        mutation_logs_filter.assert_not_called()
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header("Retry-After"))
+        self.assertEquals(response.json()["status"], MutationLog.SUCCESS)
+
+    def test_by_client_mutation_id(self):
+        response = self.client.get(self.url, {"client_mutation_id": "mutation-status-test"})
+        self.assertEquals(response.json()["id"], str(self.mutation_log.id))
+
+    def test_other_user(self):
+        other = create_test_interactive_user(username="MutationStatusOther")
+        self.client.force_authenticate(user=other)
+        response = self.client.get(self.url, {"id": str(self.mutation_log.id)})
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
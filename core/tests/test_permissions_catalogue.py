@@ -0,0 +1,37 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from core import schema
+from core.models import ModuleConfiguration
+from core.schema import get_modules_permissions_catalogue
+
+
+class ModulesPermissionsCatalogueTestCase(TestCase):
+    def setUp(self):
+        schema._modules_permissions_catalogue = None
+        self.addCleanup(setattr, schema, "_modules_permissions_catalogue", None)
+
+    def test_rebuilt_when_generation_changes(self):
+        with mock.patch.object(ModuleConfiguration, "get_registry_generation", side_effect=[1, 1, 2]), \
+                mock.patch.object(schema, "_build_modules_permissions_catalogue",
+                                  side_effect=lambda: object()) as build:
+            first = get_modules_permissions_catalogue()
+            self.assertIs(get_modules_permissions_catalogue(), first)
+            self.assertIsNot(get_modules_permissions_catalogue(), first)
+        self.assertEquals(build.call_count, 2)
+
+    def test_not_kept_while_uncommitted(self):
+        # the generation is None while a module configuration change isn't committed
+        with mock.patch.object(ModuleConfiguration, "get_registry_generation", return_value=None), \
+                mock.patch.object(schema, "_build_modules_permissions_catalogue",
+                                  side_effect=lambda: object()) as build:
+            get_modules_permissions_catalogue()
+            get_modules_permissions_catalogue()
+        self.assertEquals(build.call_count, 2)
+        self.assertIsNone(schema._modules_permissions_catalogue)
+
+    def test_built_from_the_configurations(self):
+        catalogue = get_modules_permissions_catalogue()
+        core_permissions = next(module for module in catalogue.module_perms_list if module.module_name == "core")
+        self.assertIn("gql_query_users_perms", {permission.perms_name for permission in core_permissions.permissions})
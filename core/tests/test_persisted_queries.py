@@ -0,0 +1,75 @@
+from unittest import mock
+
+import graphene
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory
+
+from core.apps import CoreConfig
+from core.gql.persisted_queries import (
+    OpenIMISGraphQLView, PersistedQueryBackend, PersistedQueryError, get_document_hash, get_persisted_query
+)
+
+
+class _Query(graphene.ObjectType):
+    hello = graphene.String()
+
+    def resolve_hello(self, info):
+        return "world"
+
+
+class PersistedQueriesTestCase(TestCase):
+    schema = graphene.Schema(query=_Query)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_document_parsed_once(self):
+        backend = PersistedQueryBackend(cache_size=10)
+        document = backend.document_from_string(self.schema, "{ hello }")
+        self.assertIs(backend.document_from_string(self.schema, "{ hello }"), document)
+        self.assertEquals(document.execute().data, {"hello": "world"})
+
+    def test_invalid_document(self):
+        backend = PersistedQueryBackend(cache_size=10)
+        result = backend.document_from_string(self.schema, "{ unknown }").execute()
+        self.assertTrue(result.invalid)
+        self.assertEquals(len(result.errors), 1)
+
+    def test_automatic_persisted_query(self):
+        query = "{ hello }"
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": get_document_hash(query)}}
+        request = RequestFactory().post("/api/graphql")
+        request.user = mock.Mock(is_authenticated=True)
+        with self.assertRaises(PersistedQueryError):
+            OpenIMISGraphQLView.resolve_persisted_query(request, {"extensions": extensions}, None)
+        self.assertEquals(
+            OpenIMISGraphQLView.resolve_persisted_query(request, {"extensions": extensions}, query), query)
+        self.assertEquals(
+            OpenIMISGraphQLView.resolve_persisted_query(request, {"extensions": extensions}, None), query)
+
+    def test_hash_mismatch(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": get_document_hash("{ other }")}}
+        request = RequestFactory().post("/api/graphql")
+        with self.assertRaises(PersistedQueryError):
+            OpenIMISGraphQLView.resolve_persisted_query(request, {"extensions": extensions}, "{ hello }")
+
+    def test_anonymous_queries_are_not_persisted(self):
+        query = "{ anonymous: hello }"
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": get_document_hash(query)}}
+        request = RequestFactory().post("/api/graphql")
+        request.user = AnonymousUser()
+        # executed, but not registered
+        self.assertEquals(
+            OpenIMISGraphQLView.resolve_persisted_query(request, {"extensions": extensions}, query), query)
+        self.assertIsNone(get_persisted_query(get_document_hash(query)))
+
+    def test_long_queries_are_not_persisted(self):
+        query = "{ hello hello }"
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": get_document_hash(query)}}
+        request = RequestFactory().post("/api/graphql")
+        request.user = mock.Mock(is_authenticated=True)
+        with mock.patch.object(CoreConfig, "gql_persisted_query_max_length", 10):
+            self.assertEquals(
+                OpenIMISGraphQLView.resolve_persisted_query(request, {"extensions": extensions}, query), query)
+        self.assertIsNone(get_persisted_query(get_document_hash(query)))
@@ -0,0 +1,97 @@
+from unittest import mock
+
+import graphene
+from django.test import TestCase
+
+from core.apps import CoreConfig
+from core.gql.dataloaders import RequestDataLoader, get_loader
+from core.gql.profiling import ProfilingMiddleware, profiler
+from core.models import MutationLog
+
+
+class _CountLoader(RequestDataLoader):
+    def load_batch(self, keys):
+        count = MutationLog.objects.count()
+        return [count for _ in keys]
+
+
+class _Item(graphene.ObjectType):
+    id = graphene.Int()
+    count = graphene.Int()
+
+    def resolve_count(self, info):
+        return get_loader(info, _CountLoader).load(self.id)
+
+
+class _Query(graphene.ObjectType):
+    items = graphene.List(_Item)
+
+    def resolve_items(self, info):
+        return [_Item(id=i) for i in range(3)]
+
+
+class _Context:
+    def __init__(self, user=None, profile_header=None):
+        self.META = {"HTTP_X_OPENIMIS_PROFILE": profile_header} if profile_header else {}
+        if user is not None:
+            self.user = user
+
+
+class ProfilingMiddlewareTestCase(TestCase):
+    schema = graphene.Schema(query=_Query)
+
+    def setUp(self):
+        profiler.reset()
+
+    def test_promise_fields_and_loader_queries(self):
+        with mock.patch.object(CoreConfig, "gql_profiling_sample_rate", 1):
+            result = self.schema.execute("query Items { items { count } }", context_value=_Context(),
+                                         middleware=[ProfilingMiddleware()])
+        self.assertIsNone(result.errors)
+        self.assertEquals([item["count"] for item in result.data["items"]], [0, 0, 0])
+
+        operation = profiler.snapshot()["Items"]
+        self.assertEquals(operation["requests"], 1)
+        fields = operation["fields"]
+        self.assertEquals(fields["_Item.count"]["calls"], 3)
+        self.assertEquals(fields["_Item.count"]["sql_count"], 0)
+        # the batch runs once, outside of the resolvers, and its query is reported under the loader
+        self.assertEquals(fields["_Item.count [_CountLoader]"]["calls"], 1)
+        self.assertEquals(fields["_Item.count [_CountLoader]"]["sql_count"], 1)
+
+    def test_not_profiled(self):
+        with mock.patch.object(CoreConfig, "gql_profiling_sample_rate", 0):
+            result = self.schema.execute("query Items { items { count } }", context_value=_Context(),
+                                         middleware=[ProfilingMiddleware()])
+        self.assertIsNone(result.errors)
+        self.assertEquals(profiler.snapshot(), {})
+
+    def execute(self, query, context, sample_rate=0):
+        with mock.patch.object(CoreConfig, "gql_profiling_sample_rate", sample_rate), \
+                mock.patch.object(CoreConfig, "gql_profiling_header", "X-OpenIMIS-Profile"):
+            result = self.schema.execute(query, context_value=context, middleware=[ProfilingMiddleware()])
+        self.assertIsNone(result.errors)
+
+    def test_header_only_for_superusers(self):
+        query = "query Items { items { id } }"
+        self.execute(query, _Context(profile_header="1"))
+        user = mock.Mock(is_authenticated=True, is_superuser=False)
+        self.execute(query, _Context(user=user, profile_header="1"))
+        self.assertEquals(profiler.snapshot(), {})
+
+        user.is_superuser = True
+        self.execute(query, _Context(user=user, profile_header="1"))
+        self.assertEquals(profiler.snapshot()["Items"]["requests"], 1)
+
+    def test_fields_keyed_on_type(self):
+        self.execute("query Items { first: items { id } second: items { renamed: id } }", _Context(), 1)
+        fields = profiler.snapshot()["Items"]["fields"]
+        self.assertEquals(set(fields), {"_Query.items", "_Item.id"})
+        self.assertEquals(fields["_Item.id"]["calls"], 6)
+
+    def test_operations_capped(self):
+        with mock.patch.object(CoreConfig, "gql_profiling_max_operations", 2):
+            for name in ("First", "Second", "First", "Third"):
+                self.execute("query %s { items { id } }" % name, _Context(), 1)
+        # the least recently profiled operation is dropped
+        self.assertEquals(set(profiler.snapshot()), {"First", "Third"})
@@ -0,0 +1,70 @@
+from unittest import mock
+
+import graphene
+from django.test import TestCase
+
+from core.apps import CoreConfig
+from core.gql.query_cost import QueryCostMiddleware
+
+
+class _Item(graphene.ObjectType):
+    name = graphene.String()
+    children = graphene.List(lambda: _Item)
+    cost_weights = {"children": 3}
+
+    def resolve_children(self, info):
+        return []
+
+
+class _ItemConnection(graphene.relay.Connection):
+    class Meta:
+        node = _Item
+
+
+class _Query(graphene.ObjectType):
+    items = graphene.List(_Item)
+    items_connection = graphene.relay.ConnectionField(_ItemConnection)
+
+    def resolve_items(self, info):
+        return [_Item(name=str(i)) for i in range(2)]
+
+    def resolve_items_connection(self, info, **kwargs):
+        return [_Item(name=str(i)) for i in range(2)]
+
+
+class _Context:
+    pass
+
+
+class QueryCostMiddlewareTestCase(TestCase):
+    schema = graphene.Schema(query=_Query)
+    # 1 (items) + 10 rows * 3 (children, the names are scalars)
+    list_query = "query Items { items { name children { name } } }"
+    # 1 (itemsConnection) + 5 rows * (1 (edges) + 1 (node) + 3 (children))
+    connection_query = "query Connection { itemsConnection(first: 5) { edges { node { name children { name } } } } }"
+
+    def execute(self, query, budget, mode="reject"):
+        with mock.patch.object(CoreConfig, "gql_query_cost_budget", budget), \
+                mock.patch.object(CoreConfig, "gql_query_cost_list_size", 10), \
+                mock.patch.object(CoreConfig, "gql_query_cost_mode", mode):
+            return self.schema.execute(query, context_value=_Context(), middleware=[QueryCostMiddleware()])
+
+    def test_over_budget_rejected(self):
+        result = self.execute(self.list_query, 30)
+        self.assertIsNone(result.data["items"] if result.data else None)
+        self.assertEquals(len(result.errors), 1)
+        self.assertIn("cost 31 exceeds the budget of 30", str(result.errors[0]))
+
+    def test_under_budget(self):
+        result = self.execute(self.list_query, 31)
+        self.assertIsNone(result.errors)
+        self.assertEquals([item["name"] for item in result.data["items"]], ["0", "1"])
+
+    def test_connection_rows(self):
+        self.assertIsNone(self.execute(self.connection_query, 26).errors)
+        self.assertIn("cost 26", str(self.execute(self.connection_query, 25).errors[0]))
+
+    def test_over_budget_logged(self):
+        with self.assertLogs("core.gql.query_cost", "WARNING"):
+            result = self.execute(self.list_query, 30, mode="log")
+        self.assertIsNone(result.errors)
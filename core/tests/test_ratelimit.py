@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.test import TestCase, RequestFactory, override_settings
+
+from core.ratelimit import LocalRateLimiter, is_request_ratelimited, _resolve_key, _split_rate
+
+
+def _group_key(group, request):
+    return group
+
+
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_split_rate(self):
+        self.assertEquals(_split_rate("100/m"), (100, 60))
+        self.assertEquals(_split_rate("5/10s"), (5, 10))
+        self.assertEquals(_split_rate("7/h"), (7, 3600))
+        self.assertEquals(_split_rate("invalid"), (None, None))
+
+    @override_settings(RATELIMIT_LOCAL_SYNC_INTERVAL=3600, RATELIMIT_LOCAL_SYNC_BATCH=1000)
+    def test_local_limit(self):
+        limiter = LocalRateLimiter()
+        results = [limiter.is_limited("test", "127.0.0.1", 3, 60) for _ in range(5)]
+        self.assertEquals(results, [False, False, False, True, True])
+
+    @override_settings(RATELIMIT_LOCAL_SYNC_INTERVAL=3600, RATELIMIT_LOCAL_SYNC_BATCH=1000)
+    def test_limit_shared_between_workers(self):
+        first, second = LocalRateLimiter(), LocalRateLimiter()
+        self.assertFalse(first.is_limited("test", "127.0.0.1", 2, 60))
+        self.assertFalse(second.is_limited("test", "127.0.0.1", 2, 60))
+        self.assertTrue(first.is_limited("test", "127.0.0.1", 2, 60))
+
+    def test_request_counted_once(self):
+        request = RequestFactory().post("/api/graphql")
+        self.assertFalse(is_request_ratelimited(request, "test", "ip", "1/m"))
+        self.assertFalse(is_request_ratelimited(request, "test", "ip", "1/m"))
+        other_request = RequestFactory().post("/api/graphql")
+        self.assertTrue(is_request_ratelimited(other_request, "test", "ip", "1/m"))
+
+    @override_settings(RATELIMIT_LOCAL_SYNC_INTERVAL=3600, RATELIMIT_LOCAL_SYNC_BATCH=1000)
+    def test_sync_batched(self):
+        other, limiter = LocalRateLimiter(), LocalRateLimiter()
+        other.is_limited("test", "127.0.0.1", 100, 60)
+        for ip in ("127.0.0.1", "127.0.0.2", "127.0.0.3"):
+            limiter.is_limited("test", ip, 100, 60)
+        shared_cache = caches["default"]
+        with mock.patch.object(shared_cache, "get_many", wraps=shared_cache.get_many) as get_many, \
+                mock.patch.object(shared_cache, "set_many", wraps=shared_cache.set_many) as set_many, \
+                mock.patch.object(shared_cache, "incr") as incr, \
+                mock.patch.object(shared_cache, "add") as add:
+            limiter._last_sync = 0
+            self.assertFalse(limiter.is_limited("test", "127.0.0.4", 100, 60))
+        # the counts of all the keys, and of the other worker, are synced in one pass
+        get_many.assert_called_once()
+        set_many.assert_called_once()
+        self.assertEquals(len(set_many.call_args[0][0]), 3)
+        incr.assert_not_called()
+        add.assert_not_called()
+        self.assertEquals(sum(counter.others for counter in limiter._counters.values()), 1)
+
+    def test_resolve_key(self):
+        request = RequestFactory().post("/api/graphql", REMOTE_ADDR="2001:db8::1", HTTP_X_CLIENT="client")
+        self.assertEquals(_resolve_key(request, "test", "ip"), "2001:db8::")
+        self.assertEquals(_resolve_key(request, "test", "header:x-client"), "client")
+        self.assertEquals(_resolve_key(request, "test", _group_key), "test")
+        self.assertEquals(_resolve_key(request, "test", "core.tests.test_ratelimit._group_key"), "test")
+        self.assertIsNone(_resolve_key(request, "test", "get:client"))
+        with override_settings(RATELIMIT_IP_META_KEY="HTTP_X_FORWARDED_FOR"):
+            self.assertIsNone(_resolve_key(request, "test", "ip"))
@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import TestCase
+
+from core import service_signals
+from core.apps import CoreConfig
+from core.service_signals import RECEIVER_TIMINGS, ServiceSignalBindType, RegisteredServiceSignal
+from core.signals import REGISTERED_SERVICE_SIGNALS, bind_service_signal, register_service_signal
+
+
+class _Service:
+    @register_service_signal("core_test_service_signals.skipped")
+    def skipped(self, value):
+        return value
+
+    @register_service_signal("core_test_service_signals.non_blocking")
+    def non_blocking(self, value):
+        return value
+
+    @register_service_signal("core_test_service_signals.failing")
+    def failing(self, value):
+        return value
+
+    @register_service_signal("core_test_service_signals.timed")
+    def timed(self, value):
+        return value
+
+
+def _timed_receiver(sender, **kwargs):
+    return "timed"
+
+
+class ServiceSignalsTestCase(TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        patcher = mock.patch.object(service_signals, "_get_executor", return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_skipped_without_receivers(self):
+        with mock.patch.object(RegisteredServiceSignal, "send_signal_before") as send_before, \
+                mock.patch.object(RegisteredServiceSignal, "send_signal_after") as send_after:
+            self.assertEquals(_Service().skipped(1), 1)
+        send_before.assert_not_called()
+        send_after.assert_not_called()
+        # results of a signal never sent are empty, as they would be without receivers
+        self.assertEquals(REGISTERED_SERVICE_SIGNALS["core_test_service_signals.skipped"].signal_results,
+                          {"before": [], "after": []})
+
+    def test_non_blocking_dispatched_on_commit(self):
+        called = threading.Event()
+        caller_thread = threading.current_thread()
+        threads = []
+
+        def receiver(sender, **kwargs):
+            threads.append(threading.current_thread())
+            called.set()
+            return "non blocking"
+
+        bind_service_signal("core_test_service_signals.non_blocking", receiver, ServiceSignalBindType.AFTER,
+                            blocking=False)
+        with mock.patch.object(service_signals.connections, "close_all") as close_all:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEquals(_Service().non_blocking(1), 1)
+                self.assertFalse(called.is_set())
+            self.executor.shutdown(wait=True)
+        self.assertTrue(called.is_set())
+        self.assertIsNot(threads[0], caller_thread)
+        close_all.assert_called_once()
+        # not part of the results of the signal
+        results = REGISTERED_SERVICE_SIGNALS["core_test_service_signals.non_blocking"].signal_results["after"]
+        self.assertEquals([result for _, result in results], [None])
+
+    def test_non_blocking_failures_logged(self):
+        def receiver(sender, **kwargs):
+            raise ValueError("receiver failure")
+
+        bind_service_signal("core_test_service_signals.failing", receiver, ServiceSignalBindType.AFTER,
+                            blocking=False)
+        with self.assertLogs(service_signals.logger, "ERROR") as logs, \
+                mock.patch.object(service_signals.connections, "close_all", side_effect=RuntimeError("close")):
+            with self.captureOnCommitCallbacks(execute=True):
+                _Service().failing(1)
+            self.executor.shutdown(wait=True)
+        # the failure of the receiver, then of the future itself
+        self.assertEquals(len(logs.records), 2)
+
+    def test_receiver_timings(self):
+        bind_service_signal("core_test_service_signals.timed", _timed_receiver, ServiceSignalBindType.BEFORE)
+        with mock.patch.object(CoreConfig, "service_signal_timing", True):
+            _Service().timed(1)
+            _Service().timed(2)
+        calls, total, longest = RECEIVER_TIMINGS[(
+            "core_test_service_signals.timed", "before", f"{__name__}._timed_receiver")]
+        self.assertEquals(calls, 2)
+        self.assertGreaterEqual(total, longest)
@@ -510,3 +510,60 @@ class UserServicesTest(TestCase):
             UserRole.objects.filter(user_id=core_user.id).delete()
         core_user.delete()
         i_user.delete()
+
+
+class UserSearchServicesTest(TestCase):
+    def test_update_user_search_index(self):
+        from core.models import UserSearchIndex
+        from core.services.userSearchServices import update_user_search_index
+        from core.test_helpers import create_test_interactive_user
+
+        user = create_test_interactive_user(username="tstsearch1", roles=[3, 7],
+                                            custom_props={"email": "Search1@Test.org", "phone": "0123"})
+        update_user_search_index([user.id])
+
+        index = UserSearchIndex.objects.get(user=user)
+        self.assertEquals(index.username, "tstsearch1")
+        self.assertEquals(index.last_names, "testlastname")
+        self.assertEquals(index.emails, "|search1@test.org|")
+        self.assertTrue(index.is_interactive)
+        self.assertFalse(index.is_officer)
+        self.assertEquals(index.role_ids, "|3|7|")
+
+        found = UserSearchIndex.objects.filter(
+            UserSearchIndex.has_token("emails", "search1@test.org"),
+            UserSearchIndex.has_any_token("role_ids", [7, 12]),
+        )
+        self.assertEquals(list(found.values_list("user_id", flat=True)), [user.id])
+
+    def test_user_search_index_upsert(self):
+        from core.models import UserSearchIndex
+        from core.services.userSearchServices import update_user_search_index
+        from core.test_helpers import create_test_interactive_user
+
+        user = create_test_interactive_user(username="tstsearch2", custom_props={"email": "before@test.org"})
+        update_user_search_index([user.id])
+        user.i_user.email = "after@test.org"
+        user.i_user.save()
+        update_user_search_index([user.id])
+        self.assertEquals(UserSearchIndex.objects.get(user=user).emails, "|after@test.org|")
+
+    def test_user_search_index_maintained_on_commit(self):
+        from django.db import transaction
+        from core.models import UserSearchIndex
+        from core.test_helpers import create_test_interactive_user
+
+        # maintained even while user_search_index_enabled is off
+        with self.captureOnCommitCallbacks(execute=True):
+            user = create_test_interactive_user(username="tstsearch3")
+        self.assertTrue(UserSearchIndex.objects.filter(user=user).exists())
+
+        # the updates scheduled by a rolled back transaction are dropped
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    create_test_interactive_user(username="tstsearch4")
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.assertEquals(callbacks, [])
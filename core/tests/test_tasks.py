@@ -0,0 +1,77 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase
+
+from core.models import MutationLog
+from core.schema import OpenIMISMutation
+from core.tasks import enqueue_mutation, get_mutation_class, openimis_mutation_async, openimis_mutations_async, \
+    register_mutation_class
+
+
+class _TaskTestMutation(OpenIMISMutation):
+    _mutation_module = "core"
+    _mutation_class = "TaskTestMutation"
+
+    @classmethod
+    def async_mutate(cls, user, **data):
+        if data.get("client_mutation_label") == "raise":
+            raise ValueError("mutation failure")
+        return None
+
+
+class _Rollback(Exception):
+    pass
+
+
+class EnqueueMutationTestCase(TestCase):
+    def test_sent_together_on_commit(self):
+        with mock.patch.object(openimis_mutations_async, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                enqueue_mutation("1", "core", "_TaskTestMutation")
+                enqueue_mutation("2", "core", "_TaskTestMutation")
+                apply_async.assert_not_called()
+        apply_async.assert_called_once()
+        self.assertEquals(apply_async.call_args[1]["args"], ([
+            ("1", "core", "_TaskTestMutation"), ("2", "core", "_TaskTestMutation")],))
+
+    def test_rolled_back_mutations_are_not_sent(self):
+        with mock.patch.object(openimis_mutation_async, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        enqueue_mutation("1", "core", "_TaskTestMutation")
+                        raise _Rollback()
+                except _Rollback:
+                    pass
+                enqueue_mutation("2", "core", "_TaskTestMutation")
+        apply_async.assert_called_once()
+        self.assertEquals(apply_async.call_args[1]["args"], ("2", "core", "_TaskTestMutation"))
+
+
+class MutationsTaskTestCase(TestCase):
+    def test_failures_are_marked(self):
+        failing = MutationLog.objects.create(json_content='{"client_mutation_label": "raise"}')
+        successful = MutationLog.objects.create(json_content='{"client_mutation_label": "ok"}')
+        with self.assertRaises(ValueError):
+            openimis_mutations_async([(str(failing.id), "core", "_TaskTestMutation"),
+                                      (str(successful.id), "core", "_TaskTestMutation")])
+        failing.refresh_from_db()
+        successful.refresh_from_db()
+        self.assertEquals(failing.status, MutationLog.ERROR)
+        self.assertEquals(successful.status, MutationLog.SUCCESS)
+
+
+class MutationRegistryTestCase(TestCase):
+    def test_inherited_module_is_not_registered(self):
+        class _TaskTestMutationSubclass(_TaskTestMutation):
+            pass
+
+        with self.assertRaises(AttributeError):
+            get_mutation_class("core", "_TaskTestMutationSubclass")
+
+    def test_duplicate_is_ignored(self):
+        duplicate = type("_TaskTestMutation", (), {"__module__": "other.schema"})
+        with self.assertLogs("core.tasks", level="ERROR"):
+            register_mutation_class("core", duplicate)
+        self.assertIs(get_mutation_class("core", "_TaskTestMutation"), _TaskTestMutation)
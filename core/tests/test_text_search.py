@@ -0,0 +1,63 @@
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from core import text_search
+from core.apps import CoreConfig
+from core.models import Role
+from core.text_search import configured_text_search_indexes, get_text_search_backend
+
+
+class TextSearchLookupsTestCase(TestCase):
+    def test_trgm_icontains(self):
+        sql, params = Role.objects.filter(name__trgm_icontains="50%_adm").query.sql_with_params()
+        self.assertIn("ILIKE", sql)
+        self.assertNotIn("UPPER", sql)
+        # the wildcards of the searched text are escaped
+        self.assertEquals(params[-1], "%%%s%%" % connection.ops.prep_for_like_query("50%_adm"))
+
+    def test_trgm_istartswith(self):
+        sql, params = Role.objects.filter(name__trgm_istartswith="adm").query.sql_with_params()
+        self.assertIn("ILIKE", sql)
+        self.assertEquals(params[-1], "adm%")
+
+    def test_ft_contains(self):
+        sql, params = Role.objects.filter(name__ft_contains='claim "adm').query.sql_with_params()
+        self.assertIn("CONTAINS(", sql)
+        # every word is matched by prefix
+        self.assertEquals(params[-1], '"claim*" AND "adm*"')
+
+    @skipUnless(connection.vendor == "postgresql", "ILIKE is PostgreSQL specific")
+    def test_trgm_lookups_match_like(self):
+        Role.objects.create(name="TextSearchAdministrator", is_system=0, is_blocked=False, audit_user_id=-1)
+        self.assertEquals(set(Role.objects.filter(name__trgm_icontains="searchadmin")),
+                          set(Role.objects.filter(name__icontains="searchadmin")))
+        self.assertEquals(set(Role.objects.filter(name__trgm_istartswith="textsearch")),
+                          set(Role.objects.filter(name__istartswith="textsearch")))
+
+
+class TextSearchBackendTestCase(TestCase):
+    def setUp(self):
+        text_search._backend = None
+        self.addCleanup(setattr, text_search, "_backend", None)
+
+    def test_backend_resolved_once(self):
+        with mock.patch.object(CoreConfig, "text_search_backend", "like"):
+            backend = get_text_search_backend()
+        with mock.patch.object(CoreConfig, "text_search_backend", "trigram"):
+            self.assertIs(get_text_search_backend(), backend)
+        self.assertEquals(backend.name, "like")
+
+    def test_configured_indexes(self):
+        postgresql, microsoft = mock.Mock(vendor="postgresql"), mock.Mock(vendor="microsoft")
+        expected = {
+            "auto": ("trigram", None),
+            "trigram": ("trigram", None),
+            "fulltext": (None, "fulltext"),
+            "like": (None, None),
+        }
+        for backend, indexes in expected.items():
+            with mock.patch.object(CoreConfig, "text_search_backend", backend):
+                self.assertEquals((configured_text_search_indexes(postgresql),
+                                   configured_text_search_indexes(microsoft)), indexes)
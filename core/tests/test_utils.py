@@ -4,7 +4,7 @@ from django.db import connections
 from django.test.runner import DiscoverRunner
 from django.test.utils import get_unique_databases_and_mirrors
 
-from core.utils import full_class_name, comparable
+from core.utils import full_class_name, comparable, LRUCache
 
 
 class ComparableTest(TestCase):
@@ -41,3 +41,24 @@ class UtilsTestCase(TestCase):
 
         self.assertEquals(full_class_name(
             1), 'int')
+
+
+class LRUCacheTestCase(TestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEquals(lru.get('a'), 1)
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEquals(lru.get('a'), 1)
+        self.assertEquals(lru.get('c'), 3)
+
+    def test_expired_entries_are_dropped(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2, ttl=-1)
+        self.assertEquals(lru.get('a'), 1)
+        self.assertNotIn('b', lru)
+        lru.delete('a')
+        self.assertEquals(lru.get('a', 'default'), 'default')
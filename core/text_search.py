@@ -0,0 +1,173 @@
+"""
+Pluggable backend for the free text searches (the "str" argument of the GraphQL queries).
+Leading wildcard LIKE can't use B-tree indexes, the backends use the text indexes of the database instead:
+* trigram: ILIKE on PostgreSQL, served by the pg_trgm GIN indexes (same results as icontains)
+* fulltext: CONTAINS on SQL Server full-text indexes. Words are matched by prefix, which differs from a substring
+  search ("ith" doesn't find "Smith"), hence it has to be enabled explicitly
+* like: plain icontains/istartswith, used when none of the above is available
+The backend is selected by the text_search_backend configuration ("auto", "trigram", "fulltext" or "like") the
+first time it is needed and then kept for the life of the process: changing the configuration requires a restart.
+The 0032_text_search_indexes migration creates the trigram indexes on PostgreSQL whatever the configuration, the
+createtextsearchindexes command creates the indexes of the configured backend (the full-text ones on SQL Server).
+"""
+import logging
+from functools import reduce
+
+from django.db import connection
+from django.db.models import Q
+
+from core.apps import CoreConfig
+
+logger = logging.getLogger(__name__)
+
+# columns searched through text_search_filter
+TEXT_SEARCH_COLUMNS = [
+    ("tblUsers", ["LastName", "OtherNames"]),
+    ("tblOfficer", ["Code", "LastName", "OtherNames", "EmailId"]),
+    ("tblClaimAdmin", ["LastName", "OtherNames"]),
+    ("tblRole", ["RoleName"]),
+    ("core_User", ["username"]),
+    ("core_UserSearchIndex", ["username", "last_names", "other_names"]),
+]
+FULLTEXT_CATALOG = "openimis_text_search"
+
+
+class LikeTextSearchBackend:
+    name = "like"
+
+    def filter(self, field, text, prefix=False):
+        return Q(**{"%s__%s" % (field, "istartswith" if prefix else "icontains"): text})
+
+
+class TrigramTextSearchBackend(LikeTextSearchBackend):
+    name = "trigram"
+
+    def filter(self, field, text, prefix=False):
+        return Q(**{"%s__%s" % (field, "trgm_istartswith" if prefix else "trgm_icontains"): text})
+
+
+class FullTextSearchBackend(LikeTextSearchBackend):
+    name = "fulltext"
+
+    def filter(self, field, text, prefix=False):
+        # prefix searches are fine with the regular indexes
+        if prefix or not str(text).replace('"', '').split():
+            return super().filter(field, text, prefix)
+        return Q(**{"%s__ft_contains" % field: text})
+
+
+_backend = None
+
+
+def _has_pg_trgm():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            return cursor.fetchone() is not None
+    except Exception:
+        logger.warning("Could not check the pg_trgm extension", exc_info=True)
+        return False
+
+
+def get_text_search_backend():
+    """
+    The backend of the text_search_backend configuration, resolved once per process
+    """
+    global _backend
+    if _backend is None:
+        configured = CoreConfig.text_search_backend
+        if configured in ("auto", "trigram") and connection.vendor == "postgresql" and _has_pg_trgm():
+            _backend = TrigramTextSearchBackend()
+        elif configured == "fulltext" and connection.vendor == "microsoft":
+            _backend = FullTextSearchBackend()
+        else:
+            if configured not in ("auto", "like"):
+                logger.warning("Text search backend %s not available, falling back to like", configured)
+            _backend = LikeTextSearchBackend()
+    return _backend
+
+
+def text_search_filter(fields, text, prefix=False):
+    """
+    Q matching the rows where any of the fields contains (or starts with, if prefix) the text
+    """
+    backend = get_text_search_backend()
+    return reduce(lambda a, b: a | b, [backend.filter(field, text, prefix) for field in fields])
+
+
+def configured_text_search_indexes(db_connection=connection):
+    """
+    The kind of indexes ("trigram" or "fulltext") used by the configured backend on this database, None if none
+    """
+    configured = CoreConfig.text_search_backend
+    if db_connection.vendor == "postgresql" and configured in ("auto", "trigram"):
+        return "trigram"
+    if db_connection.vendor == "microsoft" and configured == "fulltext":
+        return "fulltext"
+    return None
+
+
+def _existing_columns(db_connection, cursor):
+    tables = set(db_connection.introspection.table_names(cursor))
+    for table, columns in TEXT_SEARCH_COLUMNS:
+        if table not in tables:
+            continue
+        table_columns = {column.name for column in db_connection.introspection.get_table_description(cursor, table)}
+        columns = [column for column in columns if column in table_columns]
+        if columns:
+            yield table, columns
+
+
+def create_text_search_indexes(db_connection=connection):
+    """
+    Creates the indexes used by the configured backend on the searched columns (if they don't exist yet).
+    :return: the kind of indexes created, None if the backend doesn't use any or they are not available
+    """
+    kind = configured_text_search_indexes(db_connection)
+    with db_connection.cursor() as cursor:
+        if kind == "trigram":
+            try:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            except Exception as exc:
+                logger.warning("pg_trgm extension not available, text search indexes not created: %s", exc)
+                return None
+            for table, columns in _existing_columns(db_connection, cursor):
+                for column in columns:
+                    cursor.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" '
+                                   f'ON "{table}" USING gin ("{column}" gin_trgm_ops)')
+        elif kind == "fulltext":
+            cursor.execute("SELECT FULLTEXTSERVICEPROPERTY('IsFullTextInstalled')")
+            if cursor.fetchone()[0] != 1:
+                logger.warning("Full-text search not installed, text search indexes not created")
+                return None
+            cursor.execute(f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{FULLTEXT_CATALOG}') "
+                           f"CREATE FULLTEXT CATALOG {FULLTEXT_CATALOG}")
+            for table, columns in _existing_columns(db_connection, cursor):
+                cursor.execute("SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID(%s)", [table])
+                if cursor.fetchone():
+                    continue
+                cursor.execute("SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(%s) AND is_primary_key = 1",
+                               [table])
+                key_index = cursor.fetchone()
+                if not key_index:
+                    logger.warning("No primary key on %s, no full-text index created", table)
+                    continue
+                column_list = ", ".join(f"[{column}]" for column in columns)
+                cursor.execute(f"CREATE FULLTEXT INDEX ON [{table}] ({column_list}) KEY INDEX [{key_index[0]}] "
+                               f"ON {FULLTEXT_CATALOG} WITH CHANGE_TRACKING AUTO")
+    return kind
+
+
+def drop_text_search_indexes(db_connection=connection):
+    """
+    Drops the indexes created by create_text_search_indexes, whichever backend is configured
+    """
+    with db_connection.cursor() as cursor:
+        if db_connection.vendor == "postgresql":
+            for table, columns in TEXT_SEARCH_COLUMNS:
+                for column in columns:
+                    cursor.execute(f'DROP INDEX IF EXISTS "{table}_{column}_trgm"')
+        elif db_connection.vendor == "microsoft":
+            for table, _ in TEXT_SEARCH_COLUMNS:
+                cursor.execute(f"IF EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('{table}')) "
+                               f"DROP FULLTEXT INDEX ON [{table}]")
@@ -8,5 +8,7 @@ router.register(r'users', views.UserViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('fetch_export', views.fetch_export),
-    path('scheduled_jobs', views.get_scheduled_jobs)
+    path('scheduled_jobs', views.get_scheduled_jobs),
+    path('graphql_profile', views.get_graphql_profile),
+    path('mutation_status', views.get_mutation_status),
 ]
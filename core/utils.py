@@ -1,7 +1,10 @@
 import ast
 import json
 import logging
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from importlib import import_module
 from typing import Any, Dict, Type
 
@@ -12,8 +15,10 @@ from django.apps import AppConfig
 from django.conf import settings
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.files.storage import default_storage
+from django.db import transaction
 from django.db.models import Q
 from django.http import FileResponse
+from django.utils import translation
 from django.utils.translation import gettext as _
 from graphql import GraphQLError
 from password_validator import PasswordValidator
@@ -231,6 +236,86 @@ class ExtendedConnection(graphene.Connection):
         return len(self.edges)
 
 
+class LRUCache:
+    """
+    Bounded, thread-safe, in-process LRU cache with an optional time to live per entry.
+    It is meant to be used as a local tier in front of the shared Django cache for lookups done on every request,
+    so it should only hold small values that can be invalidated (or that expire) quickly.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _OnCommitBatch:
+    def __init__(self, key, flush):
+        self.key = key
+        self.flush = flush
+        self.items = []
+
+    def __call__(self):
+        self.flush(self.items)
+
+
+def on_commit_batch(key, items, flush, using=None):
+    """
+    Adds items to the batch `key` of the current transaction: flush(items) is called once, with the items added by all
+    the calls, when the transaction is committed (right away outside of a transaction).
+    The batch is an on_commit callback of the current savepoint, so Django discards it, along with its items, when
+    that savepoint or the transaction is rolled back.
+    """
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        savepoint_ids = set(connection.savepoint_ids)
+        # run_on_commit entries are (savepoint ids, callback[, robust])
+        for entry in reversed(connection.run_on_commit):
+            callback = entry[1]
+            if isinstance(callback, _OnCommitBatch) and callback.key == key and entry[0] == savepoint_ids:
+                callback.items.extend(items)
+                return
+    batch = _OnCommitBatch(key, flush)
+    batch.items.extend(items)
+    transaction.on_commit(batch, using=using)
+
+
 def block_update(update_dict, current_object, attribute_name, Ex=ValueError):
     if attribute_name in update_dict and update_dict["code"] != getattr(
             current_object, attribute_name
@@ -280,6 +365,15 @@ def get_first_or_default_language():
         return Language.objects.first()
 
 
+def activate_language(lang):
+    """
+    Activates the translation of a Language (or language code), unless it is already the active one
+    """
+    code = getattr(lang, "code", lang)
+    if translation.get_language() != code:
+        translation.activate(code)
+
+
 def insert_role_right_for_system(system_role, right_id, apps):
     RoleRight = apps.get_model("core", "RoleRight")
     Role = apps.get_model("core", "Role")
@@ -1,6 +1,7 @@
 import csv
 
-from django.http import Http404, StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_GET
 from isodate import strftime
 from rest_framework import viewsets, status
@@ -8,7 +9,10 @@ from rest_framework.decorators import action, api_view
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import User, ExportableQueryModel
+from .apps import CoreConfig
+from .models import User, ExportableQueryModel, MutationLog
+from .gql.profiling import profiler
+from .mutation_status import get_mutation_status as get_mutation_status_message
 from .scheduler import scheduler
 from .serializers import UserSerializer
 from django.utils.translation import gettext as _
@@ -66,3 +70,50 @@ def _serialize_job(job):
 @require_GET
 def get_scheduled_jobs(request):
     return Response([_serialize_job(job) for job in scheduler.get_jobs()])
+
+
+@api_view(['GET'])
+@require_GET
+def get_graphql_profile(request):
+    if not request.user.is_superuser:
+        raise PermissionDenied({"message": _("unauthorized")})
+    if request.query_params.get('format') == 'prometheus':
+        response = HttpResponse(profiler.to_prometheus(), content_type="text/plain; version=0.0.4")
+    else:
+        response = Response(profiler.snapshot())
+    if request.query_params.get('reset'):
+        profiler.reset()
+    return response
+
+
+@api_view(['GET'])
+@require_GET
+def get_mutation_status(request):
+    """
+    Status of a mutation of the user, without querying the database once it is processed. Returns right away: while
+    the mutation isn't processed yet, the response is a 202 with a Retry-After header
+    (CoreConfig.mutation_status_retry_after). To be notified without polling, use the MutationStatusConsumer websocket.
+    Parameters: id (of the MutationLog) or client_mutation_id
+    """
+    if not request.user.is_authenticated:
+        raise PermissionDenied({"message": _("unauthorized")})
+    mutation_log_id = request.query_params.get('id')
+    client_mutation_id = request.query_params.get('client_mutation_id')
+    if not mutation_log_id and client_mutation_id:
+        mutation_log_id = MutationLog.objects \
+            .filter(client_mutation_id=client_mutation_id, user_id=request.user.id) \
+            .order_by('-request_date_time') \
+            .values_list('id', flat=True) \
+            .first()
+    if not mutation_log_id:
+        raise Http404
+    try:
+        message = get_mutation_status_message(mutation_log_id, request.user.id)
+    except ValidationError:
+        raise Http404
+    if message is None:
+        raise Http404
+    if message["status"] == MutationLog.RECEIVED:
+        return Response(message, status=status.HTTP_202_ACCEPTED,
+                        headers={"Retry-After": str(CoreConfig.mutation_status_retry_after)})
+    return Response(message)
@@ -33,6 +33,10 @@ setup(
         'zxcvbn',
         'django-ratelimit',
     ],
+    extras_require={
+        # faster serialization of the mutations payload
+        'orjson': ['orjson'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Framework :: Django',